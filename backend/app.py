@@ -3,13 +3,37 @@ Flask后端服务 - AI日记生成API
 """
 
 import os
+import json
+import math
+import time
 import logging
-from flask import Flask, request, jsonify
+from datetime import date
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-from services.ai_service_factory import AIServiceFactory
+from services import http_pool
+from services.ai_service_factory import AUTO_PROVIDER, PROVIDER_ORDER, AIServiceFactory
+from services.rate_limiter import RateLimitExceeded
 from utils.prompt_builder import PromptBuilder
+from utils.response_cache import ResponseCache
+from utils.disk_cache import DiskCache
+from utils.semantic_cache import SemanticCache
+from utils.fan_out import fan_out
+from utils.job_queue import PRIORITIES as JOB_PRIORITIES, JobQueue, QueueFull
+from utils.post_processor import post_process, post_process_stream
+from utils.single_flight import SingleFlight
+from utils.similarity import filter_near_duplicates
+from utils.token_budget import provider_budget
+from utils.timing import current_timer, phase, server_timing
+from utils.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    HTTP_IN_FLIGHT,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    REGISTRY,
+    track_generation,
+)
 
 # 加载环境变量
 load_dotenv()
@@ -25,81 +49,922 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 初始化AI服务工厂
+# 初始化AI服务工厂（后台健康探测见start_background_tasks）
 ai_factory = AIServiceFactory()
 
+# 合并相同Prompt的进行中请求
+single_flight = SingleFlight()
+
+# 批量生成限制
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 50))
+BATCH_PROVIDER_CONCURRENCY = int(os.getenv('BATCH_PROVIDER_CONCURRENCY', 4))
+
+# 重新生成请求中原始记录和之前版本各自的最大字符数
+REGENERATE_MAX_CHARS = int(os.getenv('REGENERATE_MAX_CHARS', 20000))
+
+# 一次重新生成的最大候选数，以及判定候选近似重复的相似度阈值
+REGENERATE_MAX_VARIANTS = int(os.getenv('REGENERATE_MAX_VARIANTS', 4))
+VARIANT_SIMILARITY_THRESHOLD = float(os.getenv('VARIANT_SIMILARITY_THRESHOLD', 0.8))
+
+# 按风格配置的emoji_count限制生成结果中的emoji数量
+ENFORCE_EMOJI_COUNT = os.getenv('ENFORCE_EMOJI_COUNT', 'true').lower() == 'true'
+
+# 初始化响应缓存
+response_cache = ResponseCache(
+    max_size=int(os.getenv('RESPONSE_CACHE_SIZE', 256)),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 600))
+)
+
+# 多个工作进程共享的磁盘缓存，设置DISK_CACHE_PATH后启用
+disk_cache = DiskCache(
+    os.getenv('DISK_CACHE_PATH'),
+    max_bytes=int(float(os.getenv('DISK_CACHE_MAX_MB', 256)) * 1024 * 1024),
+    ttl=float(os.getenv('DISK_CACHE_TTL', 0))
+) if os.getenv('DISK_CACHE_PATH') else None
+
+# 近似输入的语义缓存（需要NumPy），设置SEMANTIC_CACHE_ENABLED=true后启用
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92)),
+    thresholds=SemanticCache.parse_thresholds(os.getenv('SEMANTIC_CACHE_THRESHOLDS', '')),
+    partition_size=int(os.getenv('SEMANTIC_CACHE_PARTITION_SIZE', 256)),
+    max_partitions=int(os.getenv('SEMANTIC_CACHE_MAX_PARTITIONS', 64)),
+    dim=int(os.getenv('SEMANTIC_CACHE_DIM', 512)),
+    ttl=float(os.getenv('SEMANTIC_CACHE_TTL', 3600)),
+    max_edit=int(os.getenv('SEMANTIC_CACHE_MAX_EDIT', 4))
+) if os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true' and SemanticCache.supported() else None
+
+# 语义缓存按user_id隔离；为true时未提供user_id的请求共用同一分区，可能命中其他用户的日记
+SEMANTIC_CACHE_SHARED = os.getenv('SEMANTIC_CACHE_SHARED', 'false').lower() == 'true'
+
+
+def _collect_cache_metrics():
+    """在输出监控指标时读取响应缓存和请求合并统计"""
+    cache = response_cache.stats()
+    flight = single_flight.stats()
+    metrics = [
+        ('diary_cache_entries', 'gauge', '响应缓存条目数', cache['size']),
+        ('diary_cache_hits_total', 'counter', '响应缓存命中次数', cache['hits']),
+        ('diary_cache_misses_total', 'counter', '响应缓存未命中次数', cache['misses']),
+        ('diary_cache_evictions_total', 'counter', '响应缓存容量淘汰次数', cache['evictions']),
+        ('diary_cache_expirations_total', 'counter', '响应缓存过期淘汰次数', cache['expirations']),
+        ('diary_single_flight_in_flight', 'gauge', '进行中的合并请求数', flight['in_flight']),
+        ('diary_single_flight_coalesced_total', 'counter', '被合并的重复请求数', flight['coalesced'])
+    ]
+    if disk_cache is not None:
+        disk = disk_cache.stats()
+        metrics += [
+            ('diary_disk_cache_entries', 'gauge', '磁盘缓存条目数', disk['entries']),
+            ('diary_disk_cache_bytes', 'gauge', '磁盘缓存压缩后的数据大小', disk['bytes']),
+            ('diary_disk_cache_file_bytes', 'gauge', '磁盘缓存文件占用大小', disk['file_bytes']),
+            ('diary_disk_cache_hits_total', 'counter', '磁盘缓存命中次数', disk['hits']),
+            ('diary_disk_cache_misses_total', 'counter', '磁盘缓存未命中次数', disk['misses']),
+            ('diary_disk_cache_evictions_total', 'counter', '磁盘缓存容量淘汰次数', disk['evictions'])
+        ]
+    if semantic_cache is not None:
+        semantic = semantic_cache.stats()
+        metrics += [
+            ('diary_semantic_cache_entries', 'gauge', '语义缓存条目数', semantic['entries']),
+            ('diary_semantic_cache_index_bytes', 'gauge', '语义缓存向量索引占用内存', semantic['index_bytes']),
+            ('diary_semantic_cache_hits_total', 'counter', '语义缓存命中次数', semantic['hits']),
+            ('diary_semantic_cache_misses_total', 'counter', '语义缓存未命中次数', semantic['misses']),
+            ('diary_semantic_cache_rejected_total', 'counter', '语义缓存逐字确认未通过次数', semantic['rejected']),
+            ('diary_semantic_cache_evictions_total', 'counter', '语义缓存容量淘汰次数', semantic['evictions']),
+            ('diary_semantic_cache_lookup_seconds_total', 'counter', '语义缓存查询累计耗时', semantic['lookup_seconds'])
+        ]
+    return metrics
+
+
+# 连接池统计中的累计值，按counter输出，其余为当前连接数
+HTTP_POOL_COUNTERS = {
+    'opened': '上游HTTP连接池累计新建的连接数',
+    'requests': '上游HTTP连接池累计发送的请求数'
+}
+
+
+def _collect_http_pool_metrics():
+    """在输出监控指标时读取上游连接池使用情况"""
+    metrics = []
+    for client, stats in http_pool.stats().items():
+        if client == 'config':
+            continue
+        for key, value in stats.items():
+            if key in HTTP_POOL_COUNTERS:
+                metric = (f'diary_upstream_pool_{key}_total', 'counter', HTTP_POOL_COUNTERS[key])
+            else:
+                metric = (f'diary_upstream_pool_{key}', 'gauge', f'上游HTTP连接池{key}')
+            metrics.append((*metric, value, {'client': client}))
+    return metrics
+
+
+def _collect_routing_metrics():
+    """在输出监控指标时读取 provider: "auto" 的路由统计"""
+    metrics = []
+    for provider, stats in ai_factory.get_routing_stats().items():
+        labels = {'provider': provider}
+        if stats['latency_ewma_ms'] is not None:
+            metrics.append((
+                'diary_routing_latency_ewma_seconds', 'gauge', '自动路由使用的延迟EWMA',
+                stats['latency_ewma_ms'] / 1000, labels
+            ))
+        metrics += [
+            ('diary_routing_error_rate_ewma', 'gauge', '自动路由使用的错误率EWMA', stats['error_rate_ewma'], labels),
+            ('diary_routing_selected_total', 'counter', '自动路由选择该提供商的次数', stats['routed'], labels),
+            ('diary_routing_explored_total', 'counter', '自动路由的探索选择次数', stats['explored'], labels)
+        ]
+    return metrics
+
+
+REGISTRY.register_collector(_collect_cache_metrics)
+REGISTRY.register_collector(_collect_http_pool_metrics)
+REGISTRY.register_collector(_collect_routing_metrics)
+
+
+def _request_route():
+    """监控指标使用的路由标签，使用路由规则而非实际路径以限制标签数量"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    route = _request_route()
+    HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    HTTP_LATENCY.labels(request.method, route).observe(
+        time.perf_counter() - g.get('request_started', time.perf_counter())
+    )
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(error):
+    HTTP_IN_FLIGHT.dec()
+
+
+def _providers_status():
+    """从健康探测快照读取各个AI提供商的可用性"""
+    return {
+        name: entry['available'] and entry['reachable'] is not False
+        for name, entry in ai_factory.get_health_snapshot().items()
+    }
+
+
+def _providers_list():
+    """从健康探测快照列出各个AI提供商的可用性、延迟和模型"""
+    providers = []
+    
+    for provider_name, entry in ai_factory.get_health_snapshot().items():
+        provider = {
+            'name': provider_name,
+            'available': entry['available'] and entry['reachable'] is not False,
+            'model': entry['model'],
+            'reachable': entry['reachable'],
+            'latency_ms': entry['latency_ms'],
+            'checked_at': entry['checked_at']
+        }
+        if entry['error']:
+            provider['error'] = entry['error']
+        if provider_name in ai_factory.get_available_providers():
+            provider['circuit'] = ai_factory.get_circuit_stats(provider_name)
+            provider['rate_limit'] = ai_factory.get_rate_limit_stats(provider_name)
+        providers.append(provider)
+    
+    return providers
+
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    providers_status = {}
-    
-    # 检查各个AI提供商的可用性
-    for provider in ['gemini', 'openai', 'claude']:
-        try:
-            service = ai_factory.get_service(provider)
-            providers_status[provider] = service.is_available()
-        except Exception as e:
-            logger.error(f"Error checking {provider}: {e}")
-            providers_status[provider] = False
-    
     return jsonify({
         'status': 'healthy',
         'version': '1.0.0',
-        'providers': providers_status
+        'providers': _providers_status()
     })
 
 
+def _request_provider(data, resolve=True):
+    """请求使用的提供商
+    
+    "auto" 在解析请求时即由路由器确定，同一请求的缓存键、Prompt预算和生成调用使用同一个提供商。
+    resolve为False时原样返回（如提交异步任务时只校验参数，执行时再选择）。
+    """
+    provider = str(data.get('provider') or os.getenv('DEFAULT_AI_PROVIDER', 'gemini')).lower()
+    return ai_factory.resolve_provider(provider) if resolve else provider
+
+
+def _parse_generate_request(data, resolve=True):
+    """解析并校验生成日记请求参数"""
+    if not data:
+        raise ValueError('请求体不能为空')
+    
+    content = data.get('content', '').strip()
+    if not content:
+        raise ValueError('content参数不能为空')
+    
+    # 日记类型决定使用的Prompt模板（见assets/configs/defaults.json）
+    diary_type = data.get('diary_type')
+    if diary_type and PromptBuilder.templates.diary_type(diary_type) is None:
+        raise ValueError(f'不支持的日记类型: {diary_type}')
+    default_style = PromptBuilder.default_style_for(diary_type) if diary_type else 'warm'
+    
+    user_id = data.get('user_id')
+    if user_id is not None and not isinstance(user_id, str):
+        raise ValueError('user_id参数必须是字符串')
+    
+    return {
+        'content': content,
+        'style': data.get('style', default_style),  # warm/poetic/real
+        'mood': data.get('mood'),  # happy/sweet/miss/excited/calm
+        'diary_type': diary_type,  # daily/sweet/highlight/...
+        'gender': data.get('gender'),
+        'partner_name': data.get('partner_name'),
+        'date': data.get('date'),
+        'user_id': user_id,  # 调用方的用户标识，语义缓存按用户隔离
+        'provider': _request_provider(data, resolve),  # gemini/openai/claude，auto为自适应路由
+        'use_cache': data.get('use_cache', True),  # 设为false可跳过缓存
+        'hedge': data.get('hedge'),  # 是否启用对冲请求，默认使用服务端配置
+        'fallback': data.get('fallback'),  # 是否允许故障转移到其他提供商，默认使用服务端配置
+        'timings': bool(data.get('timings', False))  # 是否在响应中附带各阶段耗时
+    }
+
+
+def _parse_regenerate_request(data, resolve=True):
+    """解析并校验重新生成日记请求参数"""
+    if not data:
+        raise ValueError('请求体不能为空')
+    
+    original_content = data.get('original_content', '').strip()
+    if not original_content:
+        raise ValueError('original_content参数不能为空')
+    previous_ai_content = data.get('previous_ai_content', '').strip()
+    if max(len(original_content), len(previous_ai_content)) > REGENERATE_MAX_CHARS:
+        raise ValueError(f'original_content和previous_ai_content不能超过{REGENERATE_MAX_CHARS}个字符')
+    
+    try:
+        variants = int(data.get('variants', 1))
+    except (TypeError, ValueError):
+        raise ValueError('variants参数必须是整数')
+    if not 1 <= variants <= REGENERATE_MAX_VARIANTS:
+        raise ValueError(f'variants参数必须在1到{REGENERATE_MAX_VARIANTS}之间')
+    
+    return {
+        'original_content': original_content,
+        'previous_ai_content': previous_ai_content,
+        'style': data.get('style', 'warm'),
+        'mood': data.get('mood'),
+        'provider': _request_provider(data, resolve),
+        'use_cache': data.get('use_cache', False),  # 重新生成默认不读缓存，否则每次都返回同一结果
+        'variants': variants,  # 一次生成的候选数
+        'hedge': data.get('hedge'),
+        'fallback': data.get('fallback'),
+        'timings': bool(data.get('timings', False))
+    }
+
+
+def _parse_dual_request(data, resolve=True):
+    """解析并校验双视角合成日记请求参数"""
+    if not data:
+        raise ValueError('请求体不能为空')
+    
+    her_content = data.get('her_content', '').strip()
+    his_content = data.get('his_content', '').strip()
+    if not her_content or not his_content:
+        raise ValueError('her_content和his_content参数不能为空')
+    
+    extract_providers = data.get('extract_providers')
+    if extract_providers is not None and (
+            not isinstance(extract_providers, list) or not extract_providers
+            or not all(isinstance(name, str) for name in extract_providers)):
+        raise ValueError('extract_providers参数必须是提供商名称数组')
+    
+    return {
+        'her_content': her_content,
+        'his_content': his_content,
+        'date': data.get('date'),
+        'provider': _request_provider(data, resolve),  # 合成使用的提供商
+        'extract_providers': _extract_providers(extract_providers, resolve) if extract_providers else None,
+        'use_cache': data.get('use_cache', True),
+        'hedge': data.get('hedge'),
+        'fallback': data.get('fallback'),
+        'timings': bool(data.get('timings', False))
+    }
+
+
+def _extract_providers(names, resolve=True):
+    """校验预处理使用的提供商，未配置或拼写错误的名称返回400，而不是让预处理失败后降级合成"""
+    available = ai_factory.get_available_providers()
+    unknown = [name for name in names if name.lower() not in available and name.lower() != AUTO_PROVIDER]
+    if unknown:
+        raise ValueError(f"extract_providers中的提供商不可用: {', '.join(unknown)}，"
+                         f"可用的提供商: {', '.join(available)}")
+    return [_request_provider({'provider': name}, resolve) for name in names]
+
+
+def _parse_batch_request(data):
+    """解析并校验批量生成日记请求参数"""
+    if not data:
+        raise ValueError('请求体不能为空')
+    
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('items参数必须是非空数组')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'items数量不能超过{BATCH_MAX_ITEMS}')
+    if not all(isinstance(item, dict) for item in items):
+        raise ValueError('items中的每一项必须是对象')
+    
+    try:
+        concurrency = int(data.get('concurrency', BATCH_PROVIDER_CONCURRENCY))
+    except (TypeError, ValueError):
+        raise ValueError('concurrency参数必须是整数')
+    
+    return {
+        'items': [_route_batch_item(item) for item in items],
+        'concurrency': max(1, min(concurrency, BATCH_PROVIDER_CONCURRENCY)),
+        'stream': bool(data.get('stream', False))
+    }
+
+
+def _parse_job_request(data):
+    """解析并校验异步任务请求参数，生成参数在提交时即校验
+    
+    任务参数保留请求中的提供商，"auto" 在任务执行时才由路由器选择。
+    """
+    if not data:
+        raise ValueError('请求体不能为空')
+    
+    kind = data.get('type', 'generate')
+    if kind not in JOB_PARSERS:
+        raise ValueError(f'不支持的任务类型: {kind}')
+    
+    params = data.get('params')
+    if not isinstance(params, dict):
+        raise ValueError('params参数必须是对象')
+    JOB_PARSERS[kind](params, resolve=False)
+    
+    priority = data.get('priority', 'interactive')
+    if priority not in JOB_PRIORITIES:
+        raise ValueError(f'不支持的任务优先级: {priority}')
+    
+    webhook = data.get('webhook')
+    if webhook is not None:
+        if not isinstance(webhook, str):
+            raise ValueError('webhook参数必须是http(s)地址')
+        job_queue.validate_webhook(webhook)
+    
+    return {
+        'type': kind,
+        'params': params,
+        'priority': priority,  # interactive/bulk
+        'webhook': webhook
+    }
+
+
+JOB_PARSERS = {
+    'generate': _parse_generate_request,
+    'regenerate': _parse_regenerate_request,
+    'dual': _parse_dual_request
+}
+
+
+def _route_batch_item(item):
+    """在分组前为 "auto" 条目选择提供商，并发分组和生成使用同一个提供商"""
+    try:
+        return {**item, 'provider': _request_provider(item)}
+    except ValueError:
+        return item  # 没有可用的提供商，生成时返回该条目的错误
+
+
+def _batch_group_key(item):
+    """批量生成时按提供商分组限制并发"""
+    return _request_provider(item, resolve=False)
+
+
+def _batch_item_result(index, value, error):
+    """格式化批量生成中单个条目的结果"""
+    if error is not None:
+        message = str(error) if isinstance(error, ValueError) else f'生成失败: {str(error)}'
+        return {
+            'index': index,
+            'success': False,
+            'error': message
+        }
+    
+    result, cached = value
+    return {
+        'index': index,
+        'success': True,
+        'data': {**result, 'cached': cached}
+    }
+
+
+def _diary_cache_key(params, ai_service):
+    """构建生成日记的缓存键"""
+    return ResponseCache.make_key(
+        params['content'], params['style'], params['mood'],
+        params['diary_type'], params['gender'], params['partner_name'], params['date'],
+        params['provider'].lower(), ai_service.get_model_name()
+    )
+
+
+def _semantic_scope(params, ai_service):
+    """语义缓存分区中除风格和心情外的参数：用户标识，以及其他影响生成结果的参数"""
+    return (
+        params['user_id'], params['diary_type'], params['gender'], params['partner_name'], params['date'],
+        params['provider'].lower(), ai_service.get_model_name()
+    )
+
+
+def _semantic_enabled(params):
+    """未提供user_id的请求默认不使用语义缓存，避免返回由其他用户的输入生成的日记"""
+    return (semantic_cache is not None and params['use_cache']
+            and (params['user_id'] is not None or SEMANTIC_CACHE_SHARED))
+
+
+def _semantic_lookup(params, ai_service):
+    """查找近似输入已生成的日记，未启用或未命中时返回None"""
+    if not _semantic_enabled(params):
+        return None
+    match = semantic_cache.get(
+        params['content'], params['style'], params['mood'], _semantic_scope(params, ai_service)
+    )
+    if match is None:
+        return None
+    result, similarity = match
+    logger.info(f"Semantic cache hit for provider: {params['provider']}, similarity: {similarity:.3f}")
+    return result
+
+
+def _semantic_store(params, ai_service, result):
+    """将生成结果写入语义缓存"""
+    if _semantic_enabled(params):
+        semantic_cache.set(
+            params['content'], params['style'], params['mood'], result, _semantic_scope(params, ai_service)
+        )
+
+
+def _build_diary_prompt(params):
+    """根据请求参数构建日记生成Prompt"""
+    return PromptBuilder.build_diary_prompt(
+        content=params['content'],
+        style=params['style'],
+        mood=params['mood'],
+        diary_type=params['diary_type'],
+        gender=params['gender'],
+        partner_name=params['partner_name'],
+        date=params['date']
+    )
+
+
+def _build_regenerate_prompt(params):
+    """根据请求参数构建重新生成Prompt，超出提供商token预算时压缩，返回 (Prompt, 预算信息)"""
+    return PromptBuilder.build_budgeted_regenerate_prompt(
+        original_content=params['original_content'],
+        previous_ai_content=params['previous_ai_content'],
+        style=params['style'],
+        mood=params['mood'],
+        token_budget=provider_budget(params['provider'])
+    )
+
+
+def _single_flight_key(params, prompt):
+    """构建进行中请求合并的键"""
+    return ResponseCache.make_key(params['provider'].lower(), prompt)
+
+
+def _emoji_limit(style):
+    """生成结果的emoji数量上限，未指定风格或未启用时不限制"""
+    if not ENFORCE_EMOJI_COUNT or not style:
+        return None
+    return PromptBuilder.emoji_limit(style)
+
+
+def _post_process(text, style=None):
+    """清理模型输出：代码块标记、开头客套话、多余的emoji和空白"""
+    with phase('postprocess'):
+        return post_process(text, _emoji_limit(style))
+
+
+def _coalesced_generate(params, prompt):
+    """生成并清理文本，相同Prompt的并发请求共享同一次上游调用"""
+    def generate():
+        generated_text, used_provider, model = ai_factory.generate(
+            params['provider'], prompt, hedge=params['hedge'], fallback=params['fallback']
+        )
+        return _post_process(generated_text, params.get('style')), used_provider, model
+    
+    return single_flight.do(_single_flight_key(params, prompt), generate)
+
+
+def _served_as_requested(params, used_provider):
+    """结果是否由请求的提供商生成
+    
+    缓存键按请求的提供商和模型构建，故障转移或对冲由其他提供商返回的结果不写入缓存，
+    避免之后请求该提供商时读到其他提供商生成的内容。
+    """
+    return used_provider == params['provider'].lower()
+
+
+def _disk_cache_key(params, prompt):
+    """构建磁盘缓存键: Prompt摘要 + 请求的提供商 + 模型"""
+    provider = params['provider'].lower()
+    try:
+        model = ai_factory.get_service(provider).get_model_name()
+    except ValueError:
+        model = None  # 提供商不可用时由故障转移链决定实际使用的提供商
+    return DiskCache.make_key(provider, model, prompt)
+
+
+def _cached_generate(params, prompt):
+    """生成文本，优先读取多进程共享的磁盘缓存，返回 (文本, 提供商, 模型, 是否命中缓存)"""
+    if disk_cache is None or not params['use_cache']:
+        return (*_coalesced_generate(params, prompt), False)
+    
+    key = _disk_cache_key(params, prompt)
+    cached = disk_cache.get(key)
+    if cached is not None:
+        return cached['generated_text'], cached['provider'], cached['model'], True
+    
+    generated_text, used_provider, model = _coalesced_generate(params, prompt)
+    if _served_as_requested(params, used_provider):
+        disk_cache.set(key, {
+            'generated_text': generated_text,
+            'provider': used_provider,
+            'model': model
+        })
+    return generated_text, used_provider, model, False
+
+
+# 双视角日记的双方，对应Prompt中的称呼
+DUAL_SIDES = {
+    'her': '女生',
+    'his': '男生'
+}
+
+
+def _dual_date(params):
+    """合成Prompt中的日期，未指定时与build_dual_prompt一样使用当天日期"""
+    return params['date'] or date.today().isoformat()
+
+
+def _dual_cache_key(params, ai_service):
+    """构建双视角日记的缓存键，按双方记录对缓存"""
+    return ResponseCache.make_key(
+        'dual', params['her_content'], params['his_content'], _dual_date(params),
+        params['provider'].lower(), ai_service.get_model_name()
+    )
+
+
+def _dual_disk_cache_key(params, ai_service):
+    """构建双视角日记的磁盘缓存键，在预处理前即可查询"""
+    pair = '\x1e'.join(('dual', params['her_content'], params['his_content'], _dual_date(params)))
+    return DiskCache.make_key(params['provider'], ai_service.get_model_name(), pair)
+
+
+def _cached_dual_diary(params, ai_service):
+    """读取双视角日记的两级缓存，未命中返回None"""
+    if not params['use_cache']:
+        return None
+    
+    cached = response_cache.get(_dual_cache_key(params, ai_service))
+    if cached is None and disk_cache is not None:
+        cached = disk_cache.get(_dual_disk_cache_key(params, ai_service))
+    return cached
+
+
+def _cache_dual_diary(params, ai_service, result):
+    """缓存合成结果；有一方预处理失败时结果只是降级合成，由其他提供商合成时与缓存键不符，均不缓存"""
+    if not params['use_cache'] or not _served_as_requested(params, result['provider']):
+        return
+    if all(moments is not None for moments in result['key_moments'].values()):
+        response_cache.set(_dual_cache_key(params, ai_service), result)
+        if disk_cache is not None:
+            disk_cache.set(_dual_disk_cache_key(params, ai_service), result)
+
+
+def _dual_extract_items(params):
+    """双方预处理条目 (一方, 记录, 提供商)
+    
+    未指定extract_providers时，两次预处理分散到合成提供商和AI_FALLBACK_ORDER中下一个可用的提供商
+    并行调用；录制/回放提供商不在其中，不会被自动选用。
+    """
+    providers = params['extract_providers']
+    if not providers:
+        provider = params['provider'].lower()
+        available = ai_factory.get_available_providers()
+        providers = [provider] + [name for name in PROVIDER_ORDER if name in available and name != provider]
+    return [
+        ('her', params['her_content'], providers[0]),
+        ('his', params['his_content'], providers[1 % len(providers)])
+    ]
+
+
+def _key_moments_prompt(item):
+    side, content, _ = item
+    return PromptBuilder.build_key_moments_prompt(content, DUAL_SIDES[side])
+
+
+def _key_moments_result(item, value, error):
+    """预处理结果，单方失败时合成只使用该方的原始记录"""
+    if error is not None:
+        logger.warning(f"Key moment extraction for {item[0]} with {item[2]} failed: {error}")
+        return None
+    return _post_process(value[0])
+
+
+def _build_dual_prompt(params, moments):
+    return PromptBuilder.build_dual_prompt(
+        params['her_content'], params['his_content'], params['date'],
+        her_moments=moments.get('her'), his_moments=moments.get('his')
+    )
+
+
+def _variants_result(params, texts, used_provider, model):
+    """过滤近似重复的候选（包括与之前版本近似的），格式化多候选重新生成结果"""
+    texts = [_post_process(text, params['style']) for text in texts]
+    variants = filter_near_duplicates(
+        texts, VARIANT_SIMILARITY_THRESHOLD, reference=params['previous_ai_content']
+    ) or texts[:1]
+    logger.info(f"Generated {len(texts)} variants with {used_provider}, {len(variants)} distinct")
+    
+    return {
+        'generated_text': variants[0],
+        'variants': variants,
+        'provider': used_provider,
+        'model': model,
+        'cached': False
+    }
+
+
+def _rate_limited_response(error):
+    """限流时返回429，并通过Retry-After告知客户端重试时间（Flask和Quart均可直接返回）"""
+    return {
+        'success': False,
+        'error': str(error),
+        'retry_after': round(error.retry_after, 1)
+    }, 429, {'Retry-After': str(max(1, math.ceil(error.retry_after)))}
+
+
+def _sse_event(data, event=None):
+    """格式化一条Server-Sent Events消息"""
+    message = f"event: {event}\n" if event else ''
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _stream_error_event(error):
+    """流式生成失败时的error事件；响应头已发出无法改为429，限流时在事件中附带重试等待秒数"""
+    data = {'error': f'生成失败: {str(error)}'}
+    if isinstance(error, RateLimitExceeded):
+        data['retry_after'] = round(error.retry_after, 1)
+    return _sse_event(data, event='error')
+
+
+def _sse_response(events):
+    """包装SSE流式响应"""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止Nginx缓冲
+        }
+    )
+
+
+def _stream_generation(ai_service, deltas, provider, on_complete=None, meta=None, style=None):
+    """将 ai_factory.generate_stream 的输出转为SSE事件: meta -> 多个delta -> done/error，输出随到随清理"""
+    model = ai_service.get_model_name()
+    yield _sse_event({'provider': provider, 'model': model, **(meta or {})}, event='meta')
+    
+    parts = []
+    start = time.perf_counter()
+    first_token = None
+    try:
+        with track_generation(provider, model):
+            for delta in post_process_stream(deltas, _emoji_limit(style)):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                parts.append(delta)
+                yield _sse_event({'delta': delta})
+    except Exception as e:
+        logger.error(f"Error streaming diary: {e}", exc_info=True)
+        yield _stream_error_event(e)
+        return
+    
+    result = {
+        'generated_text': ''.join(parts).strip(),
+        'provider': provider,
+        'model': model
+    }
+    if on_complete:
+        on_complete(result)
+    
+    # 流式响应头已在首个事件前发出，各阶段耗时随done事件返回
+    timings = {
+        'ttft': round(first_token * 1000, 2) if first_token is not None else None,
+        'upstream': round((time.perf_counter() - start) * 1000, 2)
+    }
+    yield _sse_event({**result, 'timings': timings}, event='done')
+
+
+def _generate_diary(params):
+    """执行一次日记生成（带缓存），返回 (结果, 是否命中缓存)"""
+    style = params['style']
+    mood = params['mood']
+    provider = params['provider']
+    use_cache = params['use_cache']
+    
+    # 获取AI服务
+    ai_service = ai_factory.get_service(provider)
+    
+    # 查询缓存
+    cache_key = _diary_cache_key(params, ai_service)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Cache hit for provider: {provider}, style: {style}, mood: {mood}")
+            return cached, True
+        cached = _semantic_lookup(params, ai_service)
+        if cached is not None:
+            response_cache.set(cache_key, cached)
+            return cached, True
+    
+    logger.info(f"Generating diary with provider: {provider}, style: {style}, mood: {mood}")
+    
+    # 构建Prompt
+    with phase('prompt'):
+        prompt = _build_diary_prompt(params)
+    
+    # 生成日记（对冲模式下可能由备用提供商返回，其他工作进程生成过时从磁盘缓存读取）
+    generated_text, used_provider, model, cached = _cached_generate(params, prompt)
+    
+    result = {
+        'generated_text': generated_text,
+        'provider': used_provider,
+        'model': model
+    }
+    if use_cache and _served_as_requested(params, used_provider):
+        response_cache.set(cache_key, result)
+        _semantic_store(params, ai_service, result)
+    
+    return result, cached
+
+
+def _regenerate_diary(params):
+    """执行一次重新生成，返回结果"""
+    with phase('prompt'):
+        prompt, token_budget = _build_regenerate_prompt(params)
+    
+    if params['variants'] > 1:
+        # 多候选一次生成，客户端可在本地切换，不再逐次重新请求
+        result = _variants_result(params, *ai_factory.generate_variants(
+            params['provider'], prompt, params['variants'], fallback=params['fallback']
+        ))
+        return {**result, 'token_budget': token_budget}
+    
+    generated_text, used_provider, model, cached = _cached_generate(params, prompt)
+    
+    return {
+        'generated_text': generated_text,
+        'provider': used_provider,
+        'model': model,
+        'cached': cached,
+        'token_budget': token_budget
+    }
+
+
+def _generate_dual_diary(params):
+    """执行一次双视角日记合成（带缓存），返回 (结果, 是否命中缓存)
+    
+    双方记录的关键时刻提取并行执行，之后只做一次合成调用，总耗时接近两次串行调用。
+    """
+    provider = params['provider']
+    ai_service = ai_factory.get_service(provider)
+    
+    cached = _cached_dual_diary(params, ai_service)
+    if cached is not None:
+        logger.info(f"Cache hit for dual diary, provider: {provider}")
+        return cached, True
+    
+    items = _dual_extract_items(params)
+    logger.info(f"Generating dual diary with provider: {provider}, "
+                f"extracting with: {', '.join(item[2] for item in items)}")
+    
+    def extract(item):
+        return ai_factory.generate(
+            item[2], _key_moments_prompt(item), hedge=params['hedge'], fallback=params['fallback']
+        )
+    
+    with phase('extract'):
+        moments = {
+            items[index][0]: _key_moments_result(items[index], value, error)
+            for index, value, error in fan_out(items, extract, lambda item: item[2], len(items))
+        }
+    
+    with phase('prompt'):
+        prompt = _build_dual_prompt(params, moments)
+    
+    generated_text, used_provider, model = _coalesced_generate(params, prompt)
+    
+    result = {
+        'generated_text': generated_text,
+        'provider': used_provider,
+        'model': model,
+        'key_moments': moments
+    }
+    _cache_dual_diary(params, ai_service, result)
+    
+    return result, False
+
+
+def _run_job(job):
+    """后台任务执行函数，返回值作为任务结果"""
+    params = JOB_PARSERS[job.kind](job.params)
+    if job.kind == 'regenerate':
+        return _regenerate_diary(params)
+    if job.kind == 'dual':
+        result, cached = _generate_dual_diary(params)
+        return {**result, 'cached': cached}
+    
+    result, cached = _generate_diary(params)
+    return {**result, 'cached': cached}
+
+
+# 异步任务队列：交互式任务优先，批量任务最多占用JOB_BULK_WORKERS个工作线程
+job_queue = JobQueue(
+    _run_job,
+    workers=int(os.getenv('JOB_WORKERS', 4)),
+    bulk_workers=int(os.getenv('JOB_BULK_WORKERS', 0)) or None,
+    max_queued=int(os.getenv('JOB_MAX_QUEUED', 1000)),
+    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 3)),
+    result_ttl=float(os.getenv('JOB_RESULT_TTL', 3600)),
+    db_path=os.getenv('JOB_QUEUE_DB') or None,
+    webhook_timeout=float(os.getenv('JOB_WEBHOOK_TIMEOUT', 5)),
+    webhook_retries=int(os.getenv('JOB_WEBHOOK_RETRIES', 3)),
+    webhook_allowed_hosts=[
+        host.strip() for host in os.getenv('JOB_WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()
+    ],
+    lease_timeout=float(os.getenv('JOB_LEASE_TIMEOUT', 30))
+)
+
+
+def start_background_tasks():
+    """启动后台健康探测和异步任务工作线程"""
+    ai_factory.start_health_prober()
+    job_queue.start()
+
+
+# 线程不能跨fork，由gunicorn预加载时在各工作进程中启动（见gunicorn.conf.py）
+if os.getenv('SERVER_PRELOAD', 'false').lower() != 'true':
+    start_background_tasks()
+
+
+def _collect_job_metrics():
+    """在输出监控指标时读取异步任务队列统计"""
+    stats = job_queue.stats()
+    metrics = [
+        ('diary_jobs_completed_total', 'counter', '成功完成的异步任务数', stats['completed']),
+        ('diary_jobs_failed_total', 'counter', '失败的异步任务数', stats['failed']),
+        ('diary_jobs_retried_total', 'counter', '因限流重新排队的异步任务数', stats['retried']),
+        ('diary_jobs_recovered_total', 'counter', '从已退出的工作进程接管的异步任务数', stats['recovered'])
+    ]
+    for priority in JOB_PRIORITIES:
+        metrics.append(('diary_jobs_queued', 'gauge', '排队中的异步任务数',
+                        stats['queued'][priority], {'priority': priority}))
+        metrics.append(('diary_jobs_running', 'gauge', '执行中的异步任务数',
+                        stats['running'][priority], {'priority': priority}))
+    return metrics
+
+
+REGISTRY.register_collector(_collect_job_metrics)
+
+
 @app.route('/api/generate-diary', methods=['POST'])
+@server_timing
 def generate_diary():
     """生成日记接口"""
     try:
-        # 获取请求数据
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': '请求体不能为空'
-            }), 400
-        
-        # 验证必需参数
-        content = data.get('content', '').strip()
-        if not content:
-            return jsonify({
-                'success': False,
-                'error': 'content参数不能为空'
-            }), 400
-        
-        # 获取可选参数
-        style = data.get('style', 'warm')  # warm/poetic/real
-        mood = data.get('mood')  # happy/sweet/miss/excited/calm
-        provider = data.get('provider', os.getenv('DEFAULT_AI_PROVIDER', 'gemini'))
-        
-        logger.info(f"Generating diary with provider: {provider}, style: {style}, mood: {mood}")
-        
-        # 构建Prompt
-        prompt = PromptBuilder.build_diary_prompt(
-            content=content,
-            style=style,
-            mood=mood
-        )
-        
-        # 获取AI服务
-        ai_service = ai_factory.get_service(provider)
+        # 获取并校验请求参数
+        with phase('parse'):
+            params = _parse_generate_request(request.get_json())
         
         # 生成日记
-        generated_text = ai_service.generate(prompt)
+        result, cached = _generate_diary(params)
+        
+        data = {**result, 'cached': cached}
+        if params['timings']:
+            data['timings'] = current_timer().as_dict()
         
         # 返回结果
-        return jsonify({
-            'success': True,
-            'data': {
-                'generated_text': generated_text,
-                'provider': provider,
-                'model': ai_service.get_model_name()
-            }
-        })
+        with phase('serialize'):
+            return jsonify({
+                'success': True,
+                'data': data
+            })
         
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -108,6 +973,10 @@ def generate_diary():
             'error': str(e)
         }), 400
         
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+        
     except Exception as e:
         logger.error(f"Error generating diary: {e}", exc_info=True)
         return jsonify({
@@ -116,88 +985,297 @@ def generate_diary():
         }), 500
 
 
+@app.route('/api/generate-diary/stream', methods=['POST'])
+def generate_diary_stream():
+    """流式生成日记接口（SSE）"""
+    try:
+        params = _parse_generate_request(request.get_json())
+        ai_service = ai_factory.get_service(params['provider'])
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    provider = params['provider']
+    cache_key = _diary_cache_key(params, ai_service)
+    
+    if params['use_cache']:
+        cached = response_cache.get(cache_key) or _semantic_lookup(params, ai_service)
+        if cached is not None:
+            logger.info(f"Cache hit for streaming provider: {provider}")
+            
+            def replay():
+                yield _sse_event({'provider': cached['provider'], 'model': cached['model']}, event='meta')
+                yield _sse_event({'delta': cached['generated_text']})
+                yield _sse_event({**cached, 'cached': True}, event='done')
+            
+            return _sse_response(replay())
+    
+    logger.info(f"Streaming diary with provider: {provider}, style: {params['style']}, mood: {params['mood']}")
+    
+    prompt = _build_diary_prompt(params)
+    try:
+        deltas = ai_factory.generate_stream(provider, prompt)
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+    
+    def on_complete(result):
+        if params['use_cache']:
+            response_cache.set(cache_key, result)
+            _semantic_store(params, ai_service, result)
+    
+    return _sse_response(_stream_generation(ai_service, deltas, provider, on_complete, style=params['style']))
+
+
+@app.route('/api/generate-diary/batch', methods=['POST'])
+def generate_diary_batch():
+    """批量生成日记接口（按提供商限制并发）"""
+    try:
+        batch = _parse_batch_request(request.get_json())
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    items = batch['items']
+    logger.info(f"Generating batch of {len(items)} diaries, concurrency per provider: {batch['concurrency']}")
+    
+    def run_item(item):
+        return _generate_diary(_parse_generate_request(item))
+    
+    completed = fan_out(items, run_item, _batch_group_key, batch['concurrency'])
+    
+    if batch['stream']:
+        def events():
+            succeeded = 0
+            for index, value, error in completed:
+                item_result = _batch_item_result(index, value, error)
+                succeeded += item_result['success']
+                yield _sse_event(item_result, event='result')
+            yield _sse_event({
+                'total': len(items),
+                'succeeded': succeeded,
+                'failed': len(items) - succeeded
+            }, event='done')
+        
+        return _sse_response(events())
+    
+    results = [None] * len(items)
+    for index, value, error in completed:
+        results[index] = _batch_item_result(index, value, error)
+    
+    return jsonify({
+        'success': True,
+        'results': results
+    })
+
+
 @app.route('/api/regenerate-diary', methods=['POST'])
+@server_timing
 def regenerate_diary():
     """重新生成日记接口（带历史上下文）"""
     try:
-        data = request.get_json()
+        # 获取并校验请求参数
+        with phase('parse'):
+            params = _parse_regenerate_request(request.get_json())
+        provider = params['provider']
         
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': '请求体不能为空'
-            }), 400
+        logger.info(f"Regenerating diary with provider: {provider}")
         
-        # 验证参数
-        original_content = data.get('original_content', '').strip()
-        previous_ai_content = data.get('previous_ai_content', '').strip()
+        # 构建重新生成的Prompt并生成
+        data = _regenerate_diary(params)
+        if params['timings']:
+            data['timings'] = current_timer().as_dict()
         
-        if not original_content:
+        with phase('serialize'):
             return jsonify({
-                'success': False,
-                'error': 'original_content参数不能为空'
-            }), 400
+                'success': True,
+                'data': data
+            })
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
         
-        # 获取可选参数
-        style = data.get('style', 'warm')
-        mood = data.get('mood')
-        provider = data.get('provider', os.getenv('DEFAULT_AI_PROVIDER', 'gemini'))
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
         
-        logger.info(f"Regenerating diary with provider: {provider}")
+    except Exception as e:
+        logger.error(f"Error regenerating diary: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'重新生成失败: {str(e)}'
+        }), 500
+
+
+@app.route('/api/regenerate-diary/stream', methods=['POST'])
+def regenerate_diary_stream():
+    """流式重新生成日记接口（SSE）"""
+    try:
+        params = _parse_regenerate_request(request.get_json())
+        if params['variants'] > 1:
+            raise ValueError('流式接口不支持variants参数')
+        ai_service = ai_factory.get_service(params['provider'])
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    logger.info(f"Streaming regenerated diary with provider: {params['provider']}")
+    
+    prompt, token_budget = _build_regenerate_prompt(params)
+    try:
+        deltas = ai_factory.generate_stream(params['provider'], prompt)
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+    
+    return _sse_response(_stream_generation(
+        ai_service, deltas, params['provider'], meta={'token_budget': token_budget}, style=params['style']
+    ))
+
+
+@app.route('/api/generate-dual-diary', methods=['POST'])
+@server_timing
+def generate_dual_diary():
+    """双视角合成日记接口：并行提取双方的关键时刻，再合成一篇共同日记"""
+    try:
+        with phase('parse'):
+            params = _parse_dual_request(request.get_json())
         
-        # 构建重新生成的Prompt
-        prompt = PromptBuilder.build_regenerate_prompt(
-            original_content=original_content,
-            previous_ai_content=previous_ai_content,
-            style=style,
-            mood=mood
-        )
+        result, cached = _generate_dual_diary(params)
         
-        # 获取AI服务并生成
-        ai_service = ai_factory.get_service(provider)
-        generated_text = ai_service.generate(prompt)
+        data = {**result, 'cached': cached}
+        if params['timings']:
+            data['timings'] = current_timer().as_dict()
         
+        with phase('serialize'):
+            return jsonify({
+                'success': True,
+                'data': data
+            })
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
         return jsonify({
-            'success': True,
-            'data': {
-                'generated_text': generated_text,
-                'provider': provider,
-                'model': ai_service.get_model_name()
-            }
-        })
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
         
     except Exception as e:
-        logger.error(f"Error regenerating diary: {e}", exc_info=True)
+        logger.error(f"Error generating dual diary: {e}", exc_info=True)
         return jsonify({
             'success': False,
-            'error': f'重新生成失败: {str(e)}'
+            'error': f'生成失败: {str(e)}'
         }), 500
 
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """提交异步生成任务，立即返回任务ID"""
+    try:
+        spec = _parse_job_request(request.get_json())
+        job = job_queue.submit(spec['type'], spec['params'], spec['priority'], spec['webhook'])
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except QueueFull as e:
+        logger.warning(f"Job queue full: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    
+    logger.info(f"Queued {spec['priority']} {spec['type']} job {job.id}")
+    return jsonify({
+        'success': True,
+        'job': job.as_dict()
+    }), 202, {'Location': f'/api/jobs/{job.id}'}
+
+
+@app.route('/api/jobs/stats', methods=['GET'])
+def job_stats():
+    """获取异步任务队列统计"""
+    return jsonify({
+        'success': True,
+        'jobs': job_queue.stats()
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询异步任务状态和结果"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在或已过期'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job.as_dict()
+    })
+
+
 @app.route('/api/providers', methods=['GET'])
 def list_providers():
     """列出所有可用的AI提供商"""
-    providers = []
-    
-    for provider_name in ['gemini', 'openai', 'claude']:
-        try:
-            service = ai_factory.get_service(provider_name)
-            providers.append({
-                'name': provider_name,
-                'available': service.is_available(),
-                'model': service.get_model_name()
-            })
-        except Exception as e:
-            logger.error(f"Error checking provider {provider_name}: {e}")
-            providers.append({
-                'name': provider_name,
-                'available': False,
-                'error': str(e)
-            })
-    
     return jsonify({
         'success': True,
-        'providers': providers
+        'providers': _providers_list(),
+        'hedge': ai_factory.get_hedge_stats(),
+        'routing': ai_factory.get_routing_stats(),
+        'http_pool': http_pool.stats()
+    })
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """获取响应缓存统计信息"""
+    return jsonify({
+        'success': True,
+        'cache': response_cache.stats(),
+        'disk_cache': disk_cache.stats() if disk_cache is not None else None,
+        'semantic_cache': semantic_cache.stats() if semantic_cache is not None else None,
+        'single_flight': single_flight.stats()
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus文本格式的监控指标"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    """清空响应缓存"""
+    response_cache.clear()
+    if disk_cache is not None:
+        disk_cache.clear()
+    if semantic_cache is not None:
+        semantic_cache.clear()
+    return jsonify({
+        'success': True
     })
 
 
@@ -0,0 +1,654 @@
+"""
+ASGI后端服务 - 异步AI日记生成API
+
+与 app.py 提供相同的接口，处理函数均为异步实现，单进程即可同时挂起
+大量进行中的生成请求，不再受工作线程数限制。
+
+启动方式:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from functools import partial
+from quart import Quart, Response, g, request, jsonify
+from quart_cors import cors
+
+from app import (
+    ai_factory,
+    disk_cache,
+    job_queue,
+    response_cache,
+    semantic_cache,
+    single_flight,
+    _parse_generate_request,
+    _parse_regenerate_request,
+    _parse_batch_request,
+    _parse_dual_request,
+    _parse_job_request,
+    _batch_group_key,
+    _batch_item_result,
+    _diary_cache_key,
+    _build_diary_prompt,
+    _build_regenerate_prompt,
+    _single_flight_key,
+    _emoji_limit,
+    _post_process,
+    _disk_cache_key,
+    _served_as_requested,
+    _semantic_lookup,
+    _semantic_store,
+    _cached_dual_diary,
+    _cache_dual_diary,
+    _dual_extract_items,
+    _key_moments_prompt,
+    _key_moments_result,
+    _build_dual_prompt,
+    _variants_result,
+    _providers_status,
+    _providers_list,
+    _sse_event,
+    _stream_error_event,
+    _rate_limited_response,
+)
+from services import http_pool
+from services.rate_limiter import RateLimitExceeded
+from utils.fan_out import afan_out
+from utils.job_queue import QueueFull
+from utils.post_processor import apost_process_stream
+from utils.timing import current_timer, phase, server_timing
+from utils.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    HTTP_IN_FLIGHT,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    REGISTRY,
+    track_generation,
+)
+
+logger = logging.getLogger(__name__)
+
+# 初始化Quart应用
+app = Quart(__name__)
+app = cors(app)  # 允许跨域请求
+
+
+def _request_route():
+    """监控指标使用的路由标签，使用路由规则而非实际路径以限制标签数量"""
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@app.before_request
+async def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+
+@app.after_request
+async def _record_request_metrics(response):
+    route = _request_route()
+    HTTP_REQUESTS.labels(request.method, route, response.status_code).inc()
+    HTTP_LATENCY.labels(request.method, route).observe(
+        time.perf_counter() - g.get('request_started', time.perf_counter())
+    )
+    return response
+
+
+@app.teardown_request
+async def _finish_request_metrics(error):
+    HTTP_IN_FLIGHT.dec()
+
+
+def _sse_response(events):
+    """包装SSE流式响应"""
+    response = Response(
+        events,
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 禁止Nginx缓冲
+        }
+    )
+    response.timeout = None  # 流式响应不受默认超时限制
+    return response
+
+
+async def _stream_generation(ai_service, deltas, provider, on_complete=None, meta=None, style=None):
+    """将 ai_factory.agenerate_stream 的输出转为SSE事件: meta -> 多个delta -> done/error，输出随到随清理"""
+    model = ai_service.get_model_name()
+    yield _sse_event({'provider': provider, 'model': model, **(meta or {})}, event='meta')
+    
+    parts = []
+    start = time.perf_counter()
+    first_token = None
+    try:
+        with track_generation(provider, model):
+            async for delta in apost_process_stream(deltas, _emoji_limit(style)):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                parts.append(delta)
+                yield _sse_event({'delta': delta})
+    except Exception as e:
+        logger.error(f"Error streaming diary: {e}", exc_info=True)
+        yield _stream_error_event(e)
+        return
+    
+    result = {
+        'generated_text': ''.join(parts).strip(),
+        'provider': provider,
+        'model': model
+    }
+    if on_complete:
+        on_complete(result)
+    
+    # 流式响应头已在首个事件前发出，各阶段耗时随done事件返回
+    timings = {
+        'ttft': round(first_token * 1000, 2) if first_token is not None else None,
+        'upstream': round((time.perf_counter() - start) * 1000, 2)
+    }
+    yield _sse_event({**result, 'timings': timings}, event='done')
+
+
+async def _acoalesced_generate(params, prompt):
+    """异步生成并清理文本，相同Prompt的并发请求共享同一次上游调用"""
+    async def generate():
+        generated_text, used_provider, model = await ai_factory.agenerate(
+            params['provider'], prompt, hedge=params['hedge'], fallback=params['fallback']
+        )
+        return _post_process(generated_text, params.get('style')), used_provider, model
+    
+    return await single_flight.ado(_single_flight_key(params, prompt), generate)
+
+
+async def _run_blocking(fn, *args):
+    """在线程池中执行阻塞调用（SQLite磁盘缓存和任务存储、webhook的DNS解析），避免阻塞事件循环
+    
+    数据库繁忙时这些调用最多等待数秒，直接在事件循环中执行会阻塞所有进行中的请求和SSE流。
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, partial(context.run, fn, *args))
+
+
+async def _acached_generate(params, prompt):
+    """异步生成文本，优先读取多进程共享的磁盘缓存，返回 (文本, 提供商, 模型, 是否命中缓存)"""
+    if disk_cache is None or not params['use_cache']:
+        return (*await _acoalesced_generate(params, prompt), False)
+    
+    key = _disk_cache_key(params, prompt)
+    cached = await _run_blocking(disk_cache.get, key)
+    if cached is not None:
+        return cached['generated_text'], cached['provider'], cached['model'], True
+    
+    generated_text, used_provider, model = await _acoalesced_generate(params, prompt)
+    if _served_as_requested(params, used_provider):
+        await _run_blocking(disk_cache.set, key, {
+            'generated_text': generated_text,
+            'provider': used_provider,
+            'model': model
+        })
+    return generated_text, used_provider, model, False
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """健康检查接口"""
+    return jsonify({
+        'status': 'healthy',
+        'version': '1.0.0',
+        'providers': _providers_status()
+    })
+
+
+async def _agenerate_diary(params):
+    """异步执行一次日记生成（带缓存），返回 (结果, 是否命中缓存)"""
+    provider = params['provider']
+    ai_service = ai_factory.get_service(provider)
+    
+    cache_key = _diary_cache_key(params, ai_service)
+    if params['use_cache']:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Cache hit for provider: {provider}")
+            return cached, True
+        cached = _semantic_lookup(params, ai_service)
+        if cached is not None:
+            response_cache.set(cache_key, cached)
+            return cached, True
+    
+    logger.info(f"Generating diary with provider: {provider}, style: {params['style']}, mood: {params['mood']}")
+    
+    with phase('prompt'):
+        prompt = _build_diary_prompt(params)
+    
+    generated_text, used_provider, model, cached = await _acached_generate(params, prompt)
+    
+    result = {
+        'generated_text': generated_text,
+        'provider': used_provider,
+        'model': model
+    }
+    if params['use_cache'] and _served_as_requested(params, used_provider):
+        response_cache.set(cache_key, result)
+        _semantic_store(params, ai_service, result)
+    
+    return result, cached
+
+
+@app.route('/api/generate-diary', methods=['POST'])
+@server_timing
+async def generate_diary():
+    """生成日记接口"""
+    try:
+        with phase('parse'):
+            params = _parse_generate_request(await request.get_json(silent=True))
+        result, cached = await _agenerate_diary(params)
+        
+        data = {**result, 'cached': cached}
+        if params['timings']:
+            data['timings'] = current_timer().as_dict()
+        
+        with phase('serialize'):
+            return jsonify({
+                'success': True,
+                'data': data
+            })
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+        
+    except Exception as e:
+        logger.error(f"Error generating diary: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'生成失败: {str(e)}'
+        }), 500
+
+
+@app.route('/api/generate-diary/stream', methods=['POST'])
+async def generate_diary_stream():
+    """流式生成日记接口（SSE）"""
+    try:
+        params = _parse_generate_request(await request.get_json(silent=True))
+        ai_service = ai_factory.get_service(params['provider'])
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    provider = params['provider']
+    cache_key = _diary_cache_key(params, ai_service)
+    
+    if params['use_cache']:
+        cached = response_cache.get(cache_key) or _semantic_lookup(params, ai_service)
+        if cached is not None:
+            logger.info(f"Cache hit for streaming provider: {provider}")
+            
+            async def replay():
+                yield _sse_event({'provider': cached['provider'], 'model': cached['model']}, event='meta')
+                yield _sse_event({'delta': cached['generated_text']})
+                yield _sse_event({**cached, 'cached': True}, event='done')
+            
+            return _sse_response(replay())
+    
+    logger.info(f"Streaming diary with provider: {provider}, style: {params['style']}, mood: {params['mood']}")
+    
+    prompt = _build_diary_prompt(params)
+    try:
+        deltas = await ai_factory.agenerate_stream(provider, prompt)
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+    
+    def on_complete(result):
+        if params['use_cache']:
+            response_cache.set(cache_key, result)
+            _semantic_store(params, ai_service, result)
+    
+    return _sse_response(_stream_generation(ai_service, deltas, provider, on_complete, style=params['style']))
+
+
+@app.route('/api/generate-diary/batch', methods=['POST'])
+async def generate_diary_batch():
+    """批量生成日记接口（按提供商限制并发）"""
+    try:
+        batch = _parse_batch_request(await request.get_json(silent=True))
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    items = batch['items']
+    logger.info(f"Generating batch of {len(items)} diaries, concurrency per provider: {batch['concurrency']}")
+    
+    async def run_item(item):
+        return await _agenerate_diary(_parse_generate_request(item))
+    
+    completed = afan_out(items, run_item, _batch_group_key, batch['concurrency'])
+    
+    if batch['stream']:
+        async def events():
+            succeeded = 0
+            async for index, value, error in completed:
+                item_result = _batch_item_result(index, value, error)
+                succeeded += item_result['success']
+                yield _sse_event(item_result, event='result')
+            yield _sse_event({
+                'total': len(items),
+                'succeeded': succeeded,
+                'failed': len(items) - succeeded
+            }, event='done')
+        
+        return _sse_response(events())
+    
+    results = [None] * len(items)
+    async for index, value, error in completed:
+        results[index] = _batch_item_result(index, value, error)
+    
+    return jsonify({
+        'success': True,
+        'results': results
+    })
+
+
+@app.route('/api/regenerate-diary', methods=['POST'])
+@server_timing
+async def regenerate_diary():
+    """重新生成日记接口（带历史上下文）"""
+    try:
+        with phase('parse'):
+            params = _parse_regenerate_request(await request.get_json(silent=True))
+        provider = params['provider']
+        
+        logger.info(f"Regenerating diary with provider: {provider}")
+        
+        with phase('prompt'):
+            prompt, token_budget = _build_regenerate_prompt(params)
+        
+        if params['variants'] > 1:
+            result = _variants_result(params, *await ai_factory.agenerate_variants(
+                provider, prompt, params['variants'], fallback=params['fallback']
+            ))
+            data = {**result, 'token_budget': token_budget}
+        else:
+            generated_text, used_provider, model, cached = await _acached_generate(params, prompt)
+            data = {
+                'generated_text': generated_text,
+                'provider': used_provider,
+                'model': model,
+                'cached': cached,
+                'token_budget': token_budget
+            }
+        if params['timings']:
+            data['timings'] = current_timer().as_dict()
+        
+        with phase('serialize'):
+            return jsonify({
+                'success': True,
+                'data': data
+            })
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+        
+    except Exception as e:
+        logger.error(f"Error regenerating diary: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'重新生成失败: {str(e)}'
+        }), 500
+
+
+@app.route('/api/regenerate-diary/stream', methods=['POST'])
+async def regenerate_diary_stream():
+    """流式重新生成日记接口（SSE）"""
+    try:
+        params = _parse_regenerate_request(await request.get_json(silent=True))
+        if params['variants'] > 1:
+            raise ValueError('流式接口不支持variants参数')
+        ai_service = ai_factory.get_service(params['provider'])
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    
+    logger.info(f"Streaming regenerated diary with provider: {params['provider']}")
+    
+    prompt, token_budget = _build_regenerate_prompt(params)
+    try:
+        deltas = await ai_factory.agenerate_stream(params['provider'], prompt)
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+    
+    return _sse_response(_stream_generation(
+        ai_service, deltas, params['provider'], meta={'token_budget': token_budget}, style=params['style']
+    ))
+
+
+async def _agenerate_dual_diary(params):
+    """异步执行一次双视角日记合成（带缓存），返回 (结果, 是否命中缓存)"""
+    provider = params['provider']
+    ai_service = ai_factory.get_service(provider)
+    
+    cached = await _run_blocking(_cached_dual_diary, params, ai_service)
+    if cached is not None:
+        logger.info(f"Cache hit for dual diary, provider: {provider}")
+        return cached, True
+    
+    items = _dual_extract_items(params)
+    logger.info(f"Generating dual diary with provider: {provider}, "
+                f"extracting with: {', '.join(item[2] for item in items)}")
+    
+    async def extract(item):
+        return await ai_factory.agenerate(
+            item[2], _key_moments_prompt(item), hedge=params['hedge'], fallback=params['fallback']
+        )
+    
+    with phase('extract'):
+        moments = {}
+        async for index, value, error in afan_out(items, extract, lambda item: item[2], len(items)):
+            moments[items[index][0]] = _key_moments_result(items[index], value, error)
+    
+    with phase('prompt'):
+        prompt = _build_dual_prompt(params, moments)
+    
+    generated_text, used_provider, model = await _acoalesced_generate(params, prompt)
+    
+    result = {
+        'generated_text': generated_text,
+        'provider': used_provider,
+        'model': model,
+        'key_moments': moments
+    }
+    await _run_blocking(_cache_dual_diary, params, ai_service, result)
+    
+    return result, False
+
+
+@app.route('/api/generate-dual-diary', methods=['POST'])
+@server_timing
+async def generate_dual_diary():
+    """双视角合成日记接口：并行提取双方的关键时刻，再合成一篇共同日记"""
+    try:
+        with phase('parse'):
+            params = _parse_dual_request(await request.get_json(silent=True))
+        
+        result, cached = await _agenerate_dual_diary(params)
+        
+        data = {**result, 'cached': cached}
+        if params['timings']:
+            data['timings'] = current_timer().as_dict()
+        
+        with phase('serialize'):
+            return jsonify({
+                'success': True,
+                'data': data
+            })
+        
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+        
+    except RateLimitExceeded as e:
+        logger.warning(f"Rate limited: {e}")
+        return _rate_limited_response(e)
+        
+    except Exception as e:
+        logger.error(f"Error generating dual diary: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'生成失败: {str(e)}'
+        }), 500
+
+
+@app.route('/api/jobs', methods=['POST'])
+async def submit_job():
+    """提交异步生成任务，立即返回任务ID"""
+    try:
+        spec = await _run_blocking(_parse_job_request, await request.get_json(silent=True))
+        job = await _run_blocking(
+            job_queue.submit, spec['type'], spec['params'], spec['priority'], spec['webhook']
+        )
+    except ValueError as e:
+        logger.error(f"Validation error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except QueueFull as e:
+        logger.warning(f"Job queue full: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+    
+    logger.info(f"Queued {spec['priority']} {spec['type']} job {job.id}")
+    return jsonify({
+        'success': True,
+        'job': job.as_dict()
+    }), 202, {'Location': f'/api/jobs/{job.id}'}
+
+
+@app.route('/api/jobs/stats', methods=['GET'])
+async def job_stats():
+    """获取异步任务队列统计"""
+    return jsonify({
+        'success': True,
+        'jobs': job_queue.stats()
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """查询异步任务状态和结果"""
+    job = await _run_blocking(job_queue.get, job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在或已过期'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job.as_dict()
+    })
+
+
+@app.route('/api/providers', methods=['GET'])
+async def list_providers():
+    """列出所有可用的AI提供商"""
+    return jsonify({
+        'success': True,
+        'providers': _providers_list(),
+        'hedge': ai_factory.get_hedge_stats(),
+        'routing': ai_factory.get_routing_stats(),
+        'http_pool': http_pool.stats()
+    })
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+async def cache_stats():
+    """获取响应缓存统计信息"""
+    return jsonify({
+        'success': True,
+        'cache': response_cache.stats(),
+        'disk_cache': await _run_blocking(disk_cache.stats) if disk_cache is not None else None,
+        'semantic_cache': semantic_cache.stats() if semantic_cache is not None else None,
+        'single_flight': single_flight.stats()
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+async def metrics():
+    """Prometheus文本格式的监控指标"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/api/cache', methods=['DELETE'])
+async def clear_cache():
+    """清空响应缓存"""
+    response_cache.clear()
+    if disk_cache is not None:
+        await _run_blocking(disk_cache.clear)
+    if semantic_cache is not None:
+        semantic_cache.clear()
+    return jsonify({
+        'success': True
+    })
+
+
+@app.errorhandler(404)
+async def not_found(error):
+    """404错误处理"""
+    return jsonify({
+        'success': False,
+        'error': '接口不存在'
+    }), 404
+
+
+@app.errorhandler(500)
+async def internal_error(error):
+    """500错误处理"""
+    logger.error(f"Internal server error: {error}")
+    return jsonify({
+        'success': False,
+        'error': '服务器内部错误'
+    }), 500
+
+
+if __name__ == '__main__':
+    import uvicorn
+    
+    port = int(os.getenv('PORT', 5000))
+    host = os.getenv('HOST', '0.0.0.0')
+    
+    logger.info(f"Starting ASGI server on {host}:{port}")
+    uvicorn.run(app, host=host, port=port)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+本地模拟LLM服务
+
+实现压测所需的OpenAI、Anthropic和Gemini(REST)接口子集，按配置的延迟分布、
+流式输出节奏和错误率返回固定的日记内容，不消耗真实API额度:
+- OpenAI:    POST /v1/chat/completions、GET /v1/models/{model}
+- Anthropic: POST /v1/messages、GET /v1/models/{model}
+- Gemini:    POST /v1beta/models/{model}:generateContent、:streamGenerateContent、GET /v1beta/models/{model}
+
+服务端通过以下环境变量指向本服务:
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+    CLAUDE_BASE_URL=http://127.0.0.1:8100
+    GEMINI_API_ENDPOINT=http://127.0.0.1:8100
+
+用法:
+    python benchmarks/fake_llm_server.py --port 8100 --latency lognormal:0.8,0.4 --error-rate 0.02
+"""
+
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DIARY_TEXT = (
+    "# 今天的美好\n\n"
+    "今天和你一起去看了那部期待已久的电影，影院里的灯光暗下来的那一刻，"
+    "我偷偷看了你一眼，你正认真地盯着屏幕。\n\n"
+    "散场后我们沿着河边慢慢走回家，晚风有点凉，你把外套披在我肩上。"
+    "那一刻觉得，平凡的日子因为有你而闪闪发光。\n\n"
+    "希望以后的每一个周末，都能这样和你一起度过 💕"
+)
+
+
+class LatencyDistribution:
+    """延迟分布（秒）
+    
+    支持的格式:
+        fixed:0.5              固定延迟
+        uniform:0.2,1.5        均匀分布
+        normal:0.8,0.2         正态分布（均值、标准差，截断到0以上）
+        lognormal:0.8,0.4      对数正态分布（中位数、sigma），贴近真实LLM的长尾延迟
+    """
+    
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        values = [float(value) for value in params.split(',') if value]
+        
+        if kind == 'fixed' and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == 'uniform' and len(values) == 2:
+            self._sample = lambda: random.uniform(values[0], values[1])
+        elif kind == 'normal' and len(values) == 2:
+            self._sample = lambda: random.gauss(values[0], values[1])
+        elif kind == 'lognormal' and len(values) == 2:
+            self._sample = lambda: random.lognormvariate(math.log(values[0]), values[1])
+        else:
+            raise ValueError(f"无效的延迟分布: {spec}")
+    
+    def sample(self) -> float:
+        return max(0.0, self._sample())
+
+
+class FakeLLMConfig:
+    """模拟服务的行为配置"""
+    
+    def __init__(self, latency: str = 'lognormal:0.8,0.4', chunk_delay: float = 0.03,
+                 chunks: int = 20, error_rate: float = 0.0, error_status: int = 500,
+                 text: str = DIARY_TEXT):
+        self.latency = LatencyDistribution(latency)
+        self.chunk_delay = chunk_delay
+        self.chunks = max(1, chunks)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.text = text
+    
+    def as_dict(self) -> dict:
+        return {
+            'latency': self.latency.spec,
+            'chunk_delay': self.chunk_delay,
+            'chunks': self.chunks,
+            'error_rate': self.error_rate,
+            'error_status': self.error_status
+        }
+    
+    def split_text(self):
+        """将回复内容切分为chunks段"""
+        size = max(1, math.ceil(len(self.text) / self.chunks))
+        return [self.text[i:i + size] for i in range(0, len(self.text), size)]
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """按请求路径分派到各提供商的模拟接口"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    @property
+    def config(self) -> FakeLLMConfig:
+        return self.server.config
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path.startswith('/v1/models/'):
+            self._send_json({'id': path.rsplit('/', 1)[-1], 'object': 'model', 'created': 0, 'owned_by': 'fake'})
+        elif path.startswith('/v1beta/models/'):
+            name = path[len('/v1beta/'):]
+            self._send_json({'name': name, 'displayName': name, 'supportedGenerationMethods': ['generateContent']})
+        else:
+            self._send_json({'error': {'message': 'not found'}}, status=404)
+    
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self._read_json()
+        
+        if path == '/v1/chat/completions':
+            handler = self._openai
+        elif path == '/v1/messages':
+            handler = self._anthropic
+        elif path.startswith('/v1beta/models/') and ':' in path:
+            handler = self._gemini
+        else:
+            self._send_json({'error': {'message': 'not found'}}, status=404)
+            return
+        
+        time.sleep(self.config.latency.sample())
+        if random.random() < self.config.error_rate:
+            self._send_json({'error': {'message': 'injected failure', 'type': 'server_error'}},
+                            status=self.config.error_status)
+            return
+        
+        handler(path, body)
+    
+    def _openai(self, path, body):
+        model = body.get('model', 'gpt-4')
+        prompt_tokens = self._prompt_tokens(body.get('messages', []))
+        
+        if not body.get('stream'):
+            choices = int(body.get('n') or 1)
+            self._send_json({
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': index,
+                    'message': {'role': 'assistant', 'content': self.config.text},
+                    'finish_reason': 'stop'
+                } for index in range(choices)],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': len(self.config.text) * choices,
+                    'total_tokens': prompt_tokens + len(self.config.text) * choices
+                }
+            })
+            return
+        
+        def chunk(delta, finish_reason=None):
+            return {
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+        
+        self._start_stream('text/event-stream')
+        self._write(f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n")
+        for part in self._paced_parts():
+            self._write(f"data: {json.dumps(chunk({'content': part}), ensure_ascii=False)}\n\n")
+        self._write(f"data: {json.dumps(chunk({}, 'stop'))}\n\n")
+        self._write("data: [DONE]\n\n")
+    
+    def _anthropic(self, path, body):
+        model = body.get('model', 'claude-3-sonnet-20240229')
+        input_tokens = self._prompt_tokens(body.get('messages', []))
+        message = {
+            'id': 'msg_fake',
+            'type': 'message',
+            'role': 'assistant',
+            'model': model,
+            'stop_reason': 'end_turn',
+            'stop_sequence': None
+        }
+        
+        if not body.get('stream'):
+            self._send_json({
+                **message,
+                'content': [{'type': 'text', 'text': self.config.text}],
+                'usage': {'input_tokens': input_tokens, 'output_tokens': len(self.config.text)}
+            })
+            return
+        
+        def event(name, data):
+            self._write(f"event: {name}\ndata: {json.dumps({'type': name, **data}, ensure_ascii=False)}\n\n")
+        
+        self._start_stream('text/event-stream')
+        event('message_start', {'message': {
+            **message, 'content': [], 'stop_reason': None,
+            'usage': {'input_tokens': input_tokens, 'output_tokens': 1}
+        }})
+        event('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+        for part in self._paced_parts():
+            event('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': part}})
+        event('content_block_stop', {'index': 0})
+        event('message_delta', {
+            'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+            'usage': {'output_tokens': len(self.config.text)}
+        })
+        event('message_stop', {})
+    
+    def _gemini(self, path, body):
+        prompt_tokens = self._prompt_tokens([
+            part for content in body.get('contents', []) for part in content.get('parts', [])
+        ])
+        
+        def response(text, candidates_tokens):
+            return {
+                'candidates': [{
+                    'content': {'parts': [{'text': text}], 'role': 'model'},
+                    'finishReason': 1,
+                    'index': 0
+                }],
+                'usageMetadata': {
+                    'promptTokenCount': prompt_tokens,
+                    'candidatesTokenCount': candidates_tokens,
+                    'totalTokenCount': prompt_tokens + candidates_tokens
+                }
+            }
+        
+        if path.endswith(':generateContent'):
+            self._send_json(response(self.config.text, len(self.config.text)))
+            return
+        
+        # REST流式接口返回逐步输出的JSON数组
+        self._start_stream('application/json')
+        emitted = 0
+        for index, part in enumerate(self._paced_parts()):
+            emitted += len(part)
+            prefix = '[' if index == 0 else ','
+            self._write(prefix + json.dumps(response(part, emitted), ensure_ascii=False))
+        self._write(']')
+    
+    def _paced_parts(self):
+        """按配置的间隔逐段产出回复内容，第一段在首token延迟后立即产出"""
+        for index, part in enumerate(self.config.split_text()):
+            if index:
+                time.sleep(self.config.chunk_delay)
+            yield part
+    
+    @staticmethod
+    def _prompt_tokens(items) -> int:
+        """粗略估算输入token数"""
+        return sum(len(json.dumps(item, ensure_ascii=False)) for item in items) // 2
+    
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+    
+    def _send_json(self, data, status=200):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def _start_stream(self, content_type):
+        """流式响应不声明长度，输出结束后关闭连接"""
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+    
+    def _write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+        self.wfile.flush()
+
+
+class FakeLLMServer:
+    """在后台线程中运行的模拟LLM服务"""
+    
+    def __init__(self, config: FakeLLMConfig, host: str = '127.0.0.1', port: int = 0):
+        self._httpd = ThreadingHTTPServer((host, port), FakeLLMHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.config = config
+        self._thread = None
+    
+    @property
+    def config(self) -> FakeLLMConfig:
+        return self._httpd.config
+    
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+    
+    def provider_env(self) -> dict:
+        """让后端各服务指向本服务的环境变量"""
+        return {
+            'OPENAI_API_KEY': 'fake-key',
+            'OPENAI_BASE_URL': f'{self.url}/v1',
+            'CLAUDE_API_KEY': 'fake-key',
+            'CLAUDE_BASE_URL': self.url,
+            'GEMINI_API_KEY': 'fake-key',
+            'GEMINI_API_ENDPOINT': self.url
+        }
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-llm', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def add_config_arguments(parser):
+    """添加模拟服务的行为配置参数"""
+    parser.add_argument('--latency', default='lognormal:0.8,0.4',
+                        help='首token延迟分布（秒），如 fixed:0.5、uniform:0.2,1.5、lognormal:0.8,0.4')
+    parser.add_argument('--chunk-delay', type=float, default=0.03, help='流式输出的分段间隔（秒）')
+    parser.add_argument('--chunks', type=int, default=20, help='流式输出的分段数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='注入错误的比例（0-1）')
+    parser.add_argument('--error-status', type=int, default=500, help='注入错误的HTTP状态码')
+
+
+def config_from_args(args) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        latency=args.latency,
+        chunk_delay=args.chunk_delay,
+        chunks=args.chunks,
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟LLM服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    
+    server = FakeLLMServer(config_from_args(args), args.host, args.port)
+    print(f"Fake LLM server listening on {server.url}")
+    for key, value in server.provider_env().items():
+        print(f"  {key}={value}")
+    
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
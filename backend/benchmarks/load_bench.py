@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+离线压测基准
+
+启动本地模拟LLM服务（见 fake_llm_server.py）和后端服务进程，各AI服务通过
+环境变量指向模拟服务，不消耗真实API额度。按指定并发驱动接口，输出吞吐量、
+延迟分位数和错误率的JSON，可在不同提交间对比。
+
+用法:
+    python benchmarks/load_bench.py --concurrency 16 --requests 400 --output load.json
+    python benchmarks/load_bench.py --server asgi --endpoint stream --provider claude
+    python benchmarks/load_bench.py --server gunicorn --concurrency 64
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import tempfile
+import subprocess
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_llm_server import FakeLLMServer, add_config_arguments, config_from_args
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = {
+    'generate': '/api/generate-diary',
+    'regenerate': '/api/regenerate-diary',
+    'stream': '/api/generate-diary/stream'
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_backend(server, port, env, log):
+    """启动后端服务进程
+    
+    后端日志写入临时文件log而不是管道：压测中大量的错误日志会写满管道缓冲区，
+    使后端阻塞在写日志上，压测随之卡住。
+    """
+    if server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app',
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    elif server in ('gunicorn', 'gunicorn-asgi'):
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py']
+        env = {**env, 'SERVER_MODE': 'asgi' if server == 'gunicorn-asgi' else 'wsgi'}
+    else:
+        command = [sys.executable, 'app.py']
+    
+    return subprocess.Popen(
+        command, cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=log
+    )
+
+
+def _backend_log(log, limit=20000):
+    """读取后端日志的末尾部分"""
+    log.seek(0)
+    return log.read()[-limit:]
+
+
+def _wait_ready(base_url, process, log, timeout=30):
+    """等待后端健康检查接口可用"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"后端进程已退出:\n{_backend_log(log)}")
+        try:
+            with urllib.request.urlopen(f'{base_url}/api/health', timeout=1):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    raise RuntimeError(f"后端在{timeout}秒内未就绪:\n{_backend_log(log)}")
+
+
+def _request_body(endpoint, provider, index, unique):
+    """构建请求体，unique时每个请求内容不同，避免被缓存和请求合并吸收"""
+    suffix = f'（第{index}次）' if unique else ''
+    if endpoint == 'regenerate':
+        return {
+            'original_content': f'今天和他一起看了电影{suffix}',
+            'previous_ai_content': '# 今天的美好\n\n今天和他一起看了电影，很开心。',
+            'provider': provider
+        }
+    return {
+        'content': f'今天和他一起看了电影{suffix}',
+        'style': 'warm',
+        'mood': 'sweet',
+        'provider': provider,
+        'use_cache': not unique
+    }
+
+
+def _send(url, body, stream):
+    """发送一次请求，返回 (状态码, 总耗时, 首token耗时)"""
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    start = time.perf_counter()
+    first_token = None
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            status = response.status
+            if stream:
+                for line in response:
+                    if first_token is None and line.startswith(b'data: {"delta"'):
+                        first_token = time.perf_counter() - start
+                    if line.startswith(b'event: error'):
+                        status = 'stream_error'
+            else:
+                response.read()
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - start, first_token
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))] * 1000, 2)
+    
+    return {
+        'p50': pick(50),
+        'p95': pick(95),
+        'p99': pick(99),
+        'mean': round(statistics.mean(ordered) * 1000, 2),
+        'max': round(ordered[-1] * 1000, 2)
+    }
+
+
+def run_load(base_url, args):
+    """按并发驱动接口，返回每个请求的 (状态码, 耗时, 首token耗时) 及总耗时"""
+    url = base_url + ENDPOINTS[args.endpoint]
+    stream = args.endpoint == 'stream'
+    
+    for index in range(args.warmup):
+        _send(url, _request_body(args.endpoint, args.provider, -index - 1, args.unique), stream)
+    
+    counter = iter(range(args.requests))
+    counter_lock = threading.Lock()
+    results = []
+    
+    def worker():
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            results.append(_send(url, _request_body(args.endpoint, args.provider, index, args.unique), stream))
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for _ in range(args.concurrency):
+            executor.submit(worker)
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线压测基准（使用本地模拟LLM服务）')
+    parser.add_argument('--server', choices=['wsgi', 'asgi', 'gunicorn', 'gunicorn-asgi'], default='wsgi',
+                        help='后端模式: app.py、uvicorn asgi.py，或gunicorn多进程部署（gunicorn.conf.py）')
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='generate', help='压测的接口')
+    parser.add_argument('--provider', default='openai', help='请求的AI提供商')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发请求数')
+    parser.add_argument('--requests', type=int, default=200, help='总请求数')
+    parser.add_argument('--warmup', type=int, default=3, help='预热请求数（不计入结果）')
+    parser.add_argument('--no-unique', dest='unique', action='store_false',
+                        help='所有请求使用相同内容（测量缓存和请求合并的效果）')
+    parser.add_argument('--base-url', help='压测已运行的后端（不启动后端进程）')
+    parser.add_argument('--output', help='结果JSON输出路径，默认输出到stdout')
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    
+    fake = FakeLLMServer(config_from_args(args)).start()
+    process = None
+    log = tempfile.TemporaryFile(mode='w+', encoding='utf-8', errors='replace')
+    base_url = args.base_url
+    
+    try:
+        if base_url is None:
+            port = _free_port()
+            env = {
+                **os.environ,
+                **fake.provider_env(),
+                'PORT': str(port),
+                'HOST': '127.0.0.1',
+                'FLASK_ENV': 'production',
+                'AI_PROBE_INTERVAL': '0',
+                'LOG_LEVEL': 'WARNING'
+            }
+            process = _start_backend(args.server, port, env, log)
+            base_url = f'http://127.0.0.1:{port}'
+            _wait_ready(base_url, process, log)
+        
+        results, elapsed = run_load(base_url, args)
+    finally:
+        if process is not None:
+            if process.poll() is not None:
+                print(f"后端进程在压测中退出（{process.returncode}）:\n{_backend_log(log)}", file=sys.stderr)
+            process.terminate()
+            process.wait(timeout=10)
+        log.close()
+        fake.stop()
+    
+    latencies = [latency for status, latency, _ in results if status == 200]
+    first_tokens = [first for status, _, first in results if status == 200 and first is not None]
+    by_status = {}
+    for status, _, _ in results:
+        by_status[str(status)] = by_status.get(str(status), 0) + 1
+    errors = len(results) - len(latencies)
+    
+    result = {
+        'python': sys.version.split()[0],
+        'server': args.server if args.base_url is None else args.base_url,
+        'endpoint': ENDPOINTS[args.endpoint],
+        'provider': args.provider,
+        'concurrency': args.concurrency,
+        'requests': len(results),
+        'unique': args.unique,
+        'fake_llm': fake.config.as_dict(),
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': _percentiles(latencies),
+        'ttft_ms': _percentiles(first_tokens),
+        'errors': {
+            'count': errors,
+            'rate': round(errors / len(results), 4) if results else 0.0,
+            'by_status': by_status
+        }
+    }
+    
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
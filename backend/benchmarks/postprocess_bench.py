@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+输出后处理基准测试
+
+对一篇带开头客套话、Markdown代码块标记、多余emoji和空行的模拟日记，分别测量:
+- 阻塞生成：一次处理完整输出（post_process）
+- 流式生成：按不同分段大小逐段处理（post_process_stream），模拟上游逐段返回
+- 对照：原Gemini服务只清理代码块标记的find实现
+
+用法:
+    python benchmarks/postprocess_bench.py --runs 2000 --output postprocess.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.post_processor import post_process, post_process_stream  # noqa: E402
+
+PARAGRAPH = (
+    '今天他给我买了奶茶🧋，还记得我要少糖😊。我们沿着河边慢慢走，晚风吹过来，'
+    '他把外套披在我身上✨。   \n\n\n路灯一盏一盏亮起来，我突然觉得，'
+    '所谓幸福大概就是这样平平淡淡的小事吧❤️🌙 \n\n'
+)
+
+SAMPLE = (
+    '这是根据您的要求生成的日记：\n\n```markdown\n# 奶茶与晚风\n\n'
+    + PARAGRAPH * 6
+    + '```\n希望你喜欢这篇日记！'
+)
+
+
+def _legacy_fence(text):
+    """原GeminiService.generate中的代码块清理，作为对照"""
+    if "```markdown" in text:
+        start = text.find("```markdown") + 11
+        end = text.find("```", start)
+        return text[start:end].strip()
+    if "```" in text:
+        start = text.find("```") + 3
+        end = text.find("```", start)
+        return text[start:end].strip()
+    return text
+
+
+def _chunks(text, size):
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+def _measure(fn, runs):
+    """返回每次调用的耗时样本（微秒）"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def _summary(values, count=1):
+    """耗时分布，count为每次调用处理的分段数"""
+    return {
+        'median_us': round(statistics.median(values), 2),
+        'p95_us': round(sorted(values)[int(len(values) * 0.95)], 2),
+        'per_chunk_us': round(statistics.median(values) / count, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='输出后处理基准测试')
+    parser.add_argument('--runs', type=int, default=2000, help='每项测量次数')
+    parser.add_argument('--chunk-sizes', default='4,16,64', help='流式分段大小（字符数），逗号分隔')
+    parser.add_argument('--max-emojis', type=int, default=3, help='emoji数量上限')
+    parser.add_argument('--output', help='结果JSON输出路径，默认输出到stdout')
+    args = parser.parse_args()
+    
+    expected = post_process(SAMPLE, args.max_emojis)
+    cases = {
+        'legacy_fence': _summary(_measure(lambda: _legacy_fence(SAMPLE), args.runs)),
+        'blocking': _summary(_measure(lambda: post_process(SAMPLE, args.max_emojis), args.runs))
+    }
+    
+    for size in [int(value) for value in args.chunk_sizes.split(',')]:
+        chunks = _chunks(SAMPLE, size)
+        streamed = ''.join(post_process_stream(chunks, args.max_emojis))
+        if streamed != expected:
+            raise SystemExit(f'streaming output with chunk size {size} differs from blocking output')
+        samples = _measure(lambda: list(post_process_stream(chunks, args.max_emojis)), args.runs)
+        cases[f'stream_{size}'] = {**_summary(samples, len(chunks)), 'chunks': len(chunks)}
+    
+    result = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'input_chars': len(SAMPLE),
+        'output_chars': len(expected),
+        'cases': cases
+    }
+    
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+冷启动耗时基准测试
+
+每轮在全新的Python进程中分别测量:
+- 导入 services.ai_service_factory 及构造 AIServiceFactory 的耗时
+- 导入 app（含Flask和工厂初始化）的总耗时，以及 -X importtime 统计的最慢模块
+
+用法:
+    python benchmarks/startup_bench.py --runs 10 --output startup.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FACTORY_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+from services.ai_service_factory import AIServiceFactory
+t1 = time.perf_counter()
+AIServiceFactory()
+t2 = time.perf_counter()
+print(json.dumps({'factory_import': t1 - t0, 'factory_init': t2 - t1}))
+"""
+
+APP_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import {module}
+print(json.dumps({{'app_import': time.perf_counter() - t0}}))
+"""
+
+
+def _run(snippet, importtime=False):
+    """在新进程中执行代码片段，返回 (测量结果, stderr)"""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', snippet]
+    
+    env = {**os.environ, 'AI_PROBE_INTERVAL': '0', 'LOG_LEVEL': 'ERROR'}
+    completed = subprocess.run(
+        command, cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def _parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 {顶层模块: 累计耗时(微秒)}"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not cumulative_us.strip().isdigit():
+            continue
+        # importtime用缩进表示嵌套层级，只统计顶层导入
+        if name.startswith('  '):
+            continue
+        name = name.strip()
+        cumulative[name] = cumulative.get(name, 0) + int(cumulative_us)
+    return cumulative
+
+
+def _summary(values):
+    return {
+        'min': round(min(values) * 1000, 2),
+        'median': round(statistics.median(values) * 1000, 2),
+        'mean': round(statistics.mean(values) * 1000, 2),
+        'max': round(max(values) * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='冷启动耗时基准测试')
+    parser.add_argument('--runs', type=int, default=10, help='测量轮数')
+    parser.add_argument('--module', default='app', help='要导入的入口模块')
+    parser.add_argument('--top', type=int, default=10, help='输出最慢的N个顶层导入')
+    parser.add_argument('--output', help='结果JSON输出路径，默认输出到stdout')
+    args = parser.parse_args()
+    
+    samples = {'factory_import': [], 'factory_init': [], 'app_import': []}
+    imports = {}
+    
+    for _ in range(args.runs):
+        factory_result, _ = _run(FACTORY_SNIPPET)
+        app_result, stderr = _run(APP_SNIPPET.format(module=args.module), importtime=True)
+        
+        for key, value in {**factory_result, **app_result}.items():
+            samples[key].append(value)
+        for name, micros in _parse_importtime(stderr).items():
+            imports.setdefault(name, []).append(micros)
+    
+    slowest = sorted(imports.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    result = {
+        'python': sys.version.split()[0],
+        'module': args.module,
+        'runs': args.runs,
+        'unit': 'ms',
+        'phases': {key: _summary(values) for key, values in samples.items()},
+        'top_imports': [
+            {'module': name, 'median_ms': round(statistics.median(micros) / 1000, 2)}
+            for name, micros in slowest[:args.top]
+        ]
+    }
+    
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
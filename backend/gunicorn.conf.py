@@ -0,0 +1,78 @@
+"""
+gunicorn生产环境配置
+
+启动方式:
+    gunicorn -c gunicorn.conf.py                     # Flask（app.py，gthread多线程工作进程）
+    SERVER_MODE=asgi gunicorn -c gunicorn.conf.py    # Quart（asgi.py，uvicorn异步工作进程）
+
+主进程预加载应用（AI服务工厂、SDK和Prompt模板）后再fork工作进程，工作进程共享
+已导入的模块，启动时只需重新创建SDK客户端和连接池。收到SIGTERM后停止接收新连接，
+最多等待GRACEFUL_TIMEOUT秒让进行中的生成（包括流式响应和异步任务）完成。
+"""
+
+import os
+import logging
+import multiprocessing
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 告知app.py由本配置预加载：后台线程不能跨fork，改为在post_fork中启动
+os.environ['SERVER_PRELOAD'] = 'true'
+
+logger = logging.getLogger('gunicorn.error')
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+
+wsgi_app = 'asgi:app' if SERVER_MODE == 'asgi' else 'app:app'
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 5000)}"
+preload_app = True
+
+# 生成请求的耗时几乎都在等待上游响应：少量进程 + 每进程大量线程（或异步事件循环），
+# 线程数默认与上游连接池大小一致。注意进程内缓存、限流额度和熔断状态按进程独立计算。
+worker_class = 'uvicorn.workers.UvicornWorker' if SERVER_MODE == 'asgi' else 'gthread'
+workers = int(os.getenv('WEB_WORKERS', max(2, min(multiprocessing.cpu_count(), 4))))
+threads = int(os.getenv('WEB_THREADS', os.getenv('HTTP_POOL_MAX_CONNECTIONS', 32)))
+
+# 异步任务默认只保存在提交它的工作进程内存中，查询请求落到其他工作进程时会返回404；
+# 多进程时默认使用共享的SQLite文件，各进程都能查询和接管彼此的任务
+if workers > 1 and not os.getenv('JOB_QUEUE_DB'):
+    os.environ['JOB_QUEUE_DB'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.db')
+
+# gthread由主线程发送心跳，timeout只在工作进程卡死时生效，不限制单个请求的耗时
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', float(os.getenv('API_TIMEOUT', 60)) + 30))
+keepalive = int(os.getenv('WEB_KEEPALIVE', 5))
+
+accesslog = os.getenv('WEB_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'INFO').lower()
+
+
+def when_ready(server):
+    """fork前在主进程中加载Prompt模板和配置，工作进程直接继承"""
+    from utils.prompt_builder import PromptBuilder
+    
+    PromptBuilder.templates.reload()
+    logger.info(f"Preloaded {wsgi_app}, spawning {workers} {worker_class} workers, "
+                f"job queue: {os.getenv('JOB_QUEUE_DB') or 'in memory'}")
+
+
+def post_fork(server, worker):
+    """工作进程启动：重新创建SDK客户端和连接池，启动后台线程
+    
+    各工作进程通过SQLite中的任务租约接管已退出进程（崩溃、重启或HUP重载）未完成的异步任务，
+    同一任务只会被一个进程接管。
+    """
+    import app
+    
+    app.ai_factory.after_fork()
+    app.start_background_tasks()
+
+
+def worker_exit(server, worker):
+    """工作进程退出：等待执行中的异步任务完成"""
+    import app
+    
+    app.job_queue.stop(timeout=graceful_timeout)
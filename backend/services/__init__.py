@@ -2,17 +2,115 @@
 AI服务基类
 """
 
+import os
+import asyncio
+import logging
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator, List, Optional
+
+from utils.metrics import record_token_usage
+from utils.timing import bind
+
+logger = logging.getLogger(__name__)
+
+# 没有原生异步客户端的服务在此有界线程池中执行阻塞调用
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('AI_EXECUTOR_WORKERS', 32)),
+    thread_name_prefix='ai-service'
+)
 
 
 class AIService(ABC):
     """AI服务抽象基类"""
     
+    # 提供商名称，用于监控指标的标签
+    name = ''
+    
+    # generate_n是否在一次请求中原生采样多个候选（限流时只计一次请求）
+    native_variants = False
+    
     @abstractmethod
     def generate(self, prompt: str) -> str:
         """生成文本"""
         pass
     
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """流式生成文本，逐段返回增量内容
+        
+        默认实现一次性返回完整结果，支持流式输出的服务应重写此方法。
+        """
+        yield self.generate(prompt)
+    
+    async def agenerate(self, prompt: str) -> str:
+        """异步生成文本
+        
+        默认实现在有界线程池中执行同步的generate，有原生异步客户端的服务应重写此方法。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, bind(self.generate, prompt))
+    
+    async def agenerate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """异步流式生成文本
+        
+        默认实现在有界线程池中逐段迭代同步的generate_stream。
+        """
+        loop = asyncio.get_running_loop()
+        iterator = self.generate_stream(prompt)
+        sentinel = object()
+        
+        while True:
+            delta = await loop.run_in_executor(_executor, next, iterator, sentinel)
+            if delta is sentinel:
+                break
+            yield delta
+    
+    def generate_n(self, prompt: str, n: int) -> List[str]:
+        """生成n个候选文本
+        
+        默认实现在线程池中并行调用n次generate，部分调用失败时记录警告并返回成功的结果，
+        全部失败时抛出首个异常。支持原生多候选采样的服务应重写此方法。
+        """
+        futures = [_executor.submit(bind(self.generate, prompt)) for _ in range(n - 1)]
+        results, errors = [], []
+        try:
+            results.append(self.generate(prompt))
+        except Exception as e:
+            errors.append(e)
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors.append(e)
+        
+        return self._collect_variants(results, errors, n)
+    
+    async def agenerate_n(self, prompt: str, n: int) -> List[str]:
+        """异步生成n个候选文本，默认实现并发调用n次agenerate"""
+        outcomes = await asyncio.gather(*(self.agenerate(prompt) for _ in range(n)), return_exceptions=True)
+        results = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        return self._collect_variants(results, errors, n)
+    
+    def _collect_variants(self, results: List[str], errors: List[BaseException], n: int) -> List[str]:
+        """汇总多候选调用的结果，全部失败时抛出首个异常，部分失败时记录每个失败调用的原因"""
+        if not results:
+            raise errors[0]
+        for error in errors:
+            logger.warning(f"{self.name} variant call failed ({len(errors)}/{n} failed): {error}")
+        return results
+    
+    def probe(self):
+        """探测服务的真实连通性，失败时抛出异常
+        
+        默认实现发起一次最小生成，服务应尽量重写为不消耗token的轻量请求。
+        """
+        self.generate('ping')
+    
+    def _record_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        """记录提供商响应中返回的token用量"""
+        record_token_usage(self.name, self.get_model_name(), prompt_tokens, completion_tokens)
+    
     @abstractmethod
     def is_available(self) -> bool:
         """检查服务是否可用"""
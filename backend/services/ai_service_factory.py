@@ -2,41 +2,150 @@
 AI服务工厂
 """
 
+import os
+import time
+import asyncio
 import logging
+import threading
+from typing import AsyncIterator, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from services import http_pool
 from services.gemini_service import GeminiService
 from services.openai_service import OpenAIService
 from services.claude_service import ClaudeService
+from services.replay_service import ReplayService
+from services.latency_tracker import LatencyTracker
+from services.circuit_breaker import CircuitBreaker
+from services.health_prober import HealthProber
+from services.provider_router import ProviderRouter
+from services.rate_limiter import RateLimiter, RateLimitExceeded, retry_after_from
+from utils.metrics import track_generation
+from utils.timing import bind, phase
+from utils.token_budget import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+SERVICE_CLASSES = {
+    'gemini': GeminiService,
+    'openai': OpenAIService,
+    'claude': ClaudeService,
+    'replay': ReplayService  # 录制/回放，通过REPLAY_MODE启用
+}
+
+# 提供商优先顺序，对冲和故障转移按此顺序选择备用提供商
+PROVIDER_ORDER = [
+    name.strip() for name in os.getenv('AI_FALLBACK_ORDER', 'gemini,openai,claude').split(',')
+    if name.strip()
+]
+
+# provider参数取该值时由路由器按实时表现选择提供商
+AUTO_PROVIDER = 'auto'
+
 
 class AIServiceFactory:
     """AI服务工厂类"""
     
     def __init__(self):
         self._services = {}
+        self._latency = LatencyTracker(window=int(os.getenv('AI_LATENCY_WINDOW', 200)))
+        
+        # 对冲请求配置：主提供商超过p95延迟仍未返回时，向备用提供商再发一次请求
+        self.hedge_enabled = os.getenv('AI_HEDGE_ENABLED', 'false').lower() == 'true'
+        self.hedge_percentile = float(os.getenv('AI_HEDGE_PERCENTILE', 95))
+        self.hedge_default_delay = float(os.getenv('AI_HEDGE_DELAY', 8))
+        self.hedge_min_delay = float(os.getenv('AI_HEDGE_MIN_DELAY', 1))
+        self.hedge_min_samples = int(os.getenv('AI_HEDGE_MIN_SAMPLES', 20))
+        self._hedge_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('AI_HEDGE_WORKERS', 32)),
+            thread_name_prefix='ai-hedge'
+        )
+        self._hedge_stats = {'fired': 0, 'won': 0}
+        self._hedge_lock = threading.Lock()  # 对冲在多个请求线程中同时发生
+        
+        # 故障转移与熔断配置
+        self.failover_enabled = os.getenv('AI_FAILOVER_ENABLED', 'true').lower() == 'true'
+        self._breakers = {
+            name: CircuitBreaker(
+                name,
+                failure_rate_threshold=float(os.getenv('AI_BREAKER_FAILURE_RATE', 0.5)),
+                window=int(os.getenv('AI_BREAKER_WINDOW', 20)),
+                min_calls=int(os.getenv('AI_BREAKER_MIN_CALLS', 5)),
+                reset_timeout=float(os.getenv('AI_BREAKER_RESET_TIMEOUT', 30)),
+                slow_call_threshold=float(os.getenv('AI_BREAKER_SLOW_CALL', 30))
+            )
+            for name in SERVICE_CLASSES
+        }
+        
+        # 客户端限流：按 RATE_LIMIT_<PROVIDER>_RPM/_TPM 限制请求数和估算token数，为0时不限
+        self.rate_limit_completion_tokens = int(os.getenv('RATE_LIMIT_COMPLETION_TOKENS', 800))
+        self._limiters = {
+            name: RateLimiter(
+                name,
+                rpm=float(os.getenv(f'RATE_LIMIT_{name.upper()}_RPM', 0)),
+                tpm=float(os.getenv(f'RATE_LIMIT_{name.upper()}_TPM', 0)),
+                max_wait=float(os.getenv('RATE_LIMIT_MAX_WAIT', 10)),
+                burst_seconds=float(os.getenv('RATE_LIMIT_BURST_SECONDS', 1))
+            )
+            for name in SERVICE_CLASSES
+        }
+        
+        # provider: "auto" 的自适应路由：按真实调用的EWMA延迟、错误率和成本权重选择提供商
+        self._router = ProviderRouter(
+            alpha=float(os.getenv('AI_AUTO_EWMA_ALPHA', 0.2)),
+            error_penalty=float(os.getenv('AI_AUTO_ERROR_PENALTY', 4)),
+            cost_weights=ProviderRouter.parse_weights(os.getenv('AI_AUTO_COST_WEIGHTS', '')),
+            explore_rate=float(os.getenv('AI_AUTO_EXPLORE_RATE', 0.05)),
+            explore_interval=float(os.getenv('AI_AUTO_EXPLORE_INTERVAL', 300)),
+            min_samples=int(os.getenv('AI_AUTO_MIN_SAMPLES', 3))
+        )
+        
         self._initialize_services()
+        
+        # 后台健康探测，快照供健康检查接口和路由决策使用
+        self._prober = HealthProber(
+            self._services,
+            list(SERVICE_CLASSES),
+            interval=float(os.getenv('AI_PROBE_INTERVAL', 60)),
+            timeout=float(os.getenv('AI_PROBE_TIMEOUT', 10))
+        )
     
     def _initialize_services(self):
-        """初始化所有服务"""
-        try:
-            self._services['gemini'] = GeminiService()
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini service: {e}")
+        """并行初始化所有服务（各服务仅在配置了API Key时导入对应SDK）"""
+        with ThreadPoolExecutor(max_workers=len(SERVICE_CLASSES), thread_name_prefix='ai-init') as executor:
+            futures = {
+                name: executor.submit(service_class)
+                for name, service_class in SERVICE_CLASSES.items()
+            }
         
-        try:
-            self._services['openai'] = OpenAIService()
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenAI service: {e}")
+        for name, future in futures.items():
+            try:
+                self._services[name] = future.result()
+            except Exception as e:
+                logger.error(f"Failed to initialize {name} service: {e}")
+    
+    def resolve_provider(self, provider: str) -> str:
+        """将 "auto" 解析为路由器当前选择的提供商，其他提供商名称原样返回
         
-        try:
-            self._services['claude'] = ClaudeService()
-        except Exception as e:
-            logger.error(f"Failed to initialize Claude service: {e}")
+        候选为AI_FALLBACK_ORDER中可用、探测可达且未熔断的提供商，全部不满足时
+        退回第一个可用的提供商。
+        """
+        provider = provider.lower()
+        if provider != AUTO_PROVIDER:
+            return provider
+        
+        configured = self.get_available_providers()
+        available = [name for name in PROVIDER_ORDER if name in configured]
+        choice = self._router.choose(
+            name for name in available
+            if self._prober.is_reachable(name) and self._breakers[name].state == CircuitBreaker.CLOSED
+        )
+        if choice is None and not available:
+            raise ValueError("没有可用的AI提供商，请检查API Key配置")
+        return choice or available[0]
     
     def get_service(self, provider: str):
-        """获取指定的AI服务"""
-        provider = provider.lower()
+        """获取指定的AI服务，provider为 "auto" 时由路由器选择"""
+        provider = self.resolve_provider(provider)
         
         if provider not in self._services:
             raise ValueError(f"不支持的AI提供商: {provider}")
@@ -54,3 +163,388 @@ class AIServiceFactory:
             name for name, service in self._services.items()
             if service.is_available()
         ]
+    
+    def generate(self, provider: str, prompt: str, hedge: bool = None, fallback: bool = None):
+        """通过指定提供商生成文本，返回 (文本, 实际使用的提供商, 模型)
+        
+        按故障转移链依次尝试，熔断中的提供商直接跳过。
+        hedge/fallback为None时使用工厂的默认配置。
+        """
+        error = None
+        tried = []
+        
+        for name in self._provider_chain(provider, fallback):
+            if not self._breakers[name].allow_request():
+                logger.warning(f"Circuit for {name} is open, skipping")
+                continue
+            
+            tried.append(name)
+            backup = self._hedge_candidate(name, exclude=tried) if self._should_hedge(hedge) else None
+            try:
+                if backup is None:
+                    return self._timed_generate(name, self._services[name], prompt)
+                return self._generate_hedged(name, backup, prompt)
+            except Exception as e:
+                logger.warning(f"{name} generation failed: {e}")
+                error = e
+        
+        raise error or Exception("所有AI提供商暂时不可用，请稍后重试")
+    
+    async def agenerate(self, provider: str, prompt: str, hedge: bool = None, fallback: bool = None):
+        """异步生成文本，返回 (文本, 实际使用的提供商, 模型)"""
+        error = None
+        tried = []
+        
+        for name in self._provider_chain(provider, fallback):
+            if not self._breakers[name].allow_request():
+                logger.warning(f"Circuit for {name} is open, skipping")
+                continue
+            
+            tried.append(name)
+            backup = self._hedge_candidate(name, exclude=tried) if self._should_hedge(hedge) else None
+            try:
+                if backup is None:
+                    return await self._atimed_generate(name, self._services[name], prompt)
+                return await self._agenerate_hedged(name, backup, prompt)
+            except Exception as e:
+                logger.warning(f"{name} generation failed: {e}")
+                error = e
+        
+        raise error or Exception("所有AI提供商暂时不可用，请稍后重试")
+    
+    def generate_stream(self, provider: str, prompt: str) -> Iterator[str]:
+        """经限流后通过指定提供商流式生成，返回逐段产出增量内容的迭代器
+        
+        限流在调用时即执行，超过等待期限直接抛出RateLimitExceeded，接口可在发送响应头前返回429；
+        熔断检查和上游调用在开始迭代时执行。流式输出已开始后无法切换提供商，不做对冲和故障转移，
+        输出结束后与阻塞调用一样记录延迟分位数、熔断、限流和自动路由统计。
+        """
+        provider = self.resolve_provider(provider)
+        service = self.get_service(provider)
+        with phase('ratelimit'):
+            self._limiters[provider].acquire(self._estimate_tokens(prompt))
+        return self._stream(provider, service, prompt)
+    
+    async def agenerate_stream(self, provider: str, prompt: str) -> AsyncIterator[str]:
+        """经限流后异步流式生成，返回逐段产出增量内容的异步迭代器"""
+        provider = self.resolve_provider(provider)
+        service = self.get_service(provider)
+        with phase('ratelimit'):
+            await self._limiters[provider].aacquire(self._estimate_tokens(prompt))
+        return self._astream(provider, service, prompt)
+    
+    def generate_variants(self, provider: str, prompt: str, n: int, fallback: bool = None):
+        """生成n个候选版本，返回 (文本列表, 实际使用的提供商, 模型)
+        
+        支持原生多候选采样的提供商只发一次请求，其他提供商并行调用n次；不使用对冲。
+        """
+        error = None
+        
+        for name in self._provider_chain(provider, fallback):
+            if not self._breakers[name].allow_request():
+                logger.warning(f"Circuit for {name} is open, skipping")
+                continue
+            
+            try:
+                return self._timed_generate(name, self._services[name], prompt, n)
+            except Exception as e:
+                logger.warning(f"{name} variant generation failed: {e}")
+                error = e
+        
+        raise error or Exception("所有AI提供商暂时不可用，请稍后重试")
+    
+    async def agenerate_variants(self, provider: str, prompt: str, n: int, fallback: bool = None):
+        """异步生成n个候选版本，返回 (文本列表, 实际使用的提供商, 模型)"""
+        error = None
+        
+        for name in self._provider_chain(provider, fallback):
+            if not self._breakers[name].allow_request():
+                logger.warning(f"Circuit for {name} is open, skipping")
+                continue
+            
+            try:
+                return await self._atimed_generate(name, self._services[name], prompt, n)
+            except Exception as e:
+                logger.warning(f"{name} variant generation failed: {e}")
+                error = e
+        
+        raise error or Exception("所有AI提供商暂时不可用，请稍后重试")
+    
+    def after_fork(self):
+        """在预加载后fork出的工作进程中调用：重新创建连接池和各SDK客户端
+        
+        熔断、限流和延迟统计保留父进程的初始状态，健康探测线程需在子进程中重新启动。
+        """
+        http_pool.reset()
+        self._initialize_services()
+    
+    def start_health_prober(self):
+        """启动后台健康探测（AI_PROBE_INTERVAL为0时不启动）"""
+        if self._prober.interval > 0:
+            self._prober.start()
+    
+    def get_health_snapshot(self):
+        """获取最近一次健康探测的快照"""
+        return self._prober.snapshot()
+    
+    def get_circuit_stats(self, provider: str):
+        """获取提供商的熔断器状态"""
+        return self._breakers[provider.lower()].stats()
+    
+    def get_rate_limit_stats(self, provider: str):
+        """获取提供商的限流统计"""
+        return self._limiters[provider.lower()].stats()
+    
+    def get_routing_stats(self):
+        """获取 provider: "auto" 的路由统计"""
+        return self._router.stats()
+    
+    def hedge_delay(self, provider: str) -> float:
+        """计算对冲等待时间：样本充足时取延迟分位数，否则使用默认值"""
+        if self._latency.count(provider) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        
+        delay = self._latency.percentile(provider, self.hedge_percentile)
+        return max(self.hedge_min_delay, delay)
+    
+    def get_hedge_stats(self):
+        """获取对冲请求统计"""
+        with self._hedge_lock:
+            hedge_stats = dict(self._hedge_stats)
+        return {
+            'enabled': self.hedge_enabled,
+            'fired': hedge_stats['fired'],
+            'won': hedge_stats['won'],
+            'delays': {
+                name: round(self.hedge_delay(name), 3)
+                for name in self.get_available_providers()
+            }
+        }
+    
+    def _count_hedge(self, key: str):
+        with self._hedge_lock:
+            self._hedge_stats[key] += 1
+    
+    def _should_hedge(self, hedge):
+        return self.hedge_enabled if hedge is None else bool(hedge)
+    
+    def _provider_chain(self, provider: str, fallback: bool = None):
+        """构建故障转移链：请求的提供商在前，其余可用提供商按优先顺序在后"""
+        provider = self.resolve_provider(provider)
+        self.get_service(provider)
+        
+        if not (self.failover_enabled if fallback is None else bool(fallback)):
+            return [provider]
+        
+        return [provider] + [
+            name for name in PROVIDER_ORDER
+            if name != provider and name in self.get_available_providers()
+            and self._prober.is_reachable(name)
+        ]
+    
+    def _hedge_candidate(self, provider: str, exclude=()):
+        """按优先顺序选择第一个可用且未熔断的备用提供商"""
+        for name in PROVIDER_ORDER:
+            if name == provider or name in exclude:
+                continue
+            service = self._services.get(name)
+            if (service is not None and service.is_available()
+                    and self._prober.is_reachable(name)
+                    and self._breakers[name].state == CircuitBreaker.CLOSED):
+                return name
+        return None
+    
+    def _timed_generate(self, provider: str, service, prompt: str, n: int = 1):
+        """经限流后调用服务生成，记录延迟、熔断器和限流结果；n大于1时生成候选列表"""
+        try:
+            with phase('ratelimit'):
+                self._limiters[provider].acquire(
+                    self._estimate_tokens(prompt) * n, requests=1 if service.native_variants else n
+                )
+        except RateLimitExceeded:
+            self._breakers[provider].release_probe()
+            raise
+        
+        start = time.monotonic()
+        try:
+            with track_generation(provider, service.get_model_name()), \
+                    phase('upstream', exclude=('queue',)):
+                generated_text = service.generate(prompt) if n == 1 else service.generate_n(prompt, n)
+        except Exception as e:
+            throttled = self._record_generate_failure(provider, e)
+            if throttled is None:
+                raise
+            raise throttled from e
+        
+        latency = time.monotonic() - start
+        self._record_generate_success(provider, latency, n)
+        return generated_text, provider, service.get_model_name()
+    
+    async def _atimed_generate(self, provider: str, service, prompt: str, n: int = 1):
+        """经限流后异步调用服务生成，记录延迟、熔断器和限流结果；n大于1时生成候选列表"""
+        try:
+            with phase('ratelimit'):
+                await self._limiters[provider].aacquire(
+                    self._estimate_tokens(prompt) * n, requests=1 if service.native_variants else n
+                )
+        except (RateLimitExceeded, asyncio.CancelledError):
+            self._breakers[provider].release_probe()
+            raise
+        
+        start = time.monotonic()
+        try:
+            with track_generation(provider, service.get_model_name()), \
+                    phase('upstream', exclude=('queue',)):
+                if n == 1:
+                    generated_text = await service.agenerate(prompt)
+                else:
+                    generated_text = await service.agenerate_n(prompt, n)
+        except asyncio.CancelledError:
+            # 对冲落败被取消，不计入熔断结果
+            self._breakers[provider].release_probe()
+            raise
+        except Exception as e:
+            throttled = self._record_generate_failure(provider, e)
+            if throttled is None:
+                raise
+            raise throttled from e
+        
+        latency = time.monotonic() - start
+        self._record_generate_success(provider, latency, n)
+        return generated_text, provider, service.get_model_name()
+    
+    def _stream(self, provider: str, service, prompt: str) -> Iterator[str]:
+        """流式调用服务，记录熔断器、延迟和限流结果；客户端中途断开时不计入结果"""
+        if not self._breakers[provider].allow_request():
+            raise Exception(f"{provider} 暂时不可用，请稍后重试")
+        
+        start = time.monotonic()
+        try:
+            yield from service.generate_stream(prompt)
+        except GeneratorExit:
+            self._breakers[provider].release_probe()
+            raise
+        except Exception as e:
+            throttled = self._record_generate_failure(provider, e)
+            if throttled is None:
+                raise
+            raise throttled from e
+        self._record_generate_success(provider, time.monotonic() - start)
+    
+    async def _astream(self, provider: str, service, prompt: str) -> AsyncIterator[str]:
+        """异步流式调用服务，记录熔断器、延迟和限流结果"""
+        if not self._breakers[provider].allow_request():
+            raise Exception(f"{provider} 暂时不可用，请稍后重试")
+        
+        start = time.monotonic()
+        try:
+            async for delta in service.agenerate_stream(prompt):
+                yield delta
+        except (GeneratorExit, asyncio.CancelledError):
+            self._breakers[provider].release_probe()
+            raise
+        except Exception as e:
+            throttled = self._record_generate_failure(provider, e)
+            if throttled is None:
+                raise
+            raise throttled from e
+        self._record_generate_success(provider, time.monotonic() - start)
+    
+    def _estimate_tokens(self, prompt: str) -> int:
+        """估算一次调用消耗的token数（Prompt加预期的输出长度）"""
+        return estimate_tokens(prompt) + self.rate_limit_completion_tokens
+    
+    def _record_generate_success(self, provider: str, latency: float, n: int = 1):
+        """记录成功调用的延迟；多候选调用的耗时与单次不可比，不计入路由统计"""
+        self._latency.record(provider, latency)
+        self._breakers[provider].record_success(latency)
+        self._limiters[provider].record_success()
+        if n == 1:
+            self._router.record_success(provider, latency)
+    
+    def _record_generate_failure(self, provider: str, error: Exception):
+        """记录失败调用，上游429时返回应改为抛出的RateLimitExceeded
+        
+        上游429是配额问题而非服务故障，不计入熔断，改为按Retry-After调整限流速率，
+        由接口返回429而不是500。
+        """
+        self._router.record_failure(provider)
+        retry_after = retry_after_from(error)
+        if retry_after is None:
+            self._breakers[provider].record_failure()
+            return None
+        
+        self._breakers[provider].release_probe()
+        self._limiters[provider].record_throttled(retry_after)
+        return RateLimitExceeded(f"{provider} 上游限流: {error}", retry_after)
+    
+    def _generate_hedged(self, provider: str, backup: str, prompt: str):
+        """对冲生成：主提供商超时未返回时并行请求备用提供商，先成功者胜出
+        
+        同步调用无法中断，落败请求会在后台线程中运行到结束，其结果被丢弃。
+        """
+        futures = {
+            self._hedge_executor.submit(
+                bind(self._timed_generate, provider, self._services[provider], prompt)
+            ): provider
+        }
+        
+        done, _ = wait(futures, timeout=self.hedge_delay(provider))
+        if not done:
+            logger.info(f"Hedging {provider} request to {backup}")
+            self._count_hedge('fired')
+            futures[self._hedge_executor.submit(
+                bind(self._timed_generate, backup, self._services[backup], prompt)
+            )] = backup
+        
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                
+                for loser in pending:
+                    loser.cancel()
+                if futures[future] != provider:
+                    self._count_hedge('won')
+                return future.result()
+        
+        raise error
+    
+    async def _agenerate_hedged(self, provider: str, backup: str, prompt: str):
+        """异步对冲生成：先成功者胜出，落败的请求被取消"""
+        tasks = {
+            asyncio.ensure_future(
+                self._atimed_generate(provider, self._services[provider], prompt)
+            ): provider
+        }
+        
+        done, _ = await asyncio.wait(set(tasks), timeout=self.hedge_delay(provider))
+        if not done:
+            logger.info(f"Hedging {provider} request to {backup}")
+            self._count_hedge('fired')
+            tasks[asyncio.ensure_future(
+                self._atimed_generate(backup, self._services[backup], prompt)
+            )] = backup
+        
+        pending = set(tasks)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    
+                    if tasks[task] != provider:
+                        self._count_hedge('won')
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        raise error
@@ -0,0 +1,118 @@
+"""
+提供商熔断器
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器
+    
+    closed: 正常放行，统计最近调用的失败率（超过慢调用阈值也计为失败）
+    open: 失败率超过阈值后熔断，直接拒绝请求，reset_timeout秒后进入half_open
+    half_open: 只放行一个探测请求，成功则恢复closed，失败则重新open
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, window: int = 20,
+                 min_calls: int = 5, reset_timeout: float = 30, slow_call_threshold: float = 30):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self._outcomes = deque(maxlen=window)  # True表示失败
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        """当前状态"""
+        with self._lock:
+            self._refresh()
+            return self._state
+    
+    def allow_request(self) -> bool:
+        """判断是否放行请求，half_open状态下只放行一个探测请求"""
+        with self._lock:
+            self._refresh()
+            
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+    
+    def record_success(self, latency: Optional[float] = None):
+        """记录一次成功调用，超过慢调用阈值按失败计"""
+        if latency is not None and latency > self.slow_call_threshold:
+            logger.warning(f"Slow call on {self.name}: {latency:.1f}s")
+            self.record_failure()
+            return
+        
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                logger.info(f"Circuit for {self.name} closed")
+                self._state = self.CLOSED
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                return
+            
+            self._outcomes.append(False)
+    
+    def record_failure(self):
+        """记录一次失败调用"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trip()
+                return
+            
+            self._outcomes.append(True)
+            if (len(self._outcomes) >= self.min_calls
+                    and self._failure_rate() >= self.failure_rate_threshold):
+                self._trip()
+    
+    def release_probe(self):
+        """调用被取消且无结果时释放half_open探测名额"""
+        with self._lock:
+            self._probe_in_flight = False
+    
+    def stats(self) -> dict:
+        """获取熔断器统计信息"""
+        with self._lock:
+            self._refresh()
+            return {
+                'state': self._state,
+                'calls': len(self._outcomes),
+                'failure_rate': round(self._failure_rate(), 4)
+            }
+    
+    def _failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+    
+    def _refresh(self):
+        """open状态超过reset_timeout后转为half_open"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+    
+    def _trip(self):
+        logger.warning(f"Circuit for {self.name} opened")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
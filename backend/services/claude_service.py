@@ -4,9 +4,9 @@ Claude AI服务实现
 
 import os
 import logging
-from anthropic import Anthropic
+from typing import AsyncIterator, Iterator
 
-from services import AIService
+from services import AIService, http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -14,33 +14,53 @@ logger = logging.getLogger(__name__)
 class ClaudeService(AIService):
     """Claude AI服务实现"""
     
+    name = 'claude'
+    
     def __init__(self):
         self.api_key = os.getenv('CLAUDE_API_KEY')
+        self.base_url = os.getenv('CLAUDE_BASE_URL')  # 可指向兼容接口或本地压测服务
         self.model_name = 'claude-3-sonnet-20240229'
         self.client = None
+        self.async_client = None
         
         if self.api_key:
             try:
-                self.client = Anthropic(api_key=self.api_key)
+                # 仅在配置了API Key时导入SDK，减少冷启动时间
+                from anthropic import Anthropic, AsyncAnthropic
+                
+                # 使用共享连接池，复用到API的长连接
+                self.client = Anthropic(
+                    api_key=self.api_key, base_url=self.base_url,
+                    http_client=http_pool.sync_client(), timeout=http_pool.timeout()
+                )
+                self.async_client = AsyncAnthropic(
+                    api_key=self.api_key, base_url=self.base_url,
+                    http_client=http_pool.async_client(), timeout=http_pool.timeout()
+                )
                 logger.info("Claude service initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Claude: {e}")
         else:
             logger.warning("CLAUDE_API_KEY not found in environment")
     
+    def _build_request(self, prompt: str) -> dict:
+        """构建请求参数"""
+        return {
+            'model': self.model_name,
+            'max_tokens': 1024,
+            'messages': [
+                {"role": "user", "content": prompt}
+            ]
+        }
+    
     def generate(self, prompt: str) -> str:
         """使用Claude生成文本"""
         if not self.client:
             raise ValueError("Claude service is not properly initialized")
         
         try:
-            message = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=1024,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            message = self.client.messages.create(**self._build_request(prompt))
+            self._record_usage(message.usage.input_tokens, message.usage.output_tokens)
             
             return message.content[0].text
             
@@ -48,6 +68,87 @@ class ClaudeService(AIService):
             logger.error(f"Claude generation error: {e}")
             raise Exception(f"Claude生成失败: {str(e)}")
     
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """使用Claude流式生成文本"""
+        if not self.client:
+            raise ValueError("Claude service is not properly initialized")
+        
+        try:
+            stream = self.client.messages.create(
+                **self._build_request(prompt),
+                stream=True
+            )
+            
+            for event in stream:
+                if event.type == 'content_block_delta' and event.delta.text:
+                    yield event.delta.text
+                else:
+                    self._record_stream_usage(event)
+                    
+        except Exception as e:
+            logger.error(f"Claude streaming error: {e}")
+            raise Exception(f"Claude生成失败: {str(e)}")
+    
+    async def agenerate(self, prompt: str) -> str:
+        """使用AsyncAnthropic异步生成文本"""
+        if not self.async_client:
+            raise ValueError("Claude service is not properly initialized")
+        
+        try:
+            message = await self.async_client.messages.create(**self._build_request(prompt))
+            self._record_usage(message.usage.input_tokens, message.usage.output_tokens)
+            
+            return message.content[0].text
+            
+        except Exception as e:
+            logger.error(f"Claude async generation error: {e}")
+            raise Exception(f"Claude生成失败: {str(e)}")
+    
+    async def agenerate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """使用AsyncAnthropic异步流式生成文本"""
+        if not self.async_client:
+            raise ValueError("Claude service is not properly initialized")
+        
+        try:
+            stream = await self.async_client.messages.create(
+                **self._build_request(prompt),
+                stream=True
+            )
+            
+            async for event in stream:
+                if event.type == 'content_block_delta' and event.delta.text:
+                    yield event.delta.text
+                else:
+                    self._record_stream_usage(event)
+                    
+        except Exception as e:
+            logger.error(f"Claude async streaming error: {e}")
+            raise Exception(f"Claude生成失败: {str(e)}")
+    
+    def _record_stream_usage(self, event):
+        """记录流式事件中的token用量：message_start含输入用量，message_delta含输出用量"""
+        if event.type == 'message_start':
+            self._record_usage(event.message.usage.input_tokens, None)
+        elif event.type == 'message_delta':
+            self._record_usage(None, event.usage.output_tokens)
+    
+    def probe(self):
+        """查询模型信息以探测连通性，不消耗token
+        
+        SDK提供models接口时直接使用；旧版SDK没有该接口，通过客户端发起同样的GET请求，
+        仍经过SDK的鉴权、重试和共享连接池，非2xx响应抛出SDK异常。
+        """
+        if not self.client:
+            raise ValueError("Claude service is not properly initialized")
+        
+        if hasattr(self.client, 'models'):
+            self.client.models.retrieve(self.model_name)
+            return
+        
+        import httpx
+        
+        self.client.get(f'/v1/models/{self.model_name}', cast_to=httpx.Response)
+    
     def is_available(self) -> bool:
         """检查Claude服务是否可用"""
         return self.client is not None and self.api_key is not None
@@ -4,9 +4,9 @@ Gemini AI服务实现
 
 import os
 import logging
-import google.generativeai as genai
+from typing import Iterator
 
-from services import AIService
+from services import AIService, http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -14,21 +14,51 @@ logger = logging.getLogger(__name__)
 class GeminiService(AIService):
     """Gemini AI服务实现"""
     
+    name = 'gemini'
+    
     def __init__(self):
         self.api_key = os.getenv('GEMINI_API_KEY')
+        self.api_endpoint = os.getenv('GEMINI_API_ENDPOINT')  # 可指向本地压测服务，如 http://127.0.0.1:8100
         self.model_name = 'gemini-2.0-flash-exp'
         self.model = None
+        self._genai = None
         
         if self.api_key:
             try:
-                genai.configure(api_key=self.api_key, transport='rest')
+                # 仅在配置了API Key时导入SDK，减少冷启动时间
+                import google.generativeai as genai
+                
+                # REST传输不支持异步调用，异步接口使用基类的线程池实现
+                client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+                genai.configure(api_key=self.api_key, transport='rest', client_options=client_options)
                 self.model = genai.GenerativeModel(self.model_name)
+                self._genai = genai
+                self._mount_http_pool()
                 logger.info("Gemini service initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize Gemini: {e}")
         else:
             logger.warning("GEMINI_API_KEY not found in environment")
     
+    def _mount_http_pool(self):
+        """为REST传输的requests会话挂载共享连接池
+        
+        SDK未提供注入会话的参数，只能从默认客户端的传输层取得会话，取不到时保留SDK默认配置。
+        """
+        try:
+            from google.generativeai import client as genai_client
+            
+            transport = getattr(genai_client.get_default_generative_client(), '_transport', None)
+            session = getattr(transport, '_session', None)
+            if session is None or not hasattr(session, 'mount'):
+                # gRPC传输或SDK内部结构变化时没有requests会话
+                logger.debug(f"Gemini transport {type(transport).__name__} has no requests session, "
+                             f"keeping SDK connection defaults")
+                return
+            http_pool.mount(session)
+        except Exception as e:
+            logger.warning(f"Failed to mount shared HTTP pool for Gemini: {e}")
+    
     def generate(self, prompt: str) -> str:
         """使用Gemini生成文本"""
         if not self.model:
@@ -36,24 +66,42 @@ class GeminiService(AIService):
         
         try:
             response = self.model.generate_content(prompt)
-            generated_text = response.text
-            
-            # 清理Markdown代码块标记
-            if "```markdown" in generated_text:
-                start = generated_text.find("```markdown") + 11
-                end = generated_text.find("```", start)
-                generated_text = generated_text[start:end].strip()
-            elif "```" in generated_text:
-                start = generated_text.find("```") + 3
-                end = generated_text.find("```", start)
-                generated_text = generated_text[start:end].strip()
-            
-            return generated_text
+            self._record_response_usage(response)
+            return response.text
             
         except Exception as e:
             logger.error(f"Gemini generation error: {e}")
             raise Exception(f"Gemini生成失败: {str(e)}")
     
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """使用Gemini流式生成文本"""
+        if not self.model:
+            raise ValueError("Gemini service is not properly initialized")
+        
+        try:
+            response = self.model.generate_content(prompt, stream=True)
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+            self._record_response_usage(response)
+            
+        except Exception as e:
+            logger.error(f"Gemini streaming error: {e}")
+            raise Exception(f"Gemini生成失败: {str(e)}")
+    
+    def _record_response_usage(self, response):
+        """记录响应中的token用量，流式响应在迭代结束后汇总（旧版SDK无此字段时跳过）"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self._record_usage(usage.prompt_token_count, usage.candidates_token_count)
+    
+    def probe(self):
+        """查询模型信息以探测连通性，不消耗token"""
+        if not self.model:
+            raise ValueError("Gemini service is not properly initialized")
+        
+        self._genai.get_model(f'models/{self.model_name}')
+    
     def is_available(self) -> bool:
         """检查Gemini服务是否可用"""
         return self.model is not None and self.api_key is not None
@@ -0,0 +1,125 @@
+"""
+后台提供商健康探测
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """后台定期探测各提供商的真实连通性和延迟
+    
+    探测结果保存为快照，每轮探测完成后整体替换，读取快照无需加锁。
+    """
+    
+    def __init__(self, services: dict, providers, interval: float = 60, timeout: float = 10):
+        self._services = services
+        self._providers = list(providers)
+        self.interval = interval
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self._providers)),
+            thread_name_prefix='health-probe'
+        )
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = {name: self._unprobed_entry(name) for name in self._providers}
+    
+    def start(self):
+        """启动后台探测线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='health-prober', daemon=True)
+        self._thread.start()
+        logger.info(f"Health prober started, interval: {self.interval}s")
+    
+    def stop(self):
+        """停止后台探测线程"""
+        self._stop.set()
+    
+    def snapshot(self) -> dict:
+        """获取最近一次探测的快照"""
+        return self._snapshot
+    
+    def is_reachable(self, provider: str) -> bool:
+        """提供商是否可达，尚未探测时视为可达"""
+        entry = self._snapshot.get(provider)
+        return entry is None or entry['reachable'] is not False
+    
+    def probe_once(self):
+        """并行探测所有提供商并替换快照"""
+        futures = {
+            name: self._executor.submit(self._probe, name)
+            for name in self._providers
+        }
+        wait(futures.values(), timeout=self.timeout)
+        
+        snapshot = {}
+        for name, future in futures.items():
+            if future.done():
+                snapshot[name] = future.result()
+            else:
+                snapshot[name] = {
+                    **self._unprobed_entry(name),
+                    'reachable': False,
+                    'checked_at': time.time(),
+                    'error': f'探测超时（{self.timeout}s）'
+                }
+        
+        self._snapshot = snapshot
+    
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.probe_once()
+            except Exception as e:
+                logger.error(f"Health probe failed: {e}", exc_info=True)
+            self._stop.wait(self.interval)
+    
+    def _unprobed_entry(self, name: str) -> dict:
+        """未探测时的快照条目，仅反映配置状态"""
+        service = self._services.get(name)
+        if service is None:
+            return {
+                'available': False,
+                'reachable': False,
+                'model': None,
+                'latency_ms': None,
+                'checked_at': None,
+                'error': f'{name} 服务初始化失败'
+            }
+        
+        available = service.is_available()
+        return {
+            'available': available,
+            'reachable': None if available else False,
+            'model': service.get_model_name(),
+            'latency_ms': None,
+            'checked_at': None,
+            'error': None if available else f'{name} 服务不可用，请检查API Key配置'
+        }
+    
+    def _probe(self, name: str) -> dict:
+        """探测单个提供商"""
+        entry = self._unprobed_entry(name)
+        if not entry['available']:
+            return entry
+        
+        start = time.monotonic()
+        try:
+            self._services[name].probe()
+            entry['reachable'] = True
+        except Exception as e:
+            logger.warning(f"Health probe for {name} failed: {e}")
+            entry['reachable'] = False
+            entry['error'] = str(e)
+        
+        entry['latency_ms'] = round((time.monotonic() - start) * 1000, 1)
+        entry['checked_at'] = time.time()
+        return entry
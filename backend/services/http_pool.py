@@ -0,0 +1,163 @@
+"""
+共享HTTP连接池 - 各提供商SDK客户端共用的连接池与超时配置
+"""
+
+import os
+import logging
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# 连接池大小默认与阻塞调用线程池一致，保证每个工作线程都能复用一条长连接
+MAX_CONNECTIONS = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', os.getenv('AI_EXECUTOR_WORKERS', 32)))
+MAX_KEEPALIVE = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', MAX_CONNECTIONS))
+# httpx默认空闲5秒即断开，请求间隔稍长就要重新TLS握手，这里放宽到60秒
+KEEPALIVE_EXPIRY = float(os.getenv('HTTP_POOL_KEEPALIVE_EXPIRY', 60))
+HTTP2 = os.getenv('HTTP_POOL_HTTP2', 'false').lower() == 'true'
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.getenv('API_TIMEOUT', 60))
+
+_lock = threading.Lock()
+_sync_client = None
+_async_client = None
+_adapter = None
+
+
+def timeout():
+    """SDK客户端使用的超时配置"""
+    import httpx
+    
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def sync_client():
+    """获取共享的httpx同步客户端（OpenAI、Anthropic SDK）"""
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            import httpx
+            
+            _sync_client = httpx.Client(limits=_limits(), timeout=timeout(), http2=_http2())
+        return _sync_client
+
+
+def async_client():
+    """获取共享的httpx异步客户端（OpenAI、Anthropic SDK）"""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            import httpx
+            
+            _async_client = httpx.AsyncClient(limits=_limits(), timeout=timeout(), http2=_http2())
+        return _async_client
+
+
+def mount(session):
+    """为requests会话（Gemini REST传输）挂载共享的连接池适配器"""
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            _adapter = _timeout_adapter_class()(
+                pool_connections=4,
+                pool_maxsize=MAX_CONNECTIONS,
+                pool_block=False
+            )
+    session.mount('https://', _adapter)
+    session.mount('http://', _adapter)
+
+
+def reset():
+    """丢弃继承自父进程的客户端和连接池，下次获取时重新创建
+    
+    预加载后fork的工作进程与父进程共享已建立连接的套接字，不能继续使用；
+    也不能关闭（会关闭父进程的连接），只丢弃引用。
+    """
+    global _lock, _sync_client, _async_client, _adapter
+    _lock = threading.Lock()
+    _sync_client = None
+    _async_client = None
+    _adapter = None
+
+
+def stats() -> dict:
+    """获取连接池使用情况：已建立的连接数、空闲连接数和正在使用的连接数"""
+    result = {
+        'config': {
+            'max_connections': MAX_CONNECTIONS,
+            'max_keepalive': MAX_KEEPALIVE,
+            'keepalive_expiry': KEEPALIVE_EXPIRY,
+            'http2': _http2(),
+            'connect_timeout': CONNECT_TIMEOUT,
+            'read_timeout': READ_TIMEOUT
+        }
+    }
+    for name, client in (('httpx_sync', _sync_client), ('httpx_async', _async_client)):
+        if client is not None:
+            result[name] = _httpx_stats(client)
+    if _adapter is not None:
+        result['requests'] = _requests_stats(_adapter)
+    return result
+
+
+def _limits():
+    import httpx
+    
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+@lru_cache(maxsize=1)
+def _http2() -> bool:
+    """HTTP/2需要安装h2，未安装时回退到HTTP/1.1"""
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("HTTP_POOL_HTTP2 is enabled but h2 is not installed, falling back to HTTP/1.1")
+        return False
+
+
+def _httpx_stats(client) -> dict:
+    # httpx未公开连接池状态，从底层httpcore连接池读取
+    connections = list(getattr(getattr(client._transport, '_pool', None), 'connections', []))
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        'connections': len(connections),
+        'idle': idle,
+        'active': len(connections) - idle
+    }
+
+
+def _requests_stats(adapter) -> dict:
+    opened = idle = requests = 0
+    for key in list(adapter.poolmanager.pools.keys()):
+        pool = adapter.poolmanager.pools.get(key)
+        if pool is None or pool.pool is None:
+            continue
+        opened += pool.num_connections
+        requests += pool.num_requests
+        idle += sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    return {
+        'opened': opened,  # 累计新建连接数（每次新建都需TLS握手）
+        'idle': idle,
+        'requests': requests
+    }
+
+
+def _timeout_adapter_class():
+    """带默认超时的requests适配器（requests会话本身不支持默认超时）"""
+    from requests.adapters import HTTPAdapter
+    
+    class TimeoutHTTPAdapter(HTTPAdapter):
+        def send(self, request, timeout=None, **kwargs):
+            if timeout is None:
+                timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+            return super().send(request, timeout=timeout, **kwargs)
+    
+    return TimeoutHTTPAdapter
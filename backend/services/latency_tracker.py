@@ -0,0 +1,37 @@
+"""
+提供商延迟统计
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Optional
+
+
+class LatencyTracker:
+    """按提供商记录最近的调用延迟，用于计算分位数"""
+    
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+    
+    def record(self, provider: str, seconds: float):
+        """记录一次成功调用的延迟（秒）"""
+        with self._lock:
+            self._samples[provider].append(seconds)
+    
+    def count(self, provider: str) -> int:
+        """获取当前窗口内的样本数"""
+        with self._lock:
+            return len(self._samples.get(provider, ()))
+    
+    def percentile(self, provider: str, q: float) -> Optional[float]:
+        """计算延迟分位数（q取0-100），无样本时返回None"""
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        
+        if not samples:
+            return None
+        
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
@@ -4,9 +4,9 @@ OpenAI服务实现
 
 import os
 import logging
-from openai import OpenAI
+from typing import AsyncIterator, Iterator, List
 
-from services import AIService
+from services import AIService, http_pool
 
 logger = logging.getLogger(__name__)
 
@@ -14,34 +14,55 @@ logger = logging.getLogger(__name__)
 class OpenAIService(AIService):
     """OpenAI服务实现"""
     
+    name = 'openai'
+    native_variants = True
+    
     def __init__(self):
         self.api_key = os.getenv('OPENAI_API_KEY')
+        self.base_url = os.getenv('OPENAI_BASE_URL')  # 可指向兼容接口或本地压测服务
         self.model_name = 'gpt-4'
         self.client = None
+        self.async_client = None
         
         if self.api_key:
             try:
-                self.client = OpenAI(api_key=self.api_key)
+                # 仅在配置了API Key时导入SDK，减少冷启动时间
+                from openai import AsyncOpenAI, OpenAI
+                
+                # 使用共享连接池，复用到API的长连接
+                self.client = OpenAI(
+                    api_key=self.api_key, base_url=self.base_url,
+                    http_client=http_pool.sync_client(), timeout=http_pool.timeout()
+                )
+                self.async_client = AsyncOpenAI(
+                    api_key=self.api_key, base_url=self.base_url,
+                    http_client=http_pool.async_client(), timeout=http_pool.timeout()
+                )
                 logger.info("OpenAI service initialized successfully")
             except Exception as e:
                 logger.error(f"Failed to initialize OpenAI: {e}")
         else:
             logger.warning("OPENAI_API_KEY not found in environment")
     
+    def _build_request(self, prompt: str) -> dict:
+        """构建请求参数"""
+        return {
+            'model': self.model_name,
+            'messages': [
+                {"role": "user", "content": prompt}
+            ],
+            'temperature': 0.7,
+            'max_tokens': 800
+        }
+    
     def generate(self, prompt: str) -> str:
         """使用OpenAI生成文本"""
         if not self.client:
             raise ValueError("OpenAI service is not properly initialized")
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=800
-            )
+            response = self.client.chat.completions.create(**self._build_request(prompt))
+            self._record_response_usage(response)
             
             return response.choices[0].message.content
             
@@ -49,6 +70,101 @@ class OpenAIService(AIService):
             logger.error(f"OpenAI generation error: {e}")
             raise Exception(f"OpenAI生成失败: {str(e)}")
     
+    def generate_n(self, prompt: str, n: int) -> List[str]:
+        """使用OpenAI原生的n参数在一次请求中采样多个候选，Prompt只计费一次"""
+        if not self.client:
+            raise ValueError("OpenAI service is not properly initialized")
+        
+        try:
+            response = self.client.chat.completions.create(**self._build_request(prompt), n=n)
+            self._record_response_usage(response)
+            
+            return [choice.message.content for choice in response.choices]
+            
+        except Exception as e:
+            logger.error(f"OpenAI generation error: {e}")
+            raise Exception(f"OpenAI生成失败: {str(e)}")
+    
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """使用OpenAI流式生成文本"""
+        if not self.client:
+            raise ValueError("OpenAI service is not properly initialized")
+        
+        try:
+            stream = self.client.chat.completions.create(
+                **self._build_request(prompt),
+                stream=True
+            )
+            
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                    
+        except Exception as e:
+            logger.error(f"OpenAI streaming error: {e}")
+            raise Exception(f"OpenAI生成失败: {str(e)}")
+    
+    async def agenerate(self, prompt: str) -> str:
+        """使用AsyncOpenAI异步生成文本"""
+        if not self.async_client:
+            raise ValueError("OpenAI service is not properly initialized")
+        
+        try:
+            response = await self.async_client.chat.completions.create(**self._build_request(prompt))
+            self._record_response_usage(response)
+            
+            return response.choices[0].message.content
+            
+        except Exception as e:
+            logger.error(f"OpenAI async generation error: {e}")
+            raise Exception(f"OpenAI生成失败: {str(e)}")
+    
+    async def agenerate_n(self, prompt: str, n: int) -> List[str]:
+        """使用AsyncOpenAI在一次请求中采样多个候选"""
+        if not self.async_client:
+            raise ValueError("OpenAI service is not properly initialized")
+        
+        try:
+            response = await self.async_client.chat.completions.create(**self._build_request(prompt), n=n)
+            self._record_response_usage(response)
+            
+            return [choice.message.content for choice in response.choices]
+            
+        except Exception as e:
+            logger.error(f"OpenAI async generation error: {e}")
+            raise Exception(f"OpenAI生成失败: {str(e)}")
+    
+    async def agenerate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """使用AsyncOpenAI异步流式生成文本"""
+        if not self.async_client:
+            raise ValueError("OpenAI service is not properly initialized")
+        
+        try:
+            stream = await self.async_client.chat.completions.create(
+                **self._build_request(prompt),
+                stream=True
+            )
+            
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                    
+        except Exception as e:
+            logger.error(f"OpenAI async streaming error: {e}")
+            raise Exception(f"OpenAI生成失败: {str(e)}")
+    
+    def _record_response_usage(self, response):
+        """记录响应中的token用量（流式响应不返回用量）"""
+        if response.usage is not None:
+            self._record_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+    
+    def probe(self):
+        """查询模型信息以探测连通性，不消耗token"""
+        if not self.client:
+            raise ValueError("OpenAI service is not properly initialized")
+        
+        self.client.models.retrieve(self.model_name)
+    
     def is_available(self) -> bool:
         """检查OpenAI服务是否可用"""
         return self.client is not None and self.api_key is not None
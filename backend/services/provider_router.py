@@ -0,0 +1,152 @@
+"""
+自适应提供商路由
+"""
+
+import time
+import random
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _ProviderStats:
+    """单个提供商的指数加权统计"""
+    
+    def __init__(self):
+        self.latency = None  # 成功调用延迟的EWMA（秒）
+        self.error_rate = 0.0  # 失败率的EWMA
+        self.samples = 0
+        self.observed_at = 0.0  # 最近一次调用结果的时间
+        self.routed_at = 0.0  # 最近一次被选中的时间
+        self.routed = 0
+        self.explored = 0
+
+
+class ProviderRouter:
+    """按实时延迟、错误率和成本为 provider: "auto" 的请求选择提供商
+    
+    每次真实调用结束后更新该提供商的EWMA延迟和错误率，得分为
+    延迟EWMA * (1 + error_penalty * 错误率EWMA) * 成本权重，选择得分最低的提供商。
+    EWMA只反映近期表现，提供商的快慢随时段变化时路由随之切换。
+    
+    为避免没有流量的提供商统计一直停留在过去：样本不足min_samples、或超过
+    explore_interval秒没有调用结果的提供商会被分配一次探索请求；另有explore_rate
+    的概率随机选择一个提供商重新采样。
+    """
+    
+    def __init__(self, alpha: float = 0.2, error_penalty: float = 4.0,
+                 cost_weights: Optional[Dict[str, float]] = None, explore_rate: float = 0.05,
+                 explore_interval: float = 300, min_samples: int = 3):
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.cost_weights = cost_weights or {}
+        self.explore_rate = explore_rate
+        self.explore_interval = explore_interval
+        self.min_samples = min_samples
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+    
+    @staticmethod
+    def parse_weights(value: str) -> Dict[str, float]:
+        """解析成本权重配置，格式: "gemini=1,openai=1.5,claude=2" """
+        weights = {}
+        for item in (value or '').split(','):
+            if '=' in item:
+                name, weight = item.split('=', 1)
+                weights[name.strip().lower()] = float(weight)
+        return weights
+    
+    def record_success(self, provider: str, latency: float):
+        """记录一次成功调用的延迟（秒）"""
+        with self._lock:
+            stats = self._get(provider)
+            stats.latency = latency if stats.latency is None else self._ewma(stats.latency, latency)
+            stats.error_rate = self._ewma(stats.error_rate, 0.0)
+            self._observed(stats)
+    
+    def record_failure(self, provider: str):
+        """记录一次失败调用"""
+        with self._lock:
+            stats = self._get(provider)
+            stats.error_rate = self._ewma(stats.error_rate, 1.0)
+            self._observed(stats)
+    
+    def choose(self, candidates: Iterable[str]) -> Optional[str]:
+        """从候选提供商中选择一个，没有候选时返回None"""
+        candidates = list(candidates)
+        if not candidates:
+            return None
+        
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                name for name in candidates
+                if self._needs_sample(self._get(name), now)
+            ]
+            if stale:
+                choice = min(stale, key=lambda name: self._stats[name].routed_at)
+                explored = True
+            elif len(candidates) > 1 and self._random.random() < self.explore_rate:
+                choice = self._random.choice(candidates)
+                explored = True
+            else:
+                choice = min(candidates, key=self._score)
+                explored = False
+            
+            stats = self._stats[choice]
+            stats.routed_at = now
+            stats.routed += 1
+            if explored:
+                stats.explored += 1
+        
+        logger.debug(f"Auto routing selected {choice}{' (exploring)' if explored else ''}")
+        return choice
+    
+    def stats(self) -> dict:
+        """获取各提供商的路由统计"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                name: {
+                    'latency_ewma_ms': round(stats.latency * 1000, 1) if stats.latency is not None else None,
+                    'error_rate_ewma': round(stats.error_rate, 4),
+                    'cost_weight': self.cost_weights.get(name, 1.0),
+                    'score': round(self._score(name), 4) if stats.latency is not None else None,
+                    'samples': stats.samples,
+                    'routed': stats.routed,
+                    'explored': stats.explored,
+                    'observed_ago': round(now - stats.observed_at, 1) if stats.samples else None
+                }
+                for name, stats in self._stats.items()
+            }
+    
+    def _get(self, provider: str) -> _ProviderStats:
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = _ProviderStats()
+        return stats
+    
+    def _ewma(self, current: float, value: float) -> float:
+        return current + self.alpha * (value - current)
+    
+    def _observed(self, stats: _ProviderStats):
+        stats.samples += 1
+        stats.observed_at = time.monotonic()
+    
+    def _needs_sample(self, stats: _ProviderStats, now: float) -> bool:
+        """样本不足或统计过期，且最近explore_interval内没有为其分配过探索请求
+        
+        样本不足时只需等待上一次分配的请求返回，不必等满explore_interval。
+        """
+        if stats.samples < self.min_samples:
+            return stats.routed_at <= stats.observed_at or now - stats.routed_at > self.explore_interval
+        return (now - stats.observed_at > self.explore_interval
+                and now - stats.routed_at > self.explore_interval)
+    
+    def _score(self, provider: str) -> float:
+        stats = self._stats[provider]
+        latency = stats.latency if stats.latency is not None else float('inf')
+        return latency * (1 + self.error_penalty * stats.error_rate) * self.cost_weights.get(provider, 1.0)
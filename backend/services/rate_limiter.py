@@ -0,0 +1,193 @@
+"""
+提供商限流器
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """排队等待超过期限或上游返回429时抛出，retry_after为建议的重试等待秒数"""
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _TokenBucket:
+    """令牌桶，余额可以为负，表示已被排队的调用预占"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+    
+    def refill(self, elapsed: float, scale: float):
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate * scale)
+    
+    def wait_time(self, amount: float, scale: float) -> float:
+        """余额足够支付amount还需等待的秒数
+        
+        超过桶容量的调用只需等到桶满即可放行，全额扣除后余额为负，由之后的调用等待补足。
+        """
+        deficit = min(amount, self.capacity) - self.tokens
+        return max(0.0, deficit / (self.rate * scale))
+
+
+class RateLimiter:
+    """单个提供商/模型的客户端限流器
+    
+    按请求数（RPM）和估算token数（TPM）两个令牌桶限流，额度不足的调用预占额度后排队等待，
+    预计等待超过max_wait时直接拒绝，而不是发往上游后收到429。
+    上游返回429时按Retry-After暂停放行，并将速率减半；之后每次成功调用逐步恢复速率。
+    """
+    
+    # 429后速率的最低比例，以及每次成功调用恢复的比例
+    MIN_SCALE = 0.1
+    RECOVERY_STEP = 0.05
+    
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0,
+                 max_wait: float = 10, burst_seconds: float = 1):
+        self.name = name
+        self.max_wait = max_wait
+        self._requests = _TokenBucket(rpm / 60, max(1.0, rpm / 60 * burst_seconds)) if rpm > 0 else None
+        self._tokens = _TokenBucket(tpm / 60, max(1.0, tpm / 60 * burst_seconds)) if tpm > 0 else None
+        self._scale = 1.0
+        self._paused_until = 0.0
+        self._updated = time.monotonic()
+        self._queued = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._throttled = 0
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None, requests: int = 1):
+        """获取requests次调用的额度，需要时阻塞等待，超过期限抛出RateLimitExceeded"""
+        wait = self._reserve(tokens, max_wait, requests)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._dequeue()
+    
+    async def aacquire(self, tokens: int = 0, max_wait: Optional[float] = None, requests: int = 1):
+        """异步获取requests次调用的额度，等待中被取消时退还预占的额度"""
+        wait = self._reserve(tokens, max_wait, requests)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._refund(tokens, requests)
+                raise
+            finally:
+                self._dequeue()
+    
+    def record_success(self):
+        """成功调用后逐步恢复被429降低的速率"""
+        if self._scale < 1.0:
+            with self._lock:
+                self._scale = min(1.0, self._scale + self.RECOVERY_STEP)
+    
+    def record_throttled(self, retry_after: float):
+        """上游返回429：暂停放行retry_after秒，并将速率减半"""
+        with self._lock:
+            self._throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._scale = max(self.MIN_SCALE, self._scale / 2)
+        logger.warning(f"{self.name} rate limited upstream, pausing {retry_after:.1f}s, "
+                       f"rate scaled to {self._scale:.2f}")
+    
+    def stats(self) -> dict:
+        """获取限流统计"""
+        with self._lock:
+            return {
+                'rpm': round(self._requests.rate * 60) if self._requests else None,
+                'tpm': round(self._tokens.rate * 60) if self._tokens else None,
+                'scale': round(self._scale, 2),
+                'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 2),
+                'queued': self._queued,
+                'admitted': self._admitted,
+                'rejected': self._rejected,
+                'throttled': self._throttled
+            }
+    
+    def _reserve(self, tokens: int, max_wait: Optional[float], requests: int = 1) -> float:
+        """预占额度并返回需等待的秒数，超过期限时不预占并抛出RateLimitExceeded"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self._requests, self._tokens):
+                if bucket is not None:
+                    bucket.refill(now - self._updated, self._scale)
+            self._updated = now
+            
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(requests, self._scale) if self._requests else 0.0,
+                self._tokens.wait_time(tokens, self._scale) if self._tokens else 0.0
+            )
+            if wait > max_wait:
+                self._rejected += 1
+                raise RateLimitExceeded(f"{self.name} 请求过于频繁，请稍后重试", retry_after=wait)
+            
+            if self._requests:
+                self._requests.tokens -= requests
+            if self._tokens:
+                self._tokens.tokens -= tokens
+            self._admitted += 1
+            if wait > 0:
+                self._queued += 1
+            return wait
+    
+    def _dequeue(self):
+        with self._lock:
+            self._queued -= 1
+    
+    def _refund(self, tokens: int, requests: int = 1):
+        """退还未使用的预占额度"""
+        with self._lock:
+            if self._requests:
+                self._requests.tokens = min(self._requests.capacity, self._requests.tokens + requests)
+            if self._tokens:
+                self._tokens.tokens = min(self._tokens.capacity, self._tokens.tokens + tokens)
+            self._admitted -= 1
+
+
+def retry_after_from(error: BaseException, default: float = 1.0) -> Optional[float]:
+    """从异常链中识别上游429响应，返回Retry-After秒数；不是429时返回None
+    
+    服务层会将SDK异常包装为通用Exception，原始异常保留在__cause__/__context__中。
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, 'status_code', None) or getattr(error, 'code', None)
+        if status == 429:
+            response = getattr(error, 'response', None)
+            headers = getattr(response, 'headers', None) or {}
+            return _parse_retry_after(headers) or default
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    """解析retry-after-ms（OpenAI）或retry-after（秒数或HTTP日期）"""
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,202 @@
+"""
+录制/回放AI服务实现
+"""
+
+import os
+import gzip
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Iterator
+
+from services import AIService
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayService(AIService):
+    """录制/回放AI服务实现
+    
+    record模式包装REPLAY_TARGET指定的真实服务，将每次调用的Prompt、响应、耗时和
+    流式分段追加写入gzip压缩的JSON Lines录制文件；replay模式从录制文件读取，按原始
+    耗时乘以REPLAY_SPEED返回相同的响应，无需网络。同一Prompt有多条记录时依次轮流返回。
+    """
+    
+    name = 'replay'
+    
+    def __init__(self):
+        self.mode = os.getenv('REPLAY_MODE', '').lower()  # record/replay，为空时不启用
+        self.cassette = os.getenv('REPLAY_CASSETTE', 'cassettes/replay.jsonl.gz')
+        self.speed = float(os.getenv('REPLAY_SPEED', 1.0))  # 回放耗时倍率，0表示不等待
+        self.target = None
+        self._entries = {}  # Prompt -> 录制记录列表
+        self._cursors = {}  # Prompt -> 下一条回放记录的序号
+        self._lock = threading.Lock()
+        
+        if self.mode == 'record':
+            self._init_record()
+        elif self.mode == 'replay':
+            self._init_replay()
+        elif self.mode:
+            logger.error(f"Unknown REPLAY_MODE: {self.mode}")
+    
+    def _init_record(self):
+        # 在构造时导入，避免与工厂模块循环导入
+        from services.ai_service_factory import SERVICE_CLASSES
+        
+        target = os.getenv('REPLAY_TARGET', os.getenv('DEFAULT_AI_PROVIDER', 'gemini')).lower()
+        if target not in SERVICE_CLASSES or target == self.name:
+            logger.error(f"Invalid REPLAY_TARGET: {target}")
+            return
+        
+        self.target = SERVICE_CLASSES[target]()
+        directory = os.path.dirname(self.cassette)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger.info(f"Replay service recording {target} to {self.cassette}")
+    
+    def _init_replay(self):
+        try:
+            with gzip.open(self.cassette, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry['prompt'], []).append(entry)
+            logger.info(f"Replay service loaded {sum(map(len, self._entries.values()))} "
+                        f"entries from {self.cassette}")
+        except Exception as e:
+            logger.error(f"Failed to load replay cassette {self.cassette}: {e}")
+    
+    def generate(self, prompt: str) -> str:
+        """录制模式调用真实服务并记录，回放模式按原始耗时返回录制的响应"""
+        if self.mode == 'record':
+            self._require_target()
+            start = time.perf_counter()
+            generated_text = self.target.generate(prompt)
+            self._append(prompt, generated_text, time.perf_counter() - start)
+            return generated_text
+        
+        entry = self._lookup(prompt)
+        time.sleep(self._delay(entry['latency_ms']))
+        return entry['text']
+    
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """流式录制或回放，回放时按录制的分段时间点逐段返回"""
+        if self.mode == 'record':
+            self._require_target()
+            start = time.perf_counter()
+            chunks = []
+            for delta in self.target.generate_stream(prompt):
+                chunks.append([self._ms(time.perf_counter() - start), delta])
+                yield delta
+            self._append(prompt, ''.join(delta for _, delta in chunks),
+                         time.perf_counter() - start, chunks)
+            return
+        
+        entry = self._lookup(prompt)
+        start = time.perf_counter()
+        for offset_ms, delta in self._replay_chunks(entry):
+            time.sleep(max(0.0, self._delay(offset_ms) - (time.perf_counter() - start)))
+            yield delta
+    
+    async def agenerate(self, prompt: str) -> str:
+        """异步录制或回放，回放时不占用线程池"""
+        if self.mode == 'record':
+            self._require_target()
+            start = time.perf_counter()
+            generated_text = await self.target.agenerate(prompt)
+            self._append(prompt, generated_text, time.perf_counter() - start)
+            return generated_text
+        
+        entry = self._lookup(prompt)
+        await asyncio.sleep(self._delay(entry['latency_ms']))
+        return entry['text']
+    
+    async def agenerate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """异步流式录制或回放"""
+        if self.mode == 'record':
+            self._require_target()
+            start = time.perf_counter()
+            chunks = []
+            async for delta in self.target.agenerate_stream(prompt):
+                chunks.append([self._ms(time.perf_counter() - start), delta])
+                yield delta
+            self._append(prompt, ''.join(delta for _, delta in chunks),
+                         time.perf_counter() - start, chunks)
+            return
+        
+        entry = self._lookup(prompt)
+        start = time.perf_counter()
+        for offset_ms, delta in self._replay_chunks(entry):
+            await asyncio.sleep(max(0.0, self._delay(offset_ms) - (time.perf_counter() - start)))
+            yield delta
+    
+    def probe(self):
+        """录制模式探测真实服务，回放模式只检查录制文件"""
+        if self.mode == 'record':
+            self._require_target()
+            self.target.probe()
+        elif not self._entries:
+            raise ValueError(f"回放录制文件为空或无法读取: {self.cassette}")
+    
+    def _require_target(self):
+        if self.target is None or not self.target.is_available():
+            raise ValueError("Replay service target is not properly initialized")
+    
+    def _lookup(self, prompt: str) -> dict:
+        """查找录制记录，同一Prompt的多条记录依次轮流返回"""
+        entries = self._entries.get(prompt)
+        if not entries:
+            raise Exception("回放失败: 录制文件中没有该Prompt的记录")
+        
+        with self._lock:
+            cursor = self._cursors.get(prompt, 0)
+            self._cursors[prompt] = cursor + 1
+        return entries[cursor % len(entries)]
+    
+    def _delay(self, milliseconds: float) -> float:
+        """按回放倍率换算等待时间（秒）"""
+        return milliseconds / 1000 * self.speed
+    
+    @staticmethod
+    def _replay_chunks(entry: dict):
+        """非流式录制的记录在原始耗时后一次性返回"""
+        return entry.get('chunks') or [[entry['latency_ms'], entry['text']]]
+    
+    @staticmethod
+    def _ms(seconds: float) -> int:
+        return round(seconds * 1000)
+    
+    def _append(self, prompt: str, text: str, seconds: float, chunks=None):
+        """追加一条录制记录，每条记录写为独立的gzip成员，进程中断也不会损坏已有记录"""
+        entry = {
+            'prompt': prompt,
+            'provider': self.target.name,
+            'model': self.target.get_model_name(),
+            'latency_ms': self._ms(seconds),
+            'text': text,
+            'recorded_at': round(time.time(), 3)
+        }
+        if chunks is not None:
+            entry['chunks'] = chunks
+        
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        try:
+            with self._lock, gzip.open(self.cassette, 'at', encoding='utf-8') as f:
+                f.write(line)
+        except Exception as e:
+            logger.error(f"Failed to write replay cassette {self.cassette}: {e}")
+    
+    def is_available(self) -> bool:
+        """检查录制/回放服务是否可用"""
+        if self.mode == 'record':
+            return self.target is not None and self.target.is_available()
+        return self.mode == 'replay' and bool(self._entries)
+    
+    def get_model_name(self) -> str:
+        """获取模型名称，录制时为真实服务的模型"""
+        if self.mode == 'record' and self.target is not None:
+            return self.target.get_model_name()
+        return 'replay'
@@ -43,5 +43,9 @@ echo "✅ 配置检查完成"
 echo "🌐 启动服务..."
 echo ""
 
-# 启动Flask应用
-python3 app.py
+# 开发环境使用Flask单进程开发服务器，其他情况使用gunicorn多进程部署（见gunicorn.conf.py）
+if [ "$FLASK_ENV" = "development" ]; then
+    python3 app.py
+else
+    exec gunicorn -c gunicorn.conf.py
+fi
@@ -0,0 +1,89 @@
+"""
+提供商熔断器测试
+"""
+
+import pytest
+
+from services import circuit_breaker
+from services.circuit_breaker import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def _breaker(**kwargs):
+    options = {'failure_rate_threshold': 0.5, 'window': 10, 'min_calls': 4, 'reset_timeout': 30}
+    return CircuitBreaker('test', **{**options, **kwargs})
+
+
+def test_opens_after_failure_rate_reached_with_min_calls(clock):
+    breaker = _breaker()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    # 调用数不足min_calls时不熔断
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+
+def test_failure_rate_below_threshold_stays_closed(clock):
+    breaker = _breaker()
+    for _ in range(3):
+        breaker.record_success()
+        breaker.record_success()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()['failure_rate'] == pytest.approx(1 / 3, abs=1e-4)
+
+
+def test_slow_success_counts_as_failure(clock):
+    breaker = _breaker(slow_call_threshold=5)
+    for _ in range(4):
+        breaker.record_success(latency=10)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = _breaker(min_calls=1)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()['calls'] == 0
+
+
+def test_failed_probe_reopens(clock):
+    breaker = _breaker(min_calls=1)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow_request()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 29
+    assert not breaker.allow_request()
+
+
+def test_released_probe_can_be_retried(clock):
+    breaker = _breaker(min_calls=1)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow_request()
+
+    # 探测请求被取消（如对冲落败、客户端断开），不计入结果
+    breaker.release_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
@@ -0,0 +1,107 @@
+"""
+异步任务队列测试
+"""
+
+import threading
+import time
+
+import pytest
+
+from utils.job_queue import FAILED, RUNNING, SUCCEEDED, Job, JobQueue
+
+
+def _wait_finished(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job is not None and job.finished:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'jobs.db')
+
+
+def test_runs_jobs_and_stores_results(db_path):
+    queue = JobQueue(lambda job: {'echo': job.params['value']}, workers=2, db_path=db_path)
+    queue.start()
+    try:
+        job = queue.submit('generate', {'value': 1})
+        finished = _wait_finished(queue, job.id)
+        assert finished.status == SUCCEEDED
+        assert finished.result == {'echo': 1}
+    finally:
+        queue.stop(timeout=1)
+
+
+def test_busy_store_does_not_block_submit(db_path):
+    queue = JobQueue(lambda job: None, workers=1, db_path=db_path)
+    claiming = threading.Event()
+    release = threading.Event()
+    claim = queue._store.claim
+
+    def slow_claim(job, owner):
+        claiming.set()
+        release.wait(5)
+        return claim(job, owner)
+
+    queue._store.claim = slow_claim
+    queue.start()
+    try:
+        first = queue.submit('generate', {})
+        assert claiming.wait(2)
+        # 工作线程正在等待数据库时，提交和统计不应被阻塞
+        started = time.monotonic()
+        second = queue.submit('generate', {})
+        queue.stats()
+        assert time.monotonic() - started < 1
+        release.set()
+        assert _wait_finished(queue, first.id).status == SUCCEEDED
+        assert _wait_finished(queue, second.id).status == SUCCEEDED
+    finally:
+        release.set()
+        queue.stop(timeout=1)
+
+
+def _interrupted_job(queue, attempts):
+    """模拟执行中所在进程崩溃的任务：状态为running，租约不再续约"""
+    job = Job('generate', {'value': attempts})
+    job.status = RUNNING
+    job.attempts = attempts
+    job.started_at = time.time()
+    queue._store.save(job, 'crashed-worker')
+    return job
+
+
+def test_recovered_job_is_retried_below_max_attempts(db_path):
+    queue = JobQueue(lambda job: job.attempts, workers=1, max_attempts=3, db_path=db_path, lease_timeout=0.05)
+    job = _interrupted_job(queue, attempts=1)
+    time.sleep(0.1)
+    queue.start()
+    try:
+        finished = _wait_finished(queue, job.id)
+        assert finished.status == SUCCEEDED
+        assert finished.result == 2
+        assert queue.stats()['recovered'] == 1
+    finally:
+        queue.stop(timeout=1)
+
+
+def test_repeatedly_interrupted_job_is_failed(db_path):
+    calls = []
+    queue = JobQueue(calls.append, workers=1, max_attempts=3, db_path=db_path, lease_timeout=0.05)
+    job = _interrupted_job(queue, attempts=3)
+    time.sleep(0.1)
+    queue.start()
+    try:
+        finished = _wait_finished(queue, job.id)
+        assert finished.status == FAILED
+        assert '中断3次' in finished.error
+        assert calls == []
+        # 失败状态已写入数据库，其他进程不会再接管
+        assert queue._store.claim_stale('other-worker', time.time()) == []
+    finally:
+        queue.stop(timeout=1)
@@ -0,0 +1,139 @@
+"""
+压测模拟LLM服务与压测工具测试
+"""
+
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from fake_llm_server import DIARY_TEXT, FakeLLMConfig, FakeLLMServer, LatencyDistribution
+from load_bench import _percentiles, _send
+
+
+def _server(**kwargs):
+    options = {'latency': 'fixed:0', 'chunk_delay': 0, 'chunks': 4}
+    return FakeLLMServer(FakeLLMConfig(**{**options, **kwargs})).start()
+
+
+@pytest.fixture
+def server():
+    server = _server()
+    yield server
+    server.stop()
+
+
+def _post(url, body):
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.status, response.read().decode('utf-8')
+
+
+def _sse_data(raw):
+    return [json.loads(line[len('data: '):]) for line in raw.splitlines()
+            if line.startswith('data: {')]
+
+
+def test_latency_distribution_specs():
+    assert LatencyDistribution('fixed:0.5').sample() == 0.5
+    assert 0.2 <= LatencyDistribution('uniform:0.2,0.3').sample() <= 0.3
+    # 正态分布截断到0以上
+    assert LatencyDistribution('normal:-5,0.1').sample() == 0.0
+    for spec in ('fixed', 'uniform:1', 'poisson:1', 'fixed:a'):
+        with pytest.raises(ValueError):
+            LatencyDistribution(spec)
+
+
+def test_split_text_covers_whole_reply():
+    config = FakeLLMConfig(chunks=7)
+    parts = config.split_text()
+    assert len(parts) == 7
+    assert ''.join(parts) == DIARY_TEXT
+
+
+def test_openai_completion_and_stream(server):
+    status, raw = _post(f'{server.url}/v1/chat/completions', {
+        'model': 'gpt-4', 'messages': [{'role': 'user', 'content': '今天'}], 'n': 2
+    })
+    data = json.loads(raw)
+    assert status == 200
+    assert [choice['message']['content'] for choice in data['choices']] == [DIARY_TEXT] * 2
+    assert data['usage']['completion_tokens'] == len(DIARY_TEXT) * 2
+
+    _, raw = _post(f'{server.url}/v1/chat/completions', {'model': 'gpt-4', 'messages': [], 'stream': True})
+    chunks = _sse_data(raw)
+    assert ''.join(chunk['choices'][0]['delta'].get('content', '') for chunk in chunks) == DIARY_TEXT
+    assert chunks[-1]['choices'][0]['finish_reason'] == 'stop'
+    assert raw.rstrip().endswith('data: [DONE]')
+
+
+def test_anthropic_message_and_stream(server):
+    _, raw = _post(f'{server.url}/v1/messages', {'model': 'claude', 'messages': []})
+    assert json.loads(raw)['content'] == [{'type': 'text', 'text': DIARY_TEXT}]
+
+    _, raw = _post(f'{server.url}/v1/messages', {'model': 'claude', 'messages': [], 'stream': True})
+    events = _sse_data(raw)
+    assert events[0]['type'] == 'message_start'
+    assert events[-1]['type'] == 'message_stop'
+    assert ''.join(event['delta']['text'] for event in events if event['type'] == 'content_block_delta') == DIARY_TEXT
+
+
+def test_gemini_generate_and_stream(server):
+    body = {'contents': [{'parts': [{'text': '今天'}]}]}
+    _, raw = _post(f'{server.url}/v1beta/models/gemini-pro:generateContent', body)
+    assert json.loads(raw)['candidates'][0]['content']['parts'][0]['text'] == DIARY_TEXT
+
+    _, raw = _post(f'{server.url}/v1beta/models/gemini-pro:streamGenerateContent', body)
+    responses = json.loads(raw)
+    assert len(responses) == 4
+    assert ''.join(response['candidates'][0]['content']['parts'][0]['text'] for response in responses) == DIARY_TEXT
+    assert responses[-1]['usageMetadata']['candidatesTokenCount'] == len(DIARY_TEXT)
+
+
+def test_model_lookup_is_free(server):
+    with urllib.request.urlopen(f'{server.url}/v1/models/claude-3', timeout=5) as response:
+        assert json.loads(response.read())['id'] == 'claude-3'
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen(f'{server.url}/unknown', timeout=5)
+    assert e.value.code == 404
+
+
+def test_injected_errors_use_configured_status():
+    server = _server(error_rate=1.0, error_status=429)
+    try:
+        with pytest.raises(urllib.error.HTTPError) as e:
+            _post(f'{server.url}/v1/chat/completions', {'messages': []})
+        assert e.value.code == 429
+        # 压测工具把HTTP错误记为状态码而不是抛出异常
+        status, elapsed, first_token = _send(f'{server.url}/v1/messages', {'messages': []}, stream=False)
+        assert status == 429
+        assert elapsed >= 0
+        assert first_token is None
+    finally:
+        server.stop()
+
+
+def test_send_reports_connection_errors():
+    server = _server()
+    url = f'{server.url}/v1/chat/completions'
+    server.stop()
+    status, _, _ = _send(url, {'messages': []}, stream=False)
+    assert status == 'URLError'
+
+
+def test_percentiles():
+    assert _percentiles([]) is None
+    result = _percentiles([i / 1000 for i in range(1, 101)])
+    assert result['p50'] == 51.0
+    assert result['p95'] == 95.0
+    assert result['p99'] == 99.0
+    assert result['mean'] == 50.5
+    assert result['max'] == 100.0
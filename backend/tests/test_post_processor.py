@@ -0,0 +1,98 @@
+"""
+输出后处理测试
+"""
+
+import random
+import asyncio
+
+import pytest
+
+from utils.post_processor import apost_process_stream, post_process, post_process_stream
+
+# 以 "这是" 开头、包含 你的/为你/按照 等字样的日记正文首行，不能被当作客套话去除
+DIARY_OPENINGS = [
+    '这是我们在一起的第100天，你的笑容还是那么甜',
+    '这是你的生日，我偷偷准备了蛋糕 🎂',
+    '这是属于我们的小确幸，按照约定去看了日出',
+    '这是为你写下的第一篇日记，以后还会有很多篇',
+    '以下是我们的约定：每天都要说晚安',
+    '好的坏的，我们都一起经历了'
+]
+
+PREAMBLES = [
+    '这是根据您的要求生成的日记：',
+    '好的！以下是为你写的日记：',
+    '当然，下面是生成的内容:',
+    '以下是日记内容：',
+    '好的～',
+    '没问题！'
+]
+
+SAMPLES = [
+    '这是根据您的要求生成的日记：\n\n```markdown\n# 奶茶与晚风\n\n今天他给我买了奶茶🧋😊✨❤️🌙  \n\n\n\n'
+    '路灯一盏一盏亮起来。\n```\n希望你喜欢这篇日记！',
+    '这是我们在一起的第100天，你的笑容还是那么甜 😊\n\n\n\n我们去看了日出🌅，风很大👩‍❤️‍👨。',
+    '```\n# 标题\n\n正文``',
+    '好的\n\n当然\n这是你的生日，我偷偷准备了蛋糕 🎂\n\n   \n正文',
+    '  \n\n正文没有任何需要清理的内容'
+]
+
+
+@pytest.mark.parametrize('line', DIARY_OPENINGS)
+def test_keeps_diary_opening_lines(line):
+    text = f'{line}\n正文'
+    assert post_process(text) == text
+
+
+@pytest.mark.parametrize('line', PREAMBLES)
+def test_strips_preamble_lines(line):
+    assert post_process(f'{line}\n\n正文') == '正文'
+
+
+def test_strips_fence_and_trailing_remarks():
+    assert post_process('```markdown\n# 标题\n\n正文\n```\n希望你喜欢！') == '# 标题\n\n正文'
+
+
+def test_limits_emojis():
+    assert post_process('一😊二🧋三✨四❤️五', max_emojis=2) == '一😊二🧋三四五'
+
+
+def test_normalizes_blank_lines_and_trailing_spaces():
+    assert post_process('第一段  \n\n\n\n第二段\n第三段   ') == '第一段\n\n第二段\n第三段'
+
+
+def _chunkings(text, seed):
+    """固定大小分段，以及固定种子的随机分段"""
+    for size in (1, 2, 3, 5, 16, len(text)):
+        yield [text[index:index + size] for index in range(0, len(text), size)]
+    rng = random.Random(seed)
+    for _ in range(20):
+        chunks, index = [], 0
+        while index < len(text):
+            size = rng.randint(1, 8)
+            chunks.append(text[index:index + size])
+            index += size
+        yield chunks
+
+
+@pytest.mark.parametrize('max_emojis', [None, 0, 3])
+@pytest.mark.parametrize('index', range(len(SAMPLES) + len(DIARY_OPENINGS)))
+def test_streaming_matches_blocking(index, max_emojis):
+    text = (SAMPLES + [f'{line}\n正文 😊' for line in DIARY_OPENINGS])[index]
+    expected = post_process(text, max_emojis)
+    for chunks in _chunkings(text, index):
+        assert ''.join(post_process_stream(chunks, max_emojis)) == expected
+
+
+def test_async_streaming_matches_blocking():
+    async def stream(chunks):
+        for chunk in chunks:
+            yield chunk
+    
+    async def collect(chunks):
+        return ''.join([delta async for delta in apost_process_stream(stream(chunks), 3)])
+    
+    for text in SAMPLES:
+        expected = post_process(text, 3)
+        for chunks in _chunkings(text, 0):
+            assert asyncio.run(collect(chunks)) == expected
@@ -0,0 +1,75 @@
+"""
+Prompt模板测试
+"""
+
+import json
+import os
+
+import pytest
+
+from utils.prompt_templates import ASSETS_DIR, PromptTemplate, PromptTemplateRegistry
+
+
+def _write(path, text, mtime):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / 'prompts').mkdir()
+    (tmp_path / 'configs').mkdir()
+    _write(tmp_path / 'prompts' / 'base.txt', '今天{{ mood }}：{{content}}', 1000)
+    _write(tmp_path / 'configs' / 'styles.json', json.dumps({'styles': [{'id': 'warm'}]}), 1000)
+    return tmp_path
+
+
+def test_render_keeps_literal_braces():
+    template = PromptTemplate('t', '输出JSON {"text": "{{content}}"}，不超过{{word_count_max}}字')
+    assert template.placeholders == {'content', 'word_count_max'}
+    assert template.render({'content': '散步', 'word_count_max': 300}) == '输出JSON {"text": "散步"}，不超过300字'
+
+
+def test_unknown_and_missing_variables_are_rejected():
+    with pytest.raises(ValueError, match='未知变量'):
+        PromptTemplate('t', '{{nickname}}')
+    with pytest.raises(ValueError, match='缺少变量'):
+        PromptTemplate('t', '{{content}}{{mood}}').render({'content': '散步'})
+
+
+def test_registry_loads_templates_and_configs(assets):
+    registry = PromptTemplateRegistry(str(assets), check_interval=0)
+    assert registry.get('base').render({'mood': '开心', 'content': '散步'}) == '今天开心：散步'
+    assert registry.style('warm') == {'id': 'warm'}
+    assert registry.style('missing') is None
+    assert not registry.has('missing')
+    with pytest.raises(ValueError):
+        registry.get('missing')
+
+
+def test_changed_file_is_reloaded(assets):
+    registry = PromptTemplateRegistry(str(assets), check_interval=0)
+    first = registry.get('base')
+
+    _write(assets / 'prompts' / 'base.txt', '{{content}}', 1000)
+    # 修改时间未变时复用已编译的模板
+    assert registry.get('base') is first
+
+    _write(assets / 'prompts' / 'base.txt', '{{content}}', 2000)
+    assert registry.get('base').render({'content': '散步'}) == '散步'
+
+
+def test_invalid_edit_keeps_previous_version(assets):
+    registry = PromptTemplateRegistry(str(assets), check_interval=0)
+    first = registry.get('base')
+
+    _write(assets / 'prompts' / 'base.txt', '{{nickname}}', 2000)
+    assert registry.get('base') is first
+
+
+def test_bundled_templates_compile():
+    registry = PromptTemplateRegistry(ASSETS_DIR)
+    registry.reload()
+    for name in ('base_diary', 'dual_perspective', 'highlight_moment'):
+        assert registry.has(name)
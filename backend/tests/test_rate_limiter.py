@@ -0,0 +1,119 @@
+"""
+提供商限流器测试
+"""
+
+import asyncio
+
+import pytest
+
+from services import rate_limiter
+from services.rate_limiter import RateLimiter, RateLimitExceeded, retry_after_from
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', clock)
+    return clock
+
+
+def _reserve_all(limiter, calls, **kwargs):
+    """同一时刻依次预占calls次额度，返回每次调用需等待的秒数"""
+    waits = [limiter._reserve(max_wait=float('inf'), **kwargs) for _ in range(calls)]
+    return waits
+
+
+def test_tokens_above_capacity_are_charged_in_full(clock):
+    # TPM=60000、突发1秒：每秒1000 token，单次调用2500 token超过桶容量
+    limiter = RateLimiter('test', tpm=60000, burst_seconds=1)
+    waits = _reserve_all(limiter, 20, tokens=2500)
+
+    assert waits[0] == 0
+    # 第一次调用用掉初始容量后余额为-1500，之后每次调用都需等待补足2500 token
+    assert waits[1] == pytest.approx(2.5)
+    assert waits[-1] == pytest.approx(19 * 2500 / 1000)
+    # 最后一次调用放行前，已放行的token数（扣除初始容量）不超过配置速率
+    assert (19 * 2500 - 1000) / waits[-1] <= 1000
+
+
+def test_variant_calls_charge_every_request(clock):
+    # RPM=60：每秒1次；不支持原生多候选时一次生成4个候选计为4次请求
+    limiter = RateLimiter('test', rpm=60, burst_seconds=1)
+    waits = _reserve_all(limiter, 5, tokens=0, requests=4)
+
+    assert waits[0] == 0
+    assert waits[1] == pytest.approx(4)
+    assert waits[-1] == pytest.approx(4 * 4)
+    # 最后一次调用放行前已放行16次请求，扣除初始容量1次后不超过每秒1次
+    assert (4 * 4 - 1) / waits[-1] <= 1
+
+
+def test_rejects_when_wait_exceeds_max_wait(clock):
+    limiter = RateLimiter('test', rpm=60, max_wait=1.5)
+    limiter.acquire()
+    assert limiter._reserve(0, None) == pytest.approx(1)
+    with pytest.raises(RateLimitExceeded) as info:
+        limiter._reserve(0, None)
+    assert info.value.retry_after == pytest.approx(2)
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_upstream_429_pauses_and_halves_rate(clock):
+    limiter = RateLimiter('test', rpm=600, burst_seconds=1)
+    limiter.record_throttled(5)
+
+    assert limiter.stats()['scale'] == 0.5
+    assert limiter._reserve(0, float('inf')) == pytest.approx(5)
+    # 之后每次成功调用逐步恢复速率
+    for _ in range(10):
+        limiter.record_success()
+    assert limiter.stats()['scale'] == 1.0
+
+
+def test_cancelled_wait_refunds_reservation(clock):
+    limiter = RateLimiter('test', rpm=60, burst_seconds=1)
+    limiter.acquire()
+    balance = limiter._requests.tokens
+
+    async def cancel_waiting():
+        task = asyncio.ensure_future(limiter.aacquire(max_wait=float('inf')))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_waiting())
+
+    assert limiter._requests.tokens == pytest.approx(balance)
+    stats = limiter.stats()
+    assert stats['admitted'] == 1
+    assert stats['queued'] == 0
+
+
+class _UpstreamError(Exception):
+    def __init__(self, status_code, headers):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+        self.response = type('Response', (), {'headers': headers})()
+
+
+def test_retry_after_from_wrapped_429():
+    try:
+        try:
+            raise _UpstreamError(429, {'retry-after-ms': '1500'})
+        except _UpstreamError as e:
+            raise Exception('生成失败') from e
+    except Exception as wrapped:
+        assert retry_after_from(wrapped) == pytest.approx(1.5)
+
+    assert retry_after_from(_UpstreamError(429, {'retry-after': '7'})) == 7
+    assert retry_after_from(_UpstreamError(429, {}), default=2) == 2
+    assert retry_after_from(_UpstreamError(500, {'retry-after': '7'})) is None
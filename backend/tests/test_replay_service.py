@@ -0,0 +1,144 @@
+"""
+录制/回放AI服务测试
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from services import AIService
+from services import ai_service_factory
+from services.replay_service import ReplayService
+
+
+class FakeTarget(AIService):
+    name = 'fake'
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        return f'{prompt}#{self.calls}'
+
+    def generate_stream(self, prompt):
+        self.calls += 1
+        yield '今天'
+        yield f'{prompt}#{self.calls}'
+
+    def is_available(self):
+        return True
+
+    def get_model_name(self):
+        return 'fake-model'
+
+
+@pytest.fixture
+def cassette(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cassettes' / 'replay.jsonl.gz')
+    monkeypatch.setenv('REPLAY_CASSETTE', path)
+    monkeypatch.setenv('REPLAY_SPEED', '0')
+    monkeypatch.setenv('REPLAY_TARGET', 'fake')
+    monkeypatch.setitem(ai_service_factory.SERVICE_CLASSES, 'fake', FakeTarget)
+    return path
+
+
+def _service(monkeypatch, mode):
+    monkeypatch.setenv('REPLAY_MODE', mode)
+    return ReplayService()
+
+
+def _read(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_record_then_replay_round_trip(cassette, monkeypatch):
+    recorder = _service(monkeypatch, 'record')
+    assert recorder.is_available()
+    assert recorder.get_model_name() == 'fake-model'
+    assert recorder.generate('散步') == '散步#1'
+    assert list(recorder.generate_stream('看电影')) == ['今天', '看电影#2']
+
+    entries = _read(cassette)
+    assert [entry['prompt'] for entry in entries] == ['散步', '看电影']
+    assert entries[0]['provider'] == 'fake'
+    assert 'chunks' not in entries[0]
+    assert [delta for _, delta in entries[1]['chunks']] == ['今天', '看电影#2']
+
+    player = _service(monkeypatch, 'replay')
+    assert player.is_available()
+    player.probe()
+    assert player.generate('散步') == '散步#1'
+    assert list(player.generate_stream('看电影')) == ['今天', '看电影#2']
+    # 非流式录制的记录在流式回放时一次性返回
+    assert list(player.generate_stream('散步')) == ['散步#1']
+
+
+def test_repeated_prompt_replays_in_turn(cassette, monkeypatch):
+    recorder = _service(monkeypatch, 'record')
+    recorder.generate('散步')
+    recorder.generate('散步')
+
+    player = _service(monkeypatch, 'replay')
+    assert [player.generate('散步') for _ in range(3)] == ['散步#1', '散步#2', '散步#1']
+
+
+def test_async_record_and_replay(cassette, monkeypatch):
+    recorder = _service(monkeypatch, 'record')
+
+    async def record():
+        text = await recorder.agenerate('散步')
+        chunks = [delta async for delta in recorder.agenerate_stream('看电影')]
+        return text, chunks
+
+    assert asyncio.run(record()) == ('散步#1', ['今天', '看电影#2'])
+
+    player = _service(monkeypatch, 'replay')
+
+    async def replay():
+        text = await player.agenerate('散步')
+        chunks = [delta async for delta in player.agenerate_stream('看电影')]
+        return text, chunks
+
+    assert asyncio.run(replay()) == ('散步#1', ['今天', '看电影#2'])
+
+
+def test_replay_waits_recorded_latency_times_speed(cassette, monkeypatch):
+    os.makedirs(os.path.dirname(cassette))
+    entry = {'prompt': '散步', 'latency_ms': 200, 'text': '慢'}
+    with gzip.open(cassette, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+
+    monkeypatch.setenv('REPLAY_SPEED', '0.25')
+    player = _service(monkeypatch, 'replay')
+    start = time.perf_counter()
+    assert player.generate('散步') == '慢'
+    assert 0.04 <= time.perf_counter() - start < 0.15
+
+
+def test_unknown_prompt_and_missing_cassette(cassette, monkeypatch):
+    player = _service(monkeypatch, 'replay')
+    # 录制文件不存在时服务不可用，探测失败
+    assert not player.is_available()
+    with pytest.raises(ValueError):
+        player.probe()
+
+    recorder = _service(monkeypatch, 'record')
+    recorder.generate('散步')
+    player = _service(monkeypatch, 'replay')
+    with pytest.raises(Exception, match='没有该Prompt'):
+        player.generate('看电影')
+
+
+def test_invalid_target_is_unavailable(cassette, monkeypatch):
+    monkeypatch.setenv('REPLAY_TARGET', 'replay')
+    recorder = _service(monkeypatch, 'record')
+    assert recorder.target is None
+    assert not recorder.is_available()
+    with pytest.raises(ValueError):
+        recorder.generate('散步')
@@ -0,0 +1,42 @@
+"""
+语义缓存测试
+"""
+
+import pytest
+
+from utils.semantic_cache import SemanticCache, confirm_match
+from utils.similarity import normalize
+
+ENTRY = '今天下班他来公司楼下接我，我们一起去吃了火锅，然后去江边散步，买了一杯少糖的奶茶'
+
+
+@pytest.mark.parametrize('text', [
+    ENTRY,
+    ENTRY + '。',
+    ENTRY.replace('，', ' '),
+    ENTRY + '呀！'
+])
+def test_confirms_same_input(text):
+    assert confirm_match(normalize(text), normalize(ENTRY), 4)
+
+
+@pytest.mark.parametrize('text', [
+    ENTRY.replace('他来', '他没来'),
+    ENTRY.replace('少糖', '多糖'),
+    ENTRY.replace('一杯', '两杯'),
+    ENTRY.replace('火锅', '烧烤'),
+    ENTRY + '啊呀啦呢吧'
+])
+def test_rejects_changed_facts(text):
+    assert not confirm_match(normalize(text), normalize(ENTRY), 4)
+
+
+def test_rejects_similar_input_and_other_scopes():
+    pytest.importorskip('numpy')
+    cache = SemanticCache(threshold=0.9)
+    cache.set(ENTRY, 'warm', 'sweet', {'generated_text': '日记'}, scope=('user-1',))
+    
+    assert cache.get(ENTRY + '！', 'warm', 'sweet', scope=('user-1',))[0] == {'generated_text': '日记'}
+    assert cache.get(ENTRY.replace('他来', '他没来'), 'warm', 'sweet', scope=('user-1',)) is None
+    assert cache.get(ENTRY, 'warm', 'sweet', scope=('user-2',)) is None
+    assert cache.stats()['rejected'] == 1
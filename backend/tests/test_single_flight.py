@@ -0,0 +1,94 @@
+"""
+进行中请求合并测试
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def generate():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'diary'
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        leader = executor.submit(flight.do, 'key', generate)
+        assert started.wait(2)
+        followers = [executor.submit(flight.do, 'key', generate) for _ in range(4)]
+        while flight.stats()['coalesced'] < 4:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert results == ['diary'] * 5
+    assert calls == [1]
+    assert flight.stats() == {'in_flight': 0, 'executed': 1, 'coalesced': 4}
+
+
+def test_error_is_shared_and_key_is_released():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError('upstream down')
+
+    with pytest.raises(RuntimeError):
+        flight.do('key', fail)
+    # 失败后不保留结果，下一次调用重新执行
+    assert flight.do('key', lambda: 'retry') == 'retry'
+    assert flight.stats()['executed'] == 2
+
+
+def test_different_keys_run_independently():
+    flight = SingleFlight()
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('b', lambda: 2) == 2
+    assert flight.stats()['coalesced'] == 0
+
+
+def test_async_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'diary'
+
+    async def main():
+        return await asyncio.gather(*(flight.ado('key', generate) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['diary'] * 5
+    assert calls == [1]
+    assert flight.stats() == {'in_flight': 0, 'executed': 1, 'coalesced': 4}
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    flight = SingleFlight()
+
+    async def generate():
+        await asyncio.sleep(0.02)
+        return 'diary'
+
+    async def main():
+        first = asyncio.ensure_future(flight.ado('key', generate))
+        second = asyncio.ensure_future(flight.ado('key', generate))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == 'diary'
@@ -0,0 +1,68 @@
+"""
+请求阶段计时测试
+"""
+
+import asyncio
+
+from utils.timing import phase, server_timing
+
+
+class FakeResponse:
+    def __init__(self):
+        self.headers = {}
+
+
+def _rate_limited():
+    """与 app._rate_limited_response 相同形式的返回值"""
+    return {'success': False, 'error': '请求过于频繁', 'retry_after': 2.5}, 429, {'Retry-After': '3'}
+
+
+def test_response_object_gets_header():
+    @server_timing
+    def view():
+        with phase('parse'):
+            pass
+        return FakeResponse()
+
+    response = view()
+    assert 'parse;dur=' in response.headers['Server-Timing']
+
+
+def test_rate_limited_tuple_keeps_status_and_retry_after():
+    @server_timing
+    def view():
+        return _rate_limited()
+
+    body, status, headers = view()
+    assert body['retry_after'] == 2.5
+    assert status == 429
+    assert dict(headers)['Retry-After'] == '3'
+    assert 'total;dur=' in dict(headers)['Server-Timing']
+
+
+def test_async_rate_limited_tuple():
+    @server_timing
+    async def view():
+        return _rate_limited()
+
+    body, status, headers = asyncio.run(view())
+    assert status == 429
+    assert set(dict(headers)) == {'Retry-After', 'Server-Timing'}
+
+
+def test_plain_body_and_status():
+    @server_timing
+    def view():
+        return {'success': True}, 200
+
+    body, status, headers = view()
+    assert status == 200
+    assert [name for name, _ in headers] == ['Server-Timing']
+
+    @server_timing
+    def response_with_status():
+        return FakeResponse(), 400
+
+    response, status = response_with_status()
+    assert status == 400
+    assert 'Server-Timing' in response.headers
@@ -0,0 +1,70 @@
+"""
+Token预算测试
+"""
+
+from utils.token_budget import OMISSION_MARKER, compact_text, estimate_tokens, fit_fields
+
+
+def _single_paragraph(sentences):
+    return '，'.join(f'第{index}件事' for index in range(sentences)) + '。话题。'
+
+
+def _sections(count, sentences=50):
+    return '\n\n'.join(f'## 标题{index}\n' + '今天很好。' * sentences for index in range(count))
+
+
+def test_estimate_tokens_mixed_text():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('今天') == 2
+    assert estimate_tokens('abcdefgh') == 2
+    assert estimate_tokens('今天abc') == 3
+
+
+def test_text_within_budget_is_unchanged():
+    text = _sections(2, sentences=2)
+    assert compact_text(text, estimate_tokens(text)) == text
+
+
+def test_single_paragraph_slightly_over_budget_uses_the_budget():
+    text = _single_paragraph(800)
+    original, previous, compacted = fit_fields(text, '', 2750)
+
+    assert compacted
+    assert OMISSION_MARKER in original
+    assert original.startswith('第0件事')
+    assert original.endswith('话题。')
+    # 只省略超出的部分，而不是退化为首句
+    assert 2700 <= estimate_tokens(original) <= 2750
+
+
+def test_sections_keep_every_heading_and_fill_remaining_budget():
+    text = _sections(10)
+    result = compact_text(text, 1500)
+
+    assert estimate_tokens(result) <= 1500
+    assert result.count('## 标题') == 10
+    # 预算内按顺序恢复完整段落
+    assert result.startswith('## 标题0\n' + '今天很好。' * 50)
+    assert estimate_tokens(result) > 1500 - estimate_tokens('今天很好。' * 50)
+
+
+def test_outline_over_budget_falls_back_to_middle_truncation():
+    text = _sections(200)
+    result = compact_text(text, 300)
+
+    assert estimate_tokens(result) <= 300
+    assert OMISSION_MARKER in result
+
+
+def test_fit_fields_splits_budget_between_fields():
+    original = _single_paragraph(400)
+    previous = _single_paragraph(600)
+    fitted_original, fitted_previous, compacted = fit_fields(original, previous, 2000)
+
+    assert compacted
+    assert estimate_tokens(fitted_original) + estimate_tokens(fitted_previous) <= 2000
+
+
+def test_overhead_over_budget_with_empty_fields_is_not_compacted():
+    assert fit_fields('', '', -10) == ('', '', False)
+    assert fit_fields('今天', '', 10) == ('今天', '', False)
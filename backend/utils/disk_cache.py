@@ -0,0 +1,215 @@
+"""
+磁盘生成缓存 - 多个工作进程共享的SQLite缓存
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """多进程共享的持久化生成缓存
+    
+    以 (提供商, 模型, Prompt) 的16字节摘要为键，值为zlib压缩的JSON。使用WAL模式，
+    读取不阻塞写入，多个gunicorn工作进程可同时读写同一文件；读取通过mmap直接映射页面。
+    总大小超过max_bytes时按最近访问时间淘汰到low_watermark比例。
+    """
+    
+    # 访问时间的更新粒度（秒），避免每次命中都写入
+    TOUCH_INTERVAL = 60
+    # 每隔多少次写入清理一次过期条目
+    PURGE_EVERY = 200
+    
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, ttl: float = 0,
+                 low_watermark: float = 0.9, mmap_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl = float(ttl)  # 0表示不过期，只按大小淘汰
+        self.low_watermark = low_watermark
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evictions = 0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    key BLOB PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO meta VALUES ('bytes', 0)")
+    
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str) -> bytes:
+        """构建缓存键: Prompt摘要 + 提供商 + 模型"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (provider.lower(), model or '', prompt):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\x1f')
+        return digest.digest()
+    
+    def get(self, key: bytes) -> Optional[dict]:
+        """读取缓存，未命中或已过期返回None"""
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                'SELECT value, expires_at, accessed_at FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache read failed: {e}")
+            row = None
+        
+        if row is None or (row[1] is not None and row[1] <= now):
+            self._count('_misses')
+            return None
+        
+        value, _, accessed_at = row
+        if now - accessed_at > self.TOUCH_INTERVAL:
+            self._touch(key, now)
+        self._count('_hits')
+        return json.loads(zlib.decompress(value))
+    
+    def set(self, key: bytes, value: dict):
+        """写入缓存，总大小超过上限时淘汰最久未访问的条目"""
+        if self.max_bytes == 0:
+            return
+        
+        payload = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl > 0 else None
+        
+        try:
+            with self._connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                old = conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                    (key, payload, len(payload), expires_at, now)
+                )
+                total = self._adjust_bytes(conn, len(payload) - (old[0] if old else 0))
+                
+                with self._lock:
+                    self._writes += 1
+                    purge = self._writes % self.PURGE_EVERY == 0
+                if purge and self.ttl > 0:
+                    total = self._purge_expired(conn, now, total)
+                if total > self.max_bytes:
+                    self._evict(conn, total)
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache write failed: {e}")
+    
+    def clear(self):
+        """清空缓存，数据库被其他进程锁定时记录警告
+        
+        只删除条目，不执行VACUUM：重写整个文件需要独占锁，会阻塞所有工作进程。
+        释放的页面由之后的写入复用，需要缩小文件时在停止服务后离线执行VACUUM。
+        """
+        try:
+            with self._connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM entries')
+                conn.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache clear failed: {e}")
+    
+    def stats(self) -> dict:
+        """获取缓存统计：条目数、数据大小、文件占用和当前进程的命中率"""
+        conn = self._connection()
+        entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        data_bytes = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        file_bytes = sum(
+            os.path.getsize(self.path + suffix)
+            for suffix in ('', '-wal', '-shm') if os.path.exists(self.path + suffix)
+        )
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'path': self.path,
+                'entries': entries,
+                'bytes': data_bytes,  # 压缩后的数据大小
+                'file_bytes': file_bytes,  # 数据库文件实际占用（含WAL）
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
+    
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程使用独立连接，WAL模式下读取互不阻塞
+        
+        SQLite连接不能跨fork使用，工作进程中首次访问时重新建立连接。
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # 缓存丢失最后几次写入可以接受
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_bytes)}')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def _touch(self, key: bytes, now: float):
+        try:
+            self._connection().execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+        except sqlite3.Error:
+            pass  # 其他进程正在写入时跳过，只影响淘汰顺序
+    
+    def _evict(self, conn: sqlite3.Connection, total: int):
+        """按最近访问时间淘汰，直到总大小低于max_bytes * low_watermark"""
+        target = self.max_bytes * self.low_watermark
+        while total > target:
+            rows = conn.execute(
+                'SELECT key, size FROM entries ORDER BY accessed_at LIMIT 64'
+            ).fetchall()
+            if not rows:
+                break
+            freed = deleted = 0
+            for key, size in rows:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                freed += size
+                deleted += 1
+                if total - freed <= target:
+                    break
+            total = self._adjust_bytes(conn, -freed)
+            self._count('_evictions', deleted)
+    
+    def _purge_expired(self, conn: sqlite3.Connection, now: float, total: int) -> int:
+        freed = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries WHERE expires_at <= ?', (now,)
+        ).fetchone()[0]
+        if freed:
+            conn.execute('DELETE FROM entries WHERE expires_at <= ?', (now,))
+            total = self._adjust_bytes(conn, -freed)
+        return total
+    
+    @staticmethod
+    def _adjust_bytes(conn: sqlite3.Connection, delta: int) -> int:
+        conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+        return conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+    
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
@@ -0,0 +1,79 @@
+"""
+分组限流的并发执行工具
+"""
+
+import asyncio
+import queue
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+FanOutResult = Tuple[int, Any, Optional[Exception]]
+
+
+def _group_items(items: List[Any], group_key: Callable[[Any], str]) -> dict:
+    """按分组键将条目分组，保留原始下标"""
+    groups = defaultdict(deque)
+    for index, item in enumerate(items):
+        groups[group_key(item)].append((index, item))
+    return groups
+
+
+def fan_out(items: List[Any], worker: Callable[[Any], Any],
+            group_key: Callable[[Any], str], limit: int) -> Iterator[FanOutResult]:
+    """在线程池中并发执行worker，每个分组最多limit个并发
+    
+    按完成顺序产出 (下标, 结果, 异常)，执行成功时异常为None。
+    """
+    groups = _group_items(items, group_key)
+    results = queue.Queue()
+    
+    def drain(pending: deque):
+        while True:
+            try:
+                index, item = pending.popleft()
+            except IndexError:
+                return
+            try:
+                results.put((index, worker(item), None))
+            except Exception as e:
+                results.put((index, None, e))
+    
+    workers = sum(min(limit, len(pending)) for pending in groups.values())
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='fan-out')
+    try:
+        for pending in groups.values():
+            for _ in range(min(limit, len(pending))):
+                executor.submit(drain, pending)
+        
+        for _ in range(len(items)):
+            yield results.get()
+    finally:
+        # 提前中止时丢弃尚未开始的条目
+        for pending in groups.values():
+            pending.clear()
+        executor.shutdown(wait=False)
+
+
+async def afan_out(items: List[Any], worker: Callable[[Any], Any],
+                   group_key: Callable[[Any], str], limit: int) -> AsyncIterator[FanOutResult]:
+    """异步并发执行协程函数worker，每个分组最多limit个并发
+    
+    按完成顺序产出 (下标, 结果, 异常)，执行成功时异常为None。
+    """
+    semaphores = defaultdict(lambda: asyncio.Semaphore(limit))
+    
+    async def run(index: int, item: Any) -> FanOutResult:
+        async with semaphores[group_key(item)]:
+            try:
+                return index, await worker(item), None
+            except Exception as e:
+                return index, None, e
+    
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
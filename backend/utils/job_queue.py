@@ -0,0 +1,611 @@
+"""
+异步任务队列 - 带优先级的后台工作线程池
+"""
+
+import os
+import json
+import time
+import uuid
+import heapq
+import socket
+import sqlite3
+import logging
+import ipaddress
+import threading
+import urllib.request
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+from urllib.parse import urlparse
+
+from services.rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+# 优先级数值越小越先执行：交互式任务始终排在批量/回填任务之前
+PRIORITIES = {
+    'interactive': 0,
+    'bulk': 1
+}
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    """排队任务数达到上限时抛出"""
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """webhook不跟随重定向，避免校验过的地址被重定向到内网"""
+    
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_webhook_opener = urllib.request.build_opener(_NoRedirect)
+
+
+def check_webhook_url(url: str, allowed_hosts: Iterable[str] = ()):
+    """校验webhook地址，不允许时抛出ValueError
+    
+    配置了allowed_hosts时只接受列表中的主机及其子域名；否则解析主机名，拒绝解析到
+    回环、私有、链路本地（如169.254.169.254）等非公网地址的主机，防止借webhook访问内网服务。
+    """
+    parsed = urlparse(url)
+    try:
+        port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    except ValueError:
+        port = None
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname or port is None:
+        raise ValueError('webhook参数必须是http(s)地址')
+    
+    host = parsed.hostname.lower()
+    allowed_hosts = [allowed.lower() for allowed in allowed_hosts]
+    if allowed_hosts:
+        if not any(host == allowed or host.endswith('.' + allowed) for allowed in allowed_hosts):
+            raise ValueError(f'webhook主机不在允许列表中: {host}')
+        return
+    
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f'无法解析webhook主机: {host}')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f'webhook地址不能指向内网或保留地址: {host}')
+
+
+class Job:
+    """一个后台生成任务"""
+    
+    def __init__(self, kind: str, params: dict, priority: str = 'interactive',
+                 webhook: Optional[str] = None, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.priority = priority
+        self.webhook = webhook
+        self.status = QUEUED
+        self.attempts = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+    
+    def as_dict(self) -> dict:
+        """接口返回的任务状态，不包含请求参数和回调地址"""
+        return {
+            'id': self.id,
+            'type': self.kind,
+            'priority': self.priority,
+            'status': self.status,
+            'attempts': self.attempts,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'result': self.result,
+            'error': self.error
+        }
+    
+    def to_row(self) -> tuple:
+        return (
+            self.id, self.kind, self.priority, self.status, json.dumps(self.params, ensure_ascii=False),
+            self.webhook, self.attempts, json.dumps(self.result, ensure_ascii=False), self.error,
+            self.created_at, self.started_at, self.finished_at
+        )
+    
+    @classmethod
+    def from_row(cls, row) -> 'Job':
+        (job_id, kind, priority, status, params, webhook, attempts, result, error,
+         created_at, started_at, finished_at) = row
+        job = cls(kind, json.loads(params), priority, webhook, job_id)
+        job.status = status
+        job.attempts = attempts
+        job.result = json.loads(result) if result else None
+        job.error = error
+        job.created_at = created_at
+        job.started_at = started_at
+        job.finished_at = finished_at
+        return job
+
+
+class _SQLiteStore:
+    """任务持久化，多个工作进程共享，进程退出后其未完成的任务由其他进程接管
+    
+    每个未完成的任务记录持有它的进程（claimed_by）和最近一次续约时间（claimed_at），
+    持有进程定期续约；租约过期说明持有进程已退出，任意进程都可以原子地接管该任务。
+    """
+    
+    COLUMNS = ('id', 'kind', 'priority', 'status', 'params', 'webhook', 'attempts',
+               'result', 'error', 'created_at', 'started_at', 'finished_at')
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                webhook TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                claimed_by TEXT,
+                claimed_at REAL
+            )
+        ''')
+        # 旧版本创建的数据库没有租约字段
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+        for name, kind in (('claimed_by', 'TEXT'), ('claimed_at', 'REAL')):
+            if name not in existing:
+                conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {kind}')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+    
+    def _connection(self) -> sqlite3.Connection:
+        """SQLite连接不能跨fork使用，预加载后在工作进程中重新建立连接"""
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+        return self._conn
+    
+    @contextmanager
+    def _transaction(self):
+        """加写锁的事务，多个进程同时接管任务时只有一个能成功"""
+        conn = self._connection()
+        with self._lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+    
+    def save(self, job: Job, owner: str):
+        conn = self._connection()
+        with self._lock:
+            self._write(conn, job, owner)
+    
+    def claim(self, job: Job, owner: str) -> bool:
+        """开始执行前确认任务仍由owner持有并写入执行状态，已被其他进程接管时返回False"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT claimed_by FROM jobs WHERE id = ?', (job.id,)).fetchone()
+            if row is not None and row[0] not in (None, owner):
+                return False
+            self._write(conn, job, owner)
+            return True
+    
+    def load(self, job_id: str) -> Optional[Job]:
+        conn = self._connection()
+        with self._lock:
+            row = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return Job.from_row(row) if row else None
+    
+    def claim_stale(self, owner: str, stale_before: float) -> list:
+        """接管租约早于stale_before（或无人持有）的未完成任务，返回的任务保留原状态"""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status IN (?, ?) "
+                f"AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY created_at",
+                (QUEUED, RUNNING, stale_before)
+            ).fetchall()
+            now = time.time()
+            conn.executemany(
+                'UPDATE jobs SET claimed_by = ?, claimed_at = ? WHERE id = ?',
+                [(owner, now, row[0]) for row in rows]
+            )
+        return [Job.from_row(row) for row in rows]
+    
+    def renew(self, owner: str):
+        """续约owner持有的未完成任务"""
+        conn = self._connection()
+        with self._lock:
+            conn.execute(
+                'UPDATE jobs SET claimed_at = ? WHERE claimed_by = ? AND status IN (?, ?)',
+                (time.time(), owner, QUEUED, RUNNING)
+            )
+    
+    def release(self, owner: str):
+        """释放owner持有的未完成任务，其他进程下次检查时即可接管"""
+        conn = self._connection()
+        with self._lock:
+            conn.execute(
+                'UPDATE jobs SET claimed_by = NULL, claimed_at = NULL WHERE claimed_by = ? AND status IN (?, ?)',
+                (owner, QUEUED, RUNNING)
+            )
+    
+    def purge(self, finished_before: float):
+        conn = self._connection()
+        with self._lock:
+            conn.execute(
+                'DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?', (finished_before,)
+            )
+    
+    def _write(self, conn: sqlite3.Connection, job: Job, owner: str):
+        columns = self.COLUMNS + ('claimed_by', 'claimed_at')
+        conn.execute(
+            f"INSERT OR REPLACE INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            job.to_row() + (owner, time.time())
+        )
+
+
+class JobQueue:
+    """带优先级的异步任务队列
+    
+    任务提交后立即返回任务ID，由固定数量的后台工作线程按优先级执行handler，
+    客户端轮询任务状态或通过webhook接收完成通知，长时间生成不再占用HTTP连接。
+    批量任务最多占用bulk_workers个工作线程，其余线程始终留给交互式任务。
+    
+    配置db_path时任务写入SQLite，多个工作进程共用同一数据库时可以查询彼此的任务。
+    每个进程每lease_timeout/3秒续约自己持有的任务，并接管租约超过lease_timeout秒未续约
+    （所在进程崩溃、重启或已退出）的任务，进程重启后未完成的任务也由此继续执行。
+    """
+    
+    def __init__(self, handler: Callable[[Job], Any], workers: int = 4, bulk_workers: Optional[int] = None,
+                 max_queued: int = 1000, max_attempts: int = 3, result_ttl: float = 3600,
+                 db_path: Optional[str] = None, webhook_timeout: float = 5, webhook_retries: int = 3,
+                 webhook_allowed_hosts: Iterable[str] = (), lease_timeout: float = 30):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.bulk_workers = max(1, min(self.workers, bulk_workers or max(1, self.workers // 2)))
+        self.max_queued = max_queued
+        self.max_attempts = max(1, max_attempts)
+        self.result_ttl = result_ttl
+        self.webhook_timeout = webhook_timeout
+        self.webhook_retries = webhook_retries
+        self.webhook_allowed_hosts = list(webhook_allowed_hosts)
+        self.lease_timeout = lease_timeout
+        self._store = _SQLiteStore(db_path) if db_path else None
+        self._owner = None
+        self._owner_pid = None
+        self._jobs = {}  # 任务ID -> Job，已完成的任务保留result_ttl秒
+        self._heap = []  # (优先级, 序号, 任务ID)
+        self._delayed = []  # (可执行时间, 序号, 任务ID)，被限流后等待重试的任务
+        self._sequence = 0
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._completed = 0
+        self._failed = 0
+        self._retried = 0
+        self._recovered = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._stopped = threading.Event()
+        self._webhooks = ThreadPoolExecutor(max_workers=2, thread_name_prefix='job-webhook')
+    
+    @property
+    def owner(self) -> str:
+        """当前进程的租约持有者标识，fork后的工作进程重新生成"""
+        if self._owner_pid != os.getpid():
+            self._owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+            self._owner_pid = os.getpid()
+        return self._owner
+    
+    def start(self, restore: bool = True):
+        """启动后台工作线程
+        
+        restore为True时立即接管SQLite中租约已过期的未完成任务，否则等到第一次续约检查。
+        只接管租约过期的任务，多个工作进程同时启动也不会重复执行同一任务。
+        """
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            self._stopped.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'job-worker-{index}', daemon=True)
+                for index in range(self.workers)
+            ]
+            if self._store is not None:
+                self._threads.append(threading.Thread(target=self._maintain, name='job-lease', daemon=True))
+        if restore and self._store is not None:
+            self._recover()
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Job queue started, workers: {self.workers}, bulk workers: {self.bulk_workers}")
+    
+    def stop(self, timeout: Optional[float] = None):
+        """停止工作线程，最多等待timeout秒让正在执行的任务完成，未开始的任务保留在队列中"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._stopped.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        
+        with self._cond:
+            running = sum(self._running.values())
+            queued = len(self._heap) + len(self._delayed)
+            if running or queued:
+                logger.warning(f"Job queue stopped with {running} running and {queued} queued jobs"
+                               + ('' if self._store is not None else ' (not persisted)'))
+        
+        if self._store is not None:
+            # 释放未完成的任务，其他工作进程不必等租约过期即可接管
+            try:
+                self._store.release(self.owner)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to release unfinished jobs: {e}")
+    
+    def submit(self, kind: str, params: dict, priority: str = 'interactive',
+               webhook: Optional[str] = None) -> Job:
+        """提交任务，返回排队中的任务"""
+        if priority not in PRIORITIES:
+            raise ValueError(f"不支持的任务优先级: {priority}")
+        
+        job = Job(kind, params, priority, webhook)
+        with self._cond:
+            if len(self._heap) + len(self._delayed) >= self.max_queued:
+                raise QueueFull(f"排队任务数已达上限（{self.max_queued}），请稍后重试")
+            self._purge_expired()
+            self._jobs[job.id] = job
+            self._save(job)
+            self._push(job)
+            self._cond.notify()
+        return job
+    
+    def validate_webhook(self, url: str):
+        """提交任务前校验webhook地址，不允许时抛出ValueError"""
+        check_webhook_url(url, self.webhook_allowed_hosts)
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        """查询任务，不在本进程内存中的任务（其他工作进程提交的或已过期的）从SQLite读取"""
+        job = self._jobs.get(job_id)
+        if job is None and self._store is not None:
+            job = self._store.load(job_id)
+        return job
+    
+    def stats(self) -> dict:
+        """获取队列统计"""
+        with self._cond:
+            queued = {priority: 0 for priority in PRIORITIES}
+            for _, _, job_id in self._heap + self._delayed:
+                queued[self._jobs[job_id].priority] += 1
+            return {
+                'workers': self.workers,
+                'bulk_workers': self.bulk_workers,
+                'queued': queued,  # 包括等待限流重试的任务
+                'delayed': len(self._delayed),
+                'running': dict(self._running),
+                'completed': self._completed,
+                'failed': self._failed,
+                'retried': self._retried,
+                'recovered': self._recovered,
+                'persistent': self._store is not None
+            }
+    
+    def _maintain(self):
+        """定期续约本进程持有的任务，并接管租约过期的任务"""
+        while not self._stopped.wait(self.lease_timeout / 3):
+            try:
+                self._store.renew(self.owner)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to renew job leases: {e}")
+            self._recover()
+    
+    def _recover(self):
+        """接管租约过期的未完成任务
+        
+        执行中被中断的任务在开始执行时已计入attempts，重新排队前检查次数：每次执行都导致
+        工作进程崩溃的任务达到max_attempts后标记为失败，不再在进程间反复接管。
+        """
+        try:
+            jobs = self._store.claim_stale(self.owner, time.time() - self.lease_timeout)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to recover unfinished jobs: {e}")
+            return
+        
+        recovered = 0
+        exhausted = []
+        with self._cond:
+            for job in jobs:
+                if job.id in self._jobs:
+                    continue
+                interrupted = job.status == RUNNING
+                job.status = QUEUED
+                job.started_at = None
+                self._jobs[job.id] = job
+                if interrupted and job.attempts >= self.max_attempts:
+                    exhausted.append(job)
+                    continue
+                self._push(job)
+                recovered += 1
+            self._recovered += recovered
+            self._cond.notify_all()
+        if recovered:
+            logger.info(f"Recovered {recovered} unfinished jobs from {self._store.path}")
+        for job in exhausted:
+            logger.warning(f"Job {job.id} was interrupted {job.attempts} times, giving up")
+            self._finish(job, error=f'任务执行中断{job.attempts}次，已放弃')
+    
+    def _push(self, job: Job):
+        self._sequence += 1
+        heapq.heappush(self._heap, (PRIORITIES[job.priority], self._sequence, job.id))
+    
+    def _next_job(self) -> Optional[Job]:
+        """取出下一个可执行的任务；堆顶为批量任务说明没有交互式任务排队"""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._push(self._jobs[heapq.heappop(self._delayed)[2]])
+        if not self._heap:
+            return None
+        job = self._jobs[self._heap[0][2]]
+        if job.priority == 'bulk' and self._running['bulk'] >= self.bulk_workers:
+            return None
+        heapq.heappop(self._heap)
+        return job
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._stopping:
+                        return
+                    self._cond.wait(max(0.0, self._delayed[0][0] - time.monotonic()) if self._delayed else None)
+                    job = self._next_job()
+                job.status = RUNNING
+                job.attempts += 1
+                job.started_at = time.time()
+                self._running[job.priority] += 1
+            
+            # 写入SQLite在锁外进行，数据库繁忙时不阻塞提交、查询和其他工作线程
+            if not self._claim(job):
+                logger.info(f"Job {job.id} was taken over by another worker, skipping")
+                with self._cond:
+                    self._running[job.priority] -= 1
+                    self._jobs.pop(job.id, None)
+                    self._cond.notify_all()
+                continue
+            
+            try:
+                self._execute(job)
+            finally:
+                with self._cond:
+                    self._running[job.priority] -= 1
+                    self._cond.notify_all()
+    
+    def _execute(self, job: Job):
+        try:
+            result = self.handler(job)
+        except RateLimitExceeded as e:
+            if job.attempts < self.max_attempts:
+                # 被限流的任务按建议的等待时间重新排队，不计为失败
+                logger.info(f"Job {job.id} rate limited, retrying in {e.retry_after:.1f}s")
+                self._retry_later(job, e.retry_after)
+                return
+            self._finish(job, error=str(e))
+        except Exception as e:
+            message = str(e) if isinstance(e, ValueError) else f'生成失败: {str(e)}'
+            logger.error(f"Job {job.id} failed: {e}", exc_info=not isinstance(e, ValueError))
+            self._finish(job, error=message)
+        else:
+            self._finish(job, result=result)
+    
+    def _retry_later(self, job: Job, delay: float):
+        """任务在延迟队列中等待delay秒后重新排队，期间计入排队数"""
+        job.status = QUEUED
+        job.started_at = None
+        self._save(job)
+        with self._cond:
+            self._retried += 1
+            self._sequence += 1
+            heapq.heappush(self._delayed, (time.monotonic() + delay, self._sequence, job.id))
+            self._cond.notify_all()
+    
+    def _finish(self, job: Job, result: Any = None, error: Optional[str] = None):
+        with self._cond:
+            job.result = result
+            job.error = error
+            job.status = FAILED if error is not None else SUCCEEDED
+            job.finished_at = time.time()
+            if error is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+        self._save(job)
+        
+        if job.webhook:
+            self._webhooks.submit(self._deliver_webhook, job)
+    
+    def _deliver_webhook(self, job: Job):
+        """POST任务最终状态到webhook地址，失败时指数退避重试
+        
+        发送前重新校验地址（主机的解析结果可能已改变），不跟随重定向。
+        """
+        try:
+            self.validate_webhook(job.webhook)
+        except ValueError as e:
+            logger.warning(f"Webhook for job {job.id} rejected: {e}")
+            return
+        
+        body = json.dumps(job.as_dict(), ensure_ascii=False).encode('utf-8')
+        for attempt in range(self.webhook_retries + 1):
+            request = urllib.request.Request(
+                job.webhook, data=body, method='POST',
+                headers={'Content-Type': 'application/json', 'X-Job-Id': job.id}
+            )
+            try:
+                with _webhook_opener.open(request, timeout=self.webhook_timeout):
+                    return
+            except Exception as e:
+                logger.warning(f"Webhook for job {job.id} failed (attempt {attempt + 1}): {e}")
+                if attempt < self.webhook_retries:
+                    time.sleep(2 ** attempt)
+    
+    def _save(self, job: Job):
+        if self._store is None:
+            return
+        try:
+            self._store.save(job, self.owner)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist job {job.id}: {e}")
+    
+    def _claim(self, job: Job) -> bool:
+        """写入执行状态，任务已被其他进程接管时返回False；无法确认时照常执行"""
+        if self._store is None:
+            return True
+        try:
+            return self._store.claim(job, self.owner)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to persist job {job.id}: {e}")
+            return True
+    
+    def _purge_expired(self):
+        """清理超过保留时间的已完成任务"""
+        expire_before = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < expire_before
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if expired and self._store is not None:
+            try:
+                self._store.purge(expire_before)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to purge finished jobs: {e}")
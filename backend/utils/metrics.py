@@ -0,0 +1,278 @@
+"""
+监控指标 - Prometheus文本格式的计数器、仪表和直方图
+"""
+
+import math
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# AI调用耗时较长，桶边界覆盖100ms到60s
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# HTTP接口（含缓存命中）的桶边界
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Value:
+    """单个标签组合的数值，每个实例独立加锁，不同标签之间互不竞争"""
+    
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+    
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+    
+    def set(self, value: float):
+        self.value = float(value)
+
+
+class _HistogramValue:
+    """单个标签组合的直方图，记录时只累加所在桶，输出时再计算累计值"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    """指标基类，按标签值元组保存子指标"""
+    
+    kind = ''
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+    
+    def labels(self, *values):
+        """获取标签值对应的子指标，仅首次创建时加锁"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签: {', '.join(self.labelnames)}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    def _new_child(self):
+        return _Value()
+    
+    def samples(self):
+        """生成 (后缀, 标签字典, 值)"""
+        for key, child in list(self._children.items()):
+            yield '', dict(zip(self.labelnames, key)), child.value
+
+
+class Counter(_Metric):
+    """只增计数器"""
+    
+    kind = 'counter'
+    
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """可增可减的仪表"""
+    
+    kind = 'gauge'
+    
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+    
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+    
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """分桶直方图"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+    
+    def observe(self, value: float):
+        self.labels().observe(value)
+    
+    def samples(self):
+        for key, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, key))
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield '_bucket', {**labels, 'le': _format_value(bound)}, cumulative
+            yield '_count', labels, cumulative
+            yield '_sum', labels, total
+
+
+class MetricsRegistry:
+    """指标注册表
+    
+    除直接记录的指标外，还可注册采集函数，在输出时读取缓存等组件的统计信息。
+    """
+    
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def register_collector(self, collector: Callable[[], Iterable[tuple]]):
+        """注册采集函数，函数返回 (名称, 类型, 说明, 值[, 标签字典]) 列表，同名指标可带不同标签出现多次"""
+        with self._lock:
+            self._collectors.append(collector)
+    
+    def render(self) -> str:
+        """输出Prometheus文本格式"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        
+        collected = {}
+        for collector in list(self._collectors):
+            for name, kind, documentation, value, *labels in collector():
+                entry = collected.setdefault(name, (kind, documentation, []))
+                entry[2].append((labels[0] if labels else {}, value))
+        
+        for name, (kind, documentation, samples) in collected.items():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        
+        return '\n'.join(lines) + '\n'
+    
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标已注册: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return '{' + pairs + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'diary_http_requests_total', 'HTTP请求数', ('method', 'route', 'status')
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    'diary_http_request_duration_seconds', 'HTTP请求耗时', ('method', 'route'), HTTP_BUCKETS
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge('diary_http_requests_in_flight', '处理中的HTTP请求数')
+
+AI_REQUESTS = REGISTRY.counter(
+    'diary_ai_requests_total', 'AI生成调用数', ('provider', 'model', 'status')
+)
+AI_LATENCY = REGISTRY.histogram(
+    'diary_ai_request_duration_seconds', 'AI生成调用耗时', ('provider', 'model')
+)
+AI_IN_FLIGHT = REGISTRY.gauge('diary_ai_requests_in_flight', '进行中的AI生成调用数', ('provider',))
+AI_TOKENS = REGISTRY.counter(
+    'diary_ai_tokens_total', '提供商返回的token用量', ('provider', 'model', 'kind')
+)
+
+
+class track_generation:
+    """记录一次AI生成调用的进行中数量、耗时和结果
+    
+    可包裹同步调用、异步调用或流式迭代；被取消（包括客户端断开流式连接）时记为cancelled。
+    """
+    
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self._start = 0.0
+    
+    def __enter__(self):
+        AI_IN_FLIGHT.labels(self.provider).inc()
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback):
+        elapsed = time.perf_counter() - self._start
+        AI_IN_FLIGHT.labels(self.provider).dec()
+        
+        if exc_type is None:
+            status = 'success'
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+            status = 'cancelled'
+        else:
+            status = 'error'
+        AI_REQUESTS.labels(self.provider, self.model, status).inc()
+        AI_LATENCY.labels(self.provider, self.model).observe(elapsed)
+        return False
+
+
+def record_token_usage(provider: str, model: str, prompt_tokens: Optional[int],
+                       completion_tokens: Optional[int]):
+    """记录提供商返回的token用量，缺失的字段跳过"""
+    if prompt_tokens:
+        AI_TOKENS.labels(provider, model, 'prompt').inc(prompt_tokens)
+    if completion_tokens:
+        AI_TOKENS.labels(provider, model, 'completion').inc(completion_tokens)
@@ -0,0 +1,175 @@
+"""
+生成结果后处理 - 与提供商无关的增量清理
+
+按到达顺序逐段处理模型输出，阻塞和流式生成共用同一实现:
+1. 去除开头的客套话（如 "这是根据您的要求生成的日记：")
+2. 去除Markdown代码块标记，结束标记之后的内容一并丢弃
+3. emoji数量超过风格配置的emoji_count时丢弃多余的emoji
+4. 规范空白：去除首尾空白和行尾空格，连续空行合并为一个
+"""
+
+import re
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional
+
+# 开头客套话所在的整行：只有应答词的行，或提到生成/日记/内容并以冒号结尾的说明行。
+# 日记正文也常以 "这是我们在一起的第100天" 开头，不以冒号结尾的行一律保留
+_PREAMBLE_PATTERN = re.compile(
+    r'(?:(?:好的|当然|没问题)[，,！!。~～ ]*)?'
+    r'(?:(?:这是|以下是|下面是)[^\n]{0,40}?(?:生成|日记|内容)[^\n]{0,40}?[：:]'
+    r'|(?:好的|当然|没问题)[，,！!。~～ ]*)'
+)
+# 开头以这些内容起始时需要等到首行完整才能判断是否为客套话或代码块标记
+_HEAD_KEYWORDS = ('```', '好的', '当然', '没问题', '这是', '以下是', '下面是')
+# 首行超过该长度仍未结束时不再视为客套话
+_HEAD_LIMIT = 120
+
+# emoji基础字符，emoji组合还可能包含变体选择符和零宽连接符
+_EMOJI_CHAR = '\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF'
+_EMOJI_JOINERS = '\u200D\uFE0F'
+_EMOJI = f'[{_EMOJI_CHAR}]\uFE0F?(?:\u200D[{_EMOJI_CHAR}]\uFE0F?)*'
+# 需要规范的换行：行尾空格和连续空行，连续空行合并为一个，保留换行后的缩进
+_NEWLINES = r'[ \t\r\f\v]+\n(?:[ \t\r\f\v\u3000]*\n)*|\n(?:[ \t\r\f\v\u3000]*\n)+'
+# 限制emoji数量时一次扫描同时匹配emoji和换行
+_BODY_PATTERN = re.compile(f'(?P<emoji>{_EMOJI})|(?P<newlines>{_NEWLINES})')
+_NEWLINES_PATTERN = re.compile(_NEWLINES)
+
+
+def _is_tail_char(char: str) -> bool:
+    """分段末尾需要暂存的字符：空白要与后续内容一起规范，emoji组合可能跨段"""
+    return (char.isspace() or char in _EMOJI_JOINERS or '\U0001F000' <= char <= '\U0001FAFF'
+            or '\u2600' <= char <= '\u27BF' or '\u2B00' <= char <= '\u2BFF')
+
+
+def _normalize_newlines(match) -> str:
+    return '\n\n' if match.group().count('\n') > 1 else '\n'
+
+
+class OutputPostProcessor:
+    """增量后处理器
+    
+    feed() 接收一段输出，返回当前可以确定的清理结果；finish() 返回剩余内容。
+    开头只缓冲到能判断是否为客套话或代码块标记为止，之后每段只暂存末尾的空白、
+    emoji和可能属于结束标记的反引号，不影响流式输出的首字延迟。
+    """
+    
+    def __init__(self, max_emojis: Optional[int] = None):
+        self.max_emojis = max_emojis  # None表示不限制
+        self.emojis = 0
+        self._head = True
+        self._fenced = False
+        self._done = False
+        self._started = False
+        self._pending = ''
+        self._tail = ''
+    
+    def feed(self, chunk: str) -> str:
+        """处理一段输出，返回可以输出的部分"""
+        if self._done or not chunk:
+            return ''
+        self._pending += chunk
+        
+        if self._head and not self._consume_head():
+            return ''
+        
+        if self._fenced:
+            end = self._pending.find('```')
+            if end != -1:
+                self._done = True
+                text, self._pending = self._pending[:end], ''
+                return self._clean(text, final=True)
+            
+            keep = len(self._pending) - len(self._pending.rstrip('`'))
+            text = self._pending[:len(self._pending) - keep]
+            self._pending = self._pending[len(text):]
+        else:
+            text, self._pending = self._pending, ''
+        return self._clean(text)
+    
+    def finish(self) -> str:
+        """输出结束，返回剩余内容"""
+        if self._done:
+            return ''
+        self._done = True
+        if self._head:
+            self._consume_head(final=True)
+        text, self._pending = self._pending, ''
+        return self._clean(text, final=True)
+    
+    def _consume_head(self, final: bool = False) -> bool:
+        """逐行去除开头的客套话和代码块起始标记，返回开头是否已处理完"""
+        while True:
+            head = self._pending.lstrip()
+            newline = head.find('\n')
+            line = head if newline == -1 else head[:newline]
+            
+            if newline == -1 and not final:
+                waiting = any(
+                    keyword.startswith(head) or head.startswith(keyword) for keyword in _HEAD_KEYWORDS
+                )
+                if waiting and len(head) < _HEAD_LIMIT:
+                    self._pending = head
+                    return False
+            
+            if line.startswith('```') and not self._fenced:
+                self._fenced = True
+            elif not (line and _PREAMBLE_PATTERN.fullmatch(line.rstrip())):
+                self._pending = head
+                self._head = False
+                return True
+            self._pending = '' if newline == -1 else head[newline + 1:]
+    
+    def _clean(self, text: str, final: bool = False) -> str:
+        """对正文限制emoji数量并规范空白，末尾的空白和emoji留到下一段一起处理"""
+        text = self._tail + text
+        if final:
+            self._tail = ''
+            text = text.rstrip()
+        else:
+            cut = len(text)
+            while cut and _is_tail_char(text[cut - 1]):
+                cut -= 1
+            text, self._tail = text[:cut], text[cut:]
+        
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        if self.max_emojis is None:
+            return _NEWLINES_PATTERN.sub(_normalize_newlines, text)
+        return _BODY_PATTERN.sub(self._replace, text)
+    
+    def _replace(self, match) -> str:
+        if match.lastgroup == 'newlines':
+            return _normalize_newlines(match)
+        self.emojis += 1
+        return match.group() if self.emojis <= self.max_emojis else ''
+
+
+def post_process(text: str, max_emojis: Optional[int] = None) -> str:
+    """清理一次性返回的完整输出"""
+    processor = OutputPostProcessor(max_emojis)
+    return processor.feed(text) + processor.finish()
+
+
+def post_process_stream(chunks: Iterable[str], max_emojis: Optional[int] = None) -> Iterator[str]:
+    """逐段清理流式输出，跳过清理后为空的分段"""
+    processor = OutputPostProcessor(max_emojis)
+    for chunk in chunks:
+        text = processor.feed(chunk)
+        if text:
+            yield text
+    text = processor.finish()
+    if text:
+        yield text
+
+
+async def apost_process_stream(chunks: AsyncIterable[str],
+                               max_emojis: Optional[int] = None) -> AsyncIterator[str]:
+    """逐段清理异步流式输出"""
+    processor = OutputPostProcessor(max_emojis)
+    async for chunk in chunks:
+        text = processor.feed(chunk)
+        if text:
+            yield text
+    text = processor.finish()
+    if text:
+        yield text
@@ -2,6 +2,12 @@
 Prompt构建器
 """
 
+import os
+from datetime import date as date_type
+
+from utils.prompt_templates import PromptTemplateRegistry
+from utils.token_budget import estimate_tokens, fit_fields
+
 
 class PromptBuilder:
     """日记Prompt构建器"""
@@ -25,9 +31,41 @@ class PromptBuilder:
         'angry': '生气、不满、委屈'
     }
     
+    # assets/prompts 模板，按日记类型选择，文件修改后自动重载
+    templates = PromptTemplateRegistry(
+        check_interval=float(os.getenv('PROMPT_RELOAD_INTERVAL', 2))
+    )
+    
+    # 日记类型配置的模板不存在时使用的模板
+    FALLBACK_TEMPLATE = 'base_diary'
+    
+    # 双视角合成日记模板
+    DUAL_TEMPLATE = 'dual_perspective'
+    
+    @classmethod
+    def default_style_for(cls, diary_type: str) -> str:
+        """获取日记类型的默认风格"""
+        config = cls.templates.diary_type(diary_type) or {}
+        return config.get('default_style', 'warm')
+    
     @classmethod
-    def build_diary_prompt(cls, content: str, style: str = 'warm', mood: str = None) -> str:
-        """构建日记生成Prompt"""
+    def emoji_limit(cls, style: str) -> int:
+        """风格配置的emoji数量上限，与Prompt中要求的数量一致"""
+        style_config = cls.templates.style(style) or cls.templates.style('warm') or {}
+        return style_config.get('emoji_count', 3)
+    
+    @classmethod
+    def build_diary_prompt(cls, content: str, style: str = 'warm', mood: str = None,
+                           diary_type: str = None, gender: str = None,
+                           partner_name: str = None, date: str = None) -> str:
+        """构建日记生成Prompt
+        
+        指定diary_type时使用该类型在defaults.json中配置的模板渲染，否则使用内置Prompt。
+        """
+        if diary_type:
+            return cls._build_template_prompt(
+                content, style, mood, diary_type, gender, partner_name, date
+            )
         
         # 获取风格描述
         style_desc = cls.STYLE_DESCRIPTIONS.get(style, cls.STYLE_DESCRIPTIONS['warm'])
@@ -97,3 +135,81 @@ class PromptBuilder:
 请生成一个全新版本:"""
         
         return prompt
+    
+    @classmethod
+    def build_budgeted_regenerate_prompt(cls, original_content: str, previous_ai_content: str,
+                                         style: str = 'warm', mood: str = None,
+                                         token_budget: int = 4000):
+        """构建不超过token预算的重新生成Prompt，返回 (Prompt, 预算信息)
+        
+        超出预算时压缩原始记录和之前生成的版本。
+        """
+        overhead = estimate_tokens(cls.build_regenerate_prompt('', '', style, mood))
+        original_content, previous_ai_content, compacted = fit_fields(
+            original_content, previous_ai_content, token_budget - overhead
+        )
+        
+        prompt = cls.build_regenerate_prompt(original_content, previous_ai_content, style, mood)
+        return prompt, {
+            'budget': token_budget,
+            'estimated_tokens': estimate_tokens(prompt),
+            'compacted': compacted
+        }
+    
+    @classmethod
+    def build_key_moments_prompt(cls, content: str, perspective: str) -> str:
+        """构建双视角日记的预处理Prompt：从一方的记录中提取关键时刻和感受"""
+        return f"""下面是一对情侣中{perspective}对今天的记录。请提取其中的关键时刻和{perspective}的真实感受，供之后与另一方的记录合成共同日记。
+
+**{perspective}的记录**: {content}
+
+**要求**:
+1. 列出3-5个关键时刻，每条一行，以"- "开头，包含发生了什么和{perspective}的感受
+2. 保留记录中的具体细节（时间、地点、对话、小物件）
+3. 不要编造记录中没有的内容，不要评价
+
+直接输出列表，不要任何解释:"""
+    
+    @classmethod
+    def build_dual_prompt(cls, her_content: str, his_content: str, date: str = None,
+                          her_moments: str = None, his_moments: str = None) -> str:
+        """使用双视角模板构建合成日记Prompt，附带预处理提取的双方关键时刻"""
+        def with_moments(content, moments):
+            if not moments:
+                return content
+            lines = '\n'.join(f"    {line.strip()}" for line in moments.splitlines() if line.strip())
+            return f"{content}\n  关键时刻:\n{lines}"
+        
+        return cls.templates.get(cls.DUAL_TEMPLATE).render({
+            'her_content': with_moments(her_content, her_moments),
+            'his_content': with_moments(his_content, his_moments),
+            'date': date or date_type.today().isoformat()
+        })
+    
+    @classmethod
+    def _build_template_prompt(cls, content: str, style: str, mood: str, diary_type: str,
+                               gender: str, partner_name: str, date: str) -> str:
+        """使用日记类型对应的模板构建Prompt"""
+        type_config = cls.templates.diary_type(diary_type)
+        if type_config is None:
+            raise ValueError(f"不支持的日记类型: {diary_type}")
+        
+        template_name = type_config.get('prompt_template', cls.FALLBACK_TEMPLATE)
+        if not cls.templates.has(template_name):
+            template_name = cls.FALLBACK_TEMPLATE
+        
+        style_config = cls.templates.style(style) or cls.templates.style('warm') or {}
+        mood_config = cls.templates.mood(mood) if mood else None
+        
+        return cls.templates.get(template_name).render({
+            'content': content,
+            'type': type_config.get('name', diary_type),
+            'gender': gender or '未提供',
+            'partner_name': partner_name or 'TA',
+            'style': style_config.get('name', style),
+            'mood': mood_config['name'] if mood_config else '未指定',
+            'date': date or date_type.today().isoformat(),
+            'word_count_min': style_config.get('word_count_min', 300),
+            'word_count_max': style_config.get('word_count_max', 500),
+            'emoji_count': style_config.get('emoji_count', 3)
+        })
@@ -0,0 +1,162 @@
+"""
+Prompt模板 - 加载并预编译 assets/prompts 下的 {{var}} 模板，文件变更后自动重载
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = os.getenv(
+    'PROMPT_ASSETS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'assets')
+)
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# 模板中允许出现的变量
+KNOWN_VARIABLES = {
+    'content', 'type', 'gender', 'partner_name', 'style', 'mood', 'date',
+    'word_count_min', 'word_count_max', 'emoji_count',
+    'her_content', 'his_content'
+}
+
+
+class PromptTemplate:
+    """预编译的Prompt模板
+    
+    加载时将 {{var}} 模板转换为 str.format 格式串，渲染时不再解析模板。
+    """
+    
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.placeholders = frozenset(PLACEHOLDER_PATTERN.findall(source))
+        
+        unknown = self.placeholders - KNOWN_VARIABLES
+        if unknown:
+            raise ValueError(f"模板 {name} 包含未知变量: {', '.join(sorted(unknown))}")
+        
+        # re.split交替返回字面文本和变量名，只对字面文本中的花括号转义
+        parts = PLACEHOLDER_PATTERN.split(source)
+        self._format = ''.join(
+            part.replace('{', '{{').replace('}', '}}') if index % 2 == 0 else '{' + part + '}'
+            for index, part in enumerate(parts)
+        )
+    
+    def render(self, variables: Dict[str, object]) -> str:
+        """渲染模板，缺少变量时抛出ValueError"""
+        missing = self.placeholders - variables.keys()
+        if missing:
+            raise ValueError(f"模板 {self.name} 缺少变量: {', '.join(sorted(missing))}")
+        return self._format.format_map(variables)
+
+
+class PromptTemplateRegistry:
+    """Prompt模板及配置注册表
+    
+    首次使用时加载 prompts/*.txt 和 configs/*.json，之后每隔check_interval秒
+    检查一次文件修改时间，只重新编译发生变化的文件。重载失败时保留旧版本。
+    """
+    
+    def __init__(self, assets_dir: str = ASSETS_DIR, check_interval: float = 2.0):
+        self.prompts_dir = os.path.join(assets_dir, 'prompts')
+        self.configs_dir = os.path.join(assets_dir, 'configs')
+        self.check_interval = check_interval
+        self._templates = {}  # 模板名 -> (mtime, PromptTemplate)
+        self._configs = {}  # 配置名 -> (mtime, dict)
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+    
+    def get(self, name: str) -> PromptTemplate:
+        """获取模板，不存在时抛出ValueError"""
+        self._maybe_reload()
+        entry = self._templates.get(name)
+        if entry is None:
+            raise ValueError(f"Prompt模板不存在: {name}")
+        return entry[1]
+    
+    def has(self, name: str) -> bool:
+        """模板是否存在"""
+        self._maybe_reload()
+        return name in self._templates
+    
+    def config(self, name: str) -> dict:
+        """获取JSON配置（如defaults、styles），不存在时返回空字典"""
+        self._maybe_reload()
+        entry = self._configs.get(name)
+        return entry[1] if entry else {}
+    
+    def diary_type(self, diary_type: str) -> Optional[dict]:
+        """获取日记类型配置"""
+        for entry in self.config('defaults').get('diary_types', []):
+            if entry.get('id') == diary_type:
+                return entry
+        return None
+    
+    def style(self, style_id: str) -> Optional[dict]:
+        """获取风格配置"""
+        for entry in self.config('styles').get('styles', []):
+            if entry.get('id') == style_id:
+                return entry
+        return None
+    
+    def mood(self, mood_id: str) -> Optional[dict]:
+        """获取心情标签配置"""
+        for entry in self.config('defaults').get('mood_tags', []):
+            if entry.get('id') == mood_id:
+                return entry
+        return None
+    
+    def reload(self):
+        """立即检查并重载有变化的文件"""
+        with self._lock:
+            self._templates = self._scan(self.prompts_dir, '.txt', self._templates, self._load_template)
+            self._configs = self._scan(self.configs_dir, '.json', self._configs, self._load_config)
+            self._last_check = time.monotonic()
+    
+    def _maybe_reload(self):
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.reload()
+    
+    @staticmethod
+    def _scan(directory, suffix, current, loader):
+        """扫描目录，返回新的 {名称: (mtime, 内容)}，未变化的条目直接复用"""
+        updated = {}
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.name.endswith(suffix)]
+        except FileNotFoundError:
+            logger.warning(f"Prompt assets directory not found: {directory}")
+            return current
+        
+        for entry in entries:
+            name = entry.name[:-len(suffix)]
+            mtime = entry.stat().st_mtime
+            previous = current.get(name)
+            if previous is not None and previous[0] == mtime:
+                updated[name] = previous
+                continue
+            
+            try:
+                updated[name] = (mtime, loader(name, entry.path))
+                logger.info(f"Loaded prompt asset: {entry.name}")
+            except Exception as e:
+                logger.error(f"Failed to load prompt asset {entry.name}: {e}")
+                if previous is not None:
+                    updated[name] = previous
+        
+        return updated
+    
+    @staticmethod
+    def _load_template(name, path):
+        with open(path, encoding='utf-8') as f:
+            return PromptTemplate(name, f.read())
+    
+    @staticmethod
+    def _load_config(name, path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
@@ -0,0 +1,274 @@
+"""
+语义缓存 - 近似输入复用已生成的日记
+
+输入在本地向量化（哈希字符n-gram，无需分词和网络调用），在同一风格/心情分区的
+向量索引中查找余弦相似度最高的条目，超过阈值且通过逐字确认时直接返回其生成结果。
+"""
+
+import time
+import zlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from difflib import SequenceMatcher
+from typing import Dict, Optional, Tuple
+
+from utils.similarity import normalize
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，未安装时语义缓存不可用
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# 确认命中时允许增删改的字符：只有语气词不同的输入才视为同一输入。
+# "他来了"/"他没来"、"少糖"/"多糖" 的余弦相似度同样很高，但改变了日记描述的事实
+FILLER_CHARS = frozenset('啊呀啦呢吧嘛哦噢喔嗯哈哇唉咯耶哟呗诶')
+
+
+def confirm_match(text: str, candidate: str, max_edit: int) -> bool:
+    """逐字确认两个已归一化的输入只差语气词，且增删改的字符数不超过max_edit"""
+    if text == candidate:
+        return True
+    edited = 0
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, text, candidate, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            continue
+        changed = text[i1:i2] + candidate[j1:j2]
+        edited += max(i2 - i1, j2 - j1)
+        if edited > max_edit or not FILLER_CHARS.issuperset(changed):
+            return False
+    return True
+
+
+class HashedNgramVectorizer:
+    """哈希字符n-gram向量化
+    
+    中文按字符切分即可得到稳定的特征：1-gram捕捉用词，2/3-gram捕捉词语和语序。
+    每个n-gram哈希到固定维度，符号位减少哈希冲突带来的偏差，结果做L2归一化，
+    两个向量的点积即余弦相似度。
+    """
+    
+    # 各阶n-gram的权重，单字区分度较低
+    WEIGHTS = {1: 0.5, 2: 1.0, 3: 1.0}
+    
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+    
+    def transform(self, text: str):
+        """将已归一化的文本转换为L2归一化的float32向量，文本为空时返回零向量"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        indices = []
+        values = []
+        for size, weight in self.WEIGHTS.items():
+            for index in range(len(text) - size + 1):
+                digest = zlib.crc32(text[index:index + size].encode('utf-8'))
+                indices.append(digest % self.dim)
+                values.append(weight if digest & 0x80000000 else -weight)
+        if indices:
+            np.add.at(vector, indices, values)
+            norm = np.linalg.norm(vector)
+            if norm > 0:
+                vector /= norm
+        return vector
+
+
+class _Partition:
+    """单个风格/心情分区的向量索引，容量按需倍增到capacity"""
+    
+    INITIAL_CAPACITY = 16
+    
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(self.INITIAL_CAPACITY, capacity), dim), dtype=np.float32)
+        self.last_used = np.zeros(len(self.vectors), dtype=np.float64)
+        self.entries = []  # [(值, 过期时间, 归一化的输入)]，与vectors的行一一对应
+    
+    def search(self, vector) -> Tuple[int, float]:
+        """返回相似度最高的行及其相似度"""
+        scores = self.vectors[:len(self.entries)] @ vector
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+    
+    def add(self, vector, entry: tuple, now: float) -> bool:
+        """写入一个条目，分区已满时替换最久未使用的条目，返回是否发生淘汰"""
+        size = len(self.entries)
+        if size < self.capacity:
+            if size == len(self.vectors):
+                grow = min(size * 2, self.capacity) - size
+                self.vectors = np.vstack([self.vectors, np.zeros((grow, self.vectors.shape[1]), dtype=np.float32)])
+                self.last_used = np.concatenate([self.last_used, np.zeros(grow)])
+            self.entries.append(None)
+            index, evicted = size, False
+        else:
+            index, evicted = int(np.argmin(self.last_used)), True
+        self.vectors[index] = vector
+        self.last_used[index] = now
+        self.entries[index] = entry
+        return evicted
+    
+    def expire(self, index: int):
+        """使过期条目不再被匹配，并优先被替换"""
+        self.vectors[index] = 0
+        self.last_used[index] = 0
+    
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.last_used.nbytes
+
+
+class SemanticCache:
+    """按风格/心情分区的语义缓存
+    
+    分区键为 (风格, 心情, 其他影响生成结果的参数)，只在同一分区内匹配，避免返回
+    风格或心情不符的日记。每个分区最多partition_size个条目，最多max_partitions个分区，
+    均按最近使用淘汰，索引内存上限约为 max_partitions * partition_size * dim * 4 字节。
+    
+    相似度阈值可按风格或 "风格/心情" 单独设置，例如对细节敏感的写实风格使用更高的阈值。
+    向量相似度只用于快速找到候选，返回前还需逐字确认两个输入归一化后相同或只差
+    不超过max_edit个语气词（见confirm_match），否定词、数字等改动一律不命中。
+    """
+    
+    # 查询耗时分位数统计使用的最近样本数
+    LATENCY_SAMPLES = 1024
+    
+    def __init__(self, threshold: float = 0.92, thresholds: Optional[Dict[str, float]] = None,
+                 partition_size: int = 256, max_partitions: int = 64, dim: int = 512, ttl: float = 3600,
+                 max_edit: int = 4):
+        self.threshold = threshold
+        self.thresholds = thresholds or {}
+        self.partition_size = max(1, partition_size)
+        self.max_partitions = max(1, max_partitions)
+        self.ttl = ttl  # 0表示不过期
+        self.max_edit = max_edit
+        self.vectorizer = HashedNgramVectorizer(dim)
+        self._partitions = OrderedDict()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._lookup_seconds = 0.0
+        self._hits = 0
+        self._misses = 0
+        self._rejected = 0
+        self._evictions = 0
+    
+    @staticmethod
+    def supported() -> bool:
+        """语义缓存依赖NumPy，未安装时返回False"""
+        if np is None:
+            logger.warning("SEMANTIC_CACHE_ENABLED is set but numpy is not installed, semantic cache disabled")
+            return False
+        return True
+    
+    @staticmethod
+    def parse_thresholds(value: str) -> Dict[str, float]:
+        """解析阈值配置，格式: "real=0.95,warm/happy=0.9" """
+        thresholds = {}
+        for item in (value or '').split(','):
+            if '=' in item:
+                key, threshold = item.split('=', 1)
+                thresholds[key.strip()] = float(threshold)
+        return thresholds
+    
+    def threshold_for(self, style: str, mood: str) -> float:
+        """按 风格/心情 > 风格 > 默认值 的顺序取相似度阈值"""
+        return self.thresholds.get(f'{style}/{mood}', self.thresholds.get(style, self.threshold))
+    
+    def get(self, text: str, style: str, mood: str, scope: tuple = ()) -> Optional[Tuple[dict, float]]:
+        """查找近似输入的缓存结果，命中返回 (值, 相似度)，否则返回None"""
+        started = time.perf_counter()
+        text = normalize(text)
+        vector = self.vectorizer.transform(text)
+        now = time.time()
+        key = (style, mood) + tuple(scope)
+        match = None
+        
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is not None and partition.entries:
+                index, similarity = partition.search(vector)
+                value, expires_at, candidate = partition.entries[index]
+                if expires_at is not None and expires_at <= now:
+                    partition.expire(index)
+                elif similarity >= self.threshold_for(style, mood):
+                    if confirm_match(text, candidate, self.max_edit):
+                        partition.last_used[index] = now
+                        self._partitions.move_to_end(key)
+                        match = (value, similarity)
+                    else:
+                        self._rejected += 1
+            
+            if match is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+            elapsed = time.perf_counter() - started
+            self._latencies.append(elapsed)
+            self._lookup_seconds += elapsed
+        return match
+    
+    def set(self, text: str, style: str, mood: str, value: dict, scope: tuple = ()):
+        """写入生成结果，归一化后相同的输入覆盖原条目"""
+        text = normalize(text)
+        vector = self.vectorizer.transform(text)
+        if not vector.any():
+            return
+        now = time.time()
+        entry = (value, now + self.ttl if self.ttl > 0 else None, text)
+        key = (style, mood) + tuple(scope)
+        
+        with self._lock:
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = _Partition(self.vectorizer.dim, self.partition_size)
+                self._partitions[key] = partition
+                if len(self._partitions) > self.max_partitions:
+                    _, oldest = self._partitions.popitem(last=False)
+                    self._evictions += len(oldest.entries)
+            self._partitions.move_to_end(key)
+            
+            if partition.entries:
+                index, _ = partition.search(vector)
+                if partition.entries[index][2] == text:
+                    partition.vectors[index] = vector
+                    partition.last_used[index] = now
+                    partition.entries[index] = entry
+                    return
+            if partition.add(vector, entry, now):
+                self._evictions += 1
+    
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._partitions.clear()
+    
+    def stats(self) -> dict:
+        """获取缓存统计：条目数、索引内存、命中率和查询耗时分位数"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            latencies = sorted(self._latencies)
+            return {
+                'entries': sum(len(partition.entries) for partition in self._partitions.values()),
+                'partitions': len(self._partitions),
+                'index_bytes': sum(partition.nbytes for partition in self._partitions.values()),
+                'partition_size': self.partition_size,
+                'max_partitions': self.max_partitions,
+                'threshold': self.threshold,
+                'thresholds': self.thresholds,
+                'max_edit': self.max_edit,
+                'hits': self._hits,
+                'misses': self._misses,
+                'rejected': self._rejected,  # 相似度达到阈值但逐字确认未通过，计入misses
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'lookups': lookups,
+                'lookup_seconds': self._lookup_seconds,
+                'lookup_p50_ms': _percentile_ms(latencies, 0.5),
+                'lookup_p95_ms': _percentile_ms(latencies, 0.95)
+            }
+
+
+def _percentile_ms(samples, quantile: float) -> float:
+    if not samples:
+        return 0.0
+    return round(samples[min(len(samples) - 1, int(len(samples) * quantile))] * 1000, 3)
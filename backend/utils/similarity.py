@@ -0,0 +1,46 @@
+"""
+文本相似度 - 基于字符n-gram的近似重复检测
+"""
+
+import re
+from typing import Iterable, List, Optional
+
+# 比较前去除的空白、标点和Markdown符号，只保留文字内容
+_NOISE_PATTERN = re.compile(r'[\s#*>`_~\-—…，。！？、；：“”‘’（）《》【】,.!?;:\'"()\[\]{}]+')
+
+
+def normalize(text: str) -> str:
+    """去除空白和标点并转为小写，只保留参与比较的文字"""
+    return _NOISE_PATTERN.sub('', text or '').lower()
+
+
+def shingles(text: str, size: int = 2) -> frozenset:
+    """文本的字符n-gram集合，中文无需分词即可比较"""
+    text = normalize(text)
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[index:index + size] for index in range(len(text) - size + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """两个n-gram集合的Jaccard相似度"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def filter_near_duplicates(texts: Iterable[str], threshold: float = 0.8,
+                           reference: Optional[str] = None) -> List[str]:
+    """按顺序保留互不相似的文本
+    
+    与已保留的文本或reference（如之前生成的版本）的相似度达到threshold时丢弃。
+    """
+    kept = []
+    seen = [shingles(reference)] if reference else []
+    for text in texts:
+        grams = shingles(text)
+        if any(jaccard(grams, other) >= threshold for other in seen):
+            continue
+        kept.append(text)
+        seen.append(grams)
+    return kept
@@ -0,0 +1,81 @@
+"""
+进行中请求合并（single-flight）
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Call:
+    """一次进行中的调用"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """相同键的并发调用只执行一次，其余调用等待并共享结果
+    
+    do() 用于线程模式，ado() 用于异步模式。
+    """
+    
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._coalesced = 0
+    
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """执行fn，若相同键的调用正在进行则等待其结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+            else:
+                self._coalesced += 1
+        
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.event.set()
+        else:
+            call.event.wait()
+        
+        if call.error is not None:
+            raise call.error
+        return call.result
+    
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """异步执行fn，若相同键的调用正在进行则等待其结果
+        
+        调用在独立任务中执行，发起者被取消时不影响其他等待者。
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            self._coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self._executed += 1
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        
+        return await asyncio.shield(task)
+    
+    def stats(self) -> dict:
+        """获取合并统计"""
+        return {
+            'in_flight': len(self._calls) + len(self._tasks),
+            'executed': self._executed,
+            'coalesced': self._coalesced
+        }
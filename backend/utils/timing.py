@@ -0,0 +1,150 @@
+"""
+请求阶段计时 - 记录各处理阶段的耗时并生成Server-Timing响应头
+"""
+
+import time
+import inspect
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterable, Optional
+
+# Server-Timing的desc需为ASCII，统一使用英文描述
+PHASE_DESCRIPTIONS = {
+    'parse': 'JSON parsing',
+    'prompt': 'Prompt build',
+    'extract': 'Parallel pre-processing',
+    'ratelimit': 'Rate limit wait',
+    'queue': 'Provider queue wait',
+    'upstream': 'Upstream call',
+    'ttft': 'Time to first token',
+    'postprocess': 'Output post-processing',
+    'serialize': 'Serialization',
+    'total': 'Total'
+}
+
+_current_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """单个请求的阶段计时，同名阶段多次记录时累加（如故障转移的多次上游调用）"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+    
+    def record(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+    
+    def get(self, name: str) -> float:
+        return self.phases.get(name, 0.0)
+    
+    def as_dict(self) -> dict:
+        """各阶段耗时（毫秒），包含到目前为止的总耗时"""
+        timings = {name: round(seconds * 1000, 2) for name, seconds in self.phases.items()}
+        timings['total'] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+    
+    def header(self) -> str:
+        """生成Server-Timing响应头"""
+        return ', '.join(
+            f'{name};dur={duration};desc="{PHASE_DESCRIPTIONS.get(name, name)}"'
+            for name, duration in self.as_dict().items()
+        )
+
+
+def current_timer() -> Optional[RequestTimer]:
+    """获取当前请求的计时器，不在计时请求中时返回None"""
+    return _current_timer.get()
+
+
+def record(name: str, seconds: float):
+    """记录阶段耗时，不在计时请求中时忽略"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.record(name, seconds)
+
+
+@contextmanager
+def phase(name: str, exclude: Iterable[str] = ()):
+    """记录代码块的耗时
+    
+    exclude中的阶段若在代码块内被记录，其耗时从本阶段中扣除，
+    例如上游调用扣除线程池排队和代码块清理时间，使各阶段互不重叠。
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    
+    exclude = tuple(exclude)
+    excluded_before = sum(timer.get(excluded) for excluded in exclude)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        excluded = sum(timer.get(excluded) for excluded in exclude) - excluded_before
+        timer.record(name, max(0.0, time.perf_counter() - start - excluded))
+
+
+def bind(fn: Callable, *args) -> Callable:
+    """绑定当前请求的计时上下文，返回提交到线程池的可调用对象
+    
+    执行时记录从提交到开始执行的排队时间，fn内记录的阶段计入同一请求。
+    """
+    context = contextvars.copy_context()
+    submitted = time.perf_counter()
+    
+    def run():
+        record('queue', time.perf_counter() - submitted)
+        return fn(*args)
+    
+    return lambda: context.run(run)
+
+
+def server_timing(view):
+    """视图装饰器：为请求创建计时器，并在响应中添加Server-Timing头
+    
+    同时支持Flask同步视图和Quart异步视图，视图可返回响应对象、(响应, 状态码)，
+    或 (字典, 状态码, 响应头) 等由框架转换为响应的返回值。
+    """
+    if inspect.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            timer = RequestTimer()
+            token = _current_timer.set(timer)
+            try:
+                rv = await view(*args, **kwargs)
+            finally:
+                _current_timer.reset(token)
+            return _attach_header(rv, timer)
+        
+        return async_wrapper
+    
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        timer = RequestTimer()
+        token = _current_timer.set(timer)
+        try:
+            rv = view(*args, **kwargs)
+        finally:
+            _current_timer.reset(token)
+        return _attach_header(rv, timer)
+    
+    return wrapper
+
+
+def _attach_header(rv, timer: RequestTimer):
+    """响应对象直接设置响应头；视图返回字典等非响应对象时，响应头放入返回值元组交由框架合并"""
+    body, rest = (rv[0], rv[1:]) if isinstance(rv, tuple) else (rv, ())
+    if hasattr(body, 'headers'):
+        body.headers['Server-Timing'] = timer.header()
+        return rv
+    
+    header = [('Server-Timing', timer.header())]
+    if rest and isinstance(rest[-1], (dict, list)):
+        # (body, headers) 或 (body, status, headers)
+        headers = rest[-1]
+        headers = [*headers.items(), *header] if isinstance(headers, dict) else [*headers, *header]
+        return (body, *rest[:-1], headers)
+    return (body, *rest, header)
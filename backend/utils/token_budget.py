@@ -0,0 +1,147 @@
+"""
+Token预算 - 中英文混合文本的token估算与超长字段压缩
+"""
+
+import os
+import re
+import hashlib
+from typing import List, Optional, Tuple
+
+from utils.response_cache import ResponseCache
+
+# 中日韩文字及全角标点，主流分词器下大致每字1个token
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+# 非中文字符平均每4个字符约1个token
+CHARS_PER_TOKEN = 4
+
+# 各提供商的Prompt token预算，可通过 TOKEN_BUDGET_<PROVIDER> 环境变量覆盖
+DEFAULT_BUDGETS = {
+    'gemini': 4000,
+    'openai': 3000,
+    'claude': 4000
+}
+
+OMISSION_MARKER = '\n\n……（中间内容已省略）……\n\n'
+
+# 原始记录最多占可用预算的比例，剩余留给之前生成的版本
+ORIGINAL_SHARE = 0.4
+
+# 压缩结果按 (文本摘要, 预算) 缓存，超过该长度的文本不缓存
+COMPACT_CACHE_MAX_CHARS = 20000
+_compact_cache = ResponseCache(max_size=256, ttl=float('inf'))
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + -(-(len(text) - cjk) // CHARS_PER_TOKEN)
+
+
+def provider_budget(provider: str) -> int:
+    """获取提供商的Prompt token预算"""
+    provider = (provider or '').lower()
+    default = DEFAULT_BUDGETS.get(provider, min(DEFAULT_BUDGETS.values()))
+    return int(os.getenv(f'TOKEN_BUDGET_{provider.upper()}', default))
+
+
+def compact_text(text: str, max_tokens: int) -> str:
+    """将文本压缩到max_tokens以内
+    
+    多段文本先保留Markdown标题和每段首句作为提要，再按段落顺序在预算内恢复完整段落；
+    单段文本或提要本身超出预算时保留首尾、省略中间。
+    结果按 (文本摘要, 预算) 缓存，重复压缩同一内容时不再重新计算；缓存键不保留原文，
+    超过COMPACT_CACHE_MAX_CHARS的文本不缓存。
+    """
+    if len(text) > COMPACT_CACHE_MAX_CHARS:
+        return _compact(text, max_tokens)
+    
+    key = (hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest(), max_tokens)
+    compacted = _compact_cache.get(key)
+    if compacted is None:
+        compacted = _compact(text, max_tokens)
+        _compact_cache.set(key, compacted)
+    return compacted
+
+
+def _compact(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ''
+    
+    paragraphs = [paragraph.strip() for paragraph in re.split(r'\n\s*\n', text.strip()) if paragraph.strip()]
+    if len(paragraphs) > 1:
+        outline = _outline(paragraphs, max_tokens)
+        if outline is not None:
+            return outline
+    
+    return _truncate_middle(text, max_tokens)
+
+
+def fit_fields(original: str, previous: str, available: int) -> Tuple[str, str, bool]:
+    """在可用token内分配原始记录和之前版本，返回 (原始记录, 之前版本, 是否压缩)"""
+    original_tokens = estimate_tokens(original)
+    previous_tokens = estimate_tokens(previous)
+    if original_tokens + previous_tokens <= available:
+        return original, previous, False
+    
+    original_limit = max(min(original_tokens, int(available * ORIGINAL_SHARE)), available - previous_tokens)
+    compacted_original = compact_text(original, original_limit)
+    compacted_previous = compact_text(previous, available - estimate_tokens(compacted_original))
+    # 只有固定部分超出预算、两个字段本身为空时不算压缩
+    compacted = compacted_original != original or compacted_previous != previous
+    return compacted_original, compacted_previous, compacted
+
+
+def _outline(paragraphs: List[str], max_tokens: int) -> Optional[str]:
+    """提取Markdown标题和每段首句，剩余预算按段落顺序恢复完整段落；提要本身超出预算时返回None
+    
+    逐段估算的token数之和不小于整体估算，拼接结果不会超出预算。
+    """
+    lines = [_summary_line(paragraph) for paragraph in paragraphs]
+    separator = estimate_tokens('\n\n')
+    used = sum(estimate_tokens(line) for line in lines) + separator * (len(lines) - 1)
+    if used >= max_tokens:
+        return None
+    
+    for index, paragraph in enumerate(paragraphs):
+        extra = estimate_tokens(paragraph) - estimate_tokens(lines[index])
+        if extra > 0 and used + extra <= max_tokens:
+            lines[index] = paragraph
+            used += extra
+    return '\n\n'.join(line for line in lines if line)
+
+
+def _summary_line(paragraph: str) -> str:
+    """Markdown标题段取标题行，其他段落取首句"""
+    if paragraph.startswith('#'):
+        return paragraph.splitlines()[0]
+    return re.split(r'(?<=[。！？!?])', paragraph, maxsplit=1)[0].strip()
+
+
+def _truncate_middle(text: str, max_tokens: int) -> str:
+    """保留首尾、省略中间，使结果不超过max_tokens"""
+    budget = max_tokens - estimate_tokens(OMISSION_MARKER)
+    if budget <= 0:
+        return _truncate_head(text, max_tokens)
+    
+    head = _truncate_head(text, budget - budget // 3)
+    tail = _truncate_head(text[::-1], budget // 3)[::-1]
+    return head + OMISSION_MARKER + tail
+
+
+def _truncate_head(text: str, max_tokens: int) -> str:
+    """截取开头不超过max_tokens的部分（二分查找截断位置）"""
+    # 每个字符至少计1/CHARS_PER_TOKEN个token，超出此长度的部分不可能保留
+    text = text[:max(0, max_tokens) * CHARS_PER_TOKEN]
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]